@@ -1,16 +1,40 @@
-from FBXSequence import FBXSequence
+from FBXSequence import FBXSequence, FBXSequenceError, FBXManagerPool
 import timewarp as tw
 import similarityTools as st
+import curveTools as ct
+import jointDataCache as jdc
+import featureStack as fs
+import batchTools as bt
+import motionContainer as mc
+import instrumentation as ins
+import poseIndex as pi
+import motionAveraging as ma
+import segmentationTools as sg
+import distanceMetrics as dm
+import plottingTools as pt
 import csv
+import numpy as np
 import JointDataClasses as jc
 import sys
 
 st = st
 
-def importFBXSequence(filepath):
-    importedSeq = FBXSequence(filepath)
+def importFBXSequence(filepath, **kwargs):
+    importedSeq = FBXSequence(filepath, **kwargs)
     return importedSeq
 
+# opens a motion container written by FBXSequence.exportMotionContainer, which doesn't need the FBX SDK
+def importMotionContainer(filepath):
+    importedContainer = mc.MotionContainer(filepath)
+    return importedContainer
+
+# uniformly timewarps every FBXSequence in a list to a common duration in seconds, resampling at the given frame rate.
+# the current duration of each sequence is taken from the last key of the root joint's x rotation.
+def UTWSequences(sequenceList, newDuration, fps):
+    for seq in sequenceList:
+        currentDuration = seq.getTimeOfLastKey(joint.root, animationCurveType.ROTATION, axis.x)
+        seq.UTW(currentDuration, newDuration, fps)
+
 class Timewarp():
 
     def __init__(self, inputMotion, targetMotion):
@@ -23,8 +47,187 @@ class Timewarp():
         self.accumulatedCostMatrix = tw.accumulatedCostMatrix(self.costMatrix)
         self.DTWremap = tw.plotDTW(self.accumulatedCostMatrix)
 
-    def graphTimewarp(self):
-        tw.graphDTW(self.accumulatedCostMatrix, DTWmap=self.DTWremap)
+    # plots the alignment over the accumulated cost matrix, keyword arguments are passed to timewarp.graphDTW(), e.g. outputFile
+    def graphTimewarp(self, **kwargs):
+        tw.graphDTW(self.accumulatedCostMatrix, DTWmap=self.DTWremap, **kwargs)
+
+# A Timewarp that can be updated as frames are appended to either motion, e.g. with JointData.appendFrames() while a
+# take is being captured.  update() only calculates the cost and accumulated cost of the new rows and columns, and
+# only follows the alignment path back until it meets the previous path, as the rest of the path can't change, so
+# each update takes time in proportion to the new frames and the part of the path that changed.  The results are the
+# same as a Timewarp of the whole motions.  The input motion must support measuring the difference between frames.
+# costMatrix, accumulatedCostMatrix, path and DTWremap are views of arrays that later updates change in place.
+class IncrementalTimewarp():
+
+    def __init__(self, inputMotion, targetMotion):
+
+        if inputMotion.checkMatchingJointCount(targetMotion) == False:
+            raise ValueError("The two sets of joint data do not have matching numbers of joints")
+        if inputMotion.checkMatchingClass(targetMotion) == False:
+            raise ValueError("The motion sequences do not have matching joint data types")
+        if inputMotion.checkHasDifferenceFunction() == False:
+            raise ValueError("Joint data of type " + inputMotion.dataType + " doesn't support incremental time warping")
+
+        self.inputMotion = inputMotion
+        self.targetMotion = targetMotion
+
+        # matrices with spare capacity, costMatrix and accumulatedCostMatrix are views of their used rows and columns
+        self.__costBuffer = np.empty((0, 0))
+        self.__accumulatedCostBuffer = np.empty((0, 0))
+        self.__inputFrameCount = 0
+        self.__targetFrameCount = 0
+        self.costMatrix = self.__costBuffer
+        self.accumulatedCostMatrix = self.__accumulatedCostBuffer
+
+        # the path and DTW map, also with spare capacity, and for each input frame the index of its first cell on the
+        # path and the range of target frames the path reaches it on
+        self.__pathBuffer = np.empty((0, 2), dtype=int)
+        self.__mapBuffer = np.empty(0, dtype=int)
+        self.__rowFirstIndexes = []
+        self.__rowFirstTargets = []
+        self.__rowLastTargets = []
+        self.path = self.__pathBuffer
+        self.DTWremap = self.__mapBuffer
+
+        self.update()
+
+    # updates the time warp with any frames appended to the motions since it was last updated, returning the DTW map
+    @ins.timed("IncrementalTimewarp.update")
+    def update(self):
+
+        inputFrameCount = self.inputMotion.getFrameCount()
+        targetFrameCount = self.targetMotion.getFrameCount()
+        oldInputFrames = self.__inputFrameCount
+        oldTargetFrames = self.__targetFrameCount
+
+        if inputFrameCount == oldInputFrames and targetFrameCount == oldTargetFrames:
+            return self.DTWremap
+        if inputFrameCount < oldInputFrames or targetFrameCount < oldTargetFrames:
+            raise ValueError("Frames can only be appended to the motions of an incremental time warp")
+
+        self.__growBuffers(inputFrameCount, targetFrameCount)
+        costs = self.__costBuffer
+        totalCosts = self.__accumulatedCostBuffer
+
+        # new target frames for the existing input frames, accumulated a column at a time
+        if targetFrameCount > oldTargetFrames and oldInputFrames > 0:
+            newColumns = slice(oldTargetFrames, targetFrameCount)
+            costs[:oldInputFrames, newColumns] = self.inputMotion.getDifferenceMatrix(
+                self.inputMotion.joints, self.targetMotion, slice(0, oldInputFrames), newColumns)
+            for targetFrame in range(oldTargetFrames, targetFrameCount):
+                previousColumn = totalCosts[:oldInputFrames, targetFrame - 1] if targetFrame > 0 else None
+                totalCosts[:oldInputFrames, targetFrame] = tw.accumulateCostRow(costs[:oldInputFrames, targetFrame], previousColumn)
+
+        # new input frames for every target frame, accumulated a row at a time
+        if inputFrameCount > oldInputFrames:
+            newRows = slice(oldInputFrames, inputFrameCount)
+            costs[newRows, :targetFrameCount] = self.inputMotion.getDifferenceMatrix(self.inputMotion.joints, self.targetMotion, newRows)
+            for inputFrame in range(oldInputFrames, inputFrameCount):
+                previousRow = totalCosts[inputFrame - 1, :targetFrameCount] if inputFrame > 0 else None
+                totalCosts[inputFrame, :targetFrameCount] = tw.accumulateCostRow(costs[inputFrame, :targetFrameCount], previousRow)
+
+        self.__inputFrameCount = inputFrameCount
+        self.__targetFrameCount = targetFrameCount
+        self.costMatrix = costs[:inputFrameCount, :targetFrameCount]
+        self.accumulatedCostMatrix = totalCosts[:inputFrameCount, :targetFrameCount]
+
+        self.__extendPath()
+        return self.DTWremap
+
+    # grows the matrices geometrically so appending a few frames at a time only copies them occasionally
+    def __growBuffers(self, inputFrameCount, targetFrameCount):
+
+        rows, columns = self.__costBuffer.shape
+        if inputFrameCount <= rows and targetFrameCount <= columns:
+            return
+
+        newShape = (max(inputFrameCount, 2 * rows if inputFrameCount > rows else rows),
+                    max(targetFrameCount, 2 * columns if targetFrameCount > columns else columns))
+        usedRows = slice(0, self.__inputFrameCount)
+        usedColumns = slice(0, self.__targetFrameCount)
+
+        costBuffer = np.empty(newShape)
+        costBuffer[usedRows, usedColumns] = self.__costBuffer[usedRows, usedColumns]
+        accumulatedCostBuffer = np.empty(newShape)
+        accumulatedCostBuffer[usedRows, usedColumns] = self.__accumulatedCostBuffer[usedRows, usedColumns]
+
+        self.__costBuffer = costBuffer
+        self.__accumulatedCostBuffer = accumulatedCostBuffer
+
+    # returns a buffer of at least the given length, keeping its first keepCount entries, grown geometrically
+    def __growBuffer(self, buffer, length, keepCount):
+
+        if length <= len(buffer):
+            return buffer
+
+        grownBuffer = np.empty((max(length, 2 * len(buffer)),) + buffer.shape[1:], dtype=buffer.dtype)
+        grownBuffer[:keepCount] = buffer[:keepCount]
+        return grownBuffer
+
+    # follows the alignment path back from the new last cell until it meets the previous path, as the accumulated
+    # costs the path depends on from there haven't changed, then replaces the rest of the path and the DTW map
+    def __extendPath(self):
+
+        inputFrame = self.__inputFrameCount - 1
+        targetFrame = self.__targetFrameCount - 1
+        newCells = []
+        mergeIndex = -1
+
+        while True:
+            if inputFrame < len(self.__rowFirstTargets):
+                firstTarget = self.__rowFirstTargets[inputFrame]
+                if firstTarget <= targetFrame <= self.__rowLastTargets[inputFrame]:
+                    mergeIndex = self.__rowFirstIndexes[inputFrame] + targetFrame - firstTarget
+                    break
+
+            newCells.append((inputFrame, targetFrame))
+            if inputFrame == 0 and targetFrame == 0:
+                break
+
+            inputFrame, targetFrame = tw.getPreviousDTWCell(self.accumulatedCostMatrix, inputFrame, targetFrame)
+
+        newCells = np.array(newCells[::-1], dtype=int).reshape(-1, 2)
+
+        # the rows after the merge cell are replaced by the new cells
+        if mergeIndex >= 0:
+            del self.__rowFirstIndexes[inputFrame + 1:]
+            del self.__rowFirstTargets[inputFrame + 1:]
+            del self.__rowLastTargets[inputFrame + 1:]
+            self.__rowLastTargets[inputFrame] = targetFrame
+            firstNewTarget = targetFrame + 1
+        else:
+            firstNewTarget = 0
+
+        for pathIndex, (row, target) in enumerate(newCells.tolist(), mergeIndex + 1):
+            if row < len(self.__rowLastTargets):
+                self.__rowLastTargets[row] = target
+            else:
+                self.__rowFirstIndexes.append(pathIndex)
+                self.__rowFirstTargets.append(target)
+                self.__rowLastTargets.append(target)
+
+        pathLength = mergeIndex + 1 + len(newCells)
+        self.__pathBuffer = self.__growBuffer(self.__pathBuffer, pathLength, mergeIndex + 1)
+        self.__pathBuffer[mergeIndex + 1:pathLength] = newCells
+        self.path = self.__pathBuffer[:pathLength]
+
+        # as in timewarp.getDTWMapFromPath(), each target frame maps to the first input frame the path reaches it on,
+        # except the first target frame, which maps to the last
+        self.__mapBuffer = self.__growBuffer(self.__mapBuffer, self.__targetFrameCount, firstNewTarget)
+        rows = newCells[:, 0]
+        targets = newCells[:, 1]
+        firstCells = np.ones(len(newCells), dtype=bool)
+        firstCells[1:] = targets[1:] != targets[:-1]
+        firstCells &= targets >= firstNewTarget
+        self.__mapBuffer[targets[firstCells]] = rows[firstCells]
+        if firstNewTarget <= 1:
+            firstTargetRows = rows[targets == 0]
+            self.__mapBuffer[0] = firstTargetRows[-1] if len(firstTargetRows) > 0 else inputFrame
+        self.DTWremap = self.__mapBuffer[:self.__targetFrameCount]
+
+    # plots the alignment over the accumulated cost matrix, keyword arguments are passed to timewarp.graphDTW(), e.g. outputFile
+    def graphTimewarp(self, **kwargs):
+        tw.graphDTW(self.accumulatedCostMatrix, DTWmap=self.DTWremap, **kwargs)
 
 
 class animationCurveType():
@@ -0,0 +1,323 @@
+# Command line entry point for running FBXMotionToolkit operations over many FBX files.
+#
+#   python FBXMotionToolkitCLI.py process <files, folders or globs> --map jointMap.csv --output outputFolder [options]
+#   python FBXMotionToolkitCLI.py similarity <input> <target> --map jointMap.csv --output matrix.csv [options]
+#
+# Progress and timing are written to stdout as one JSON object per line.  Outputs that are newer than their input
+# files are skipped unless --force is given, so repeated runs over a folder only process files that have changed.
+# Run either command with --help for its options.
+import os
+import csv
+import sys
+import glob
+import json
+import time
+import argparse
+import numpy as np
+import FBXMotionToolkit as fmt
+
+# joint data representations that can be extracted, and the FBXSequence function used to extract each
+representations = {"eulers": "getJointRotationAsEulers",
+                   "quaternions": "getJointRotationAsQuaternions",
+                   "matrices": "getJointRotationAsMatrices",
+                   "vectors": "getJointRotationAsDisplacementVectors",
+                   "local": "getJointAsLocalTranslations",
+                   "global": "getJointAsGlobalTranslations",
+                   "relative": "getJointAsRelativeTranslations",
+                   }
+
+# representations with a frame difference function, which can be used to build similarity matrices
+similarityRepresentations = ["eulers", "quaternions", "matrices", "vectors", "local", "global", "relative"]
+
+def main(argv=None):
+    parser = createParser()
+    args = parser.parse_args(argv)
+
+    # process takes a list of representations, similarity a single one
+    if args.command == "process":
+        extractsRelative = args.extract is not None and "relative" in args.extract
+    else:
+        extractsRelative = args.extract == "relative"
+    if extractsRelative and args.base_joint is None:
+        parser.error("extracting relative translations needs --base-joint")
+
+    return args.run(args)
+
+def createParser():
+
+    parser = argparse.ArgumentParser(prog="FBXMotionToolkitCLI", description="Runs FBXMotionToolkit operations over FBX files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    process = commands.add_parser("process", help="apply the same operations to every file, in the order listed below")
+    process.add_argument("inputs", nargs="+", help="FBX files, folders of FBX files or glob patterns")
+    process.add_argument("--map", required=True, help="joint map .csv file")
+    process.add_argument("--output", required=True, help="folder that outputs are written to")
+    process.add_argument("--unroll", action="store_true", help="unroll every joint")
+    process.add_argument("--resample", type=int, metavar="FPS", help="resample every curve at this frame rate")
+    process.add_argument("--utw", type=float, nargs=2, metavar=("SECONDS", "FPS"), help="uniformly timewarp to a duration, sampled at a frame rate")
+    process.add_argument("--extract", action="append", choices=sorted(representations), help="joint data to extract, may be repeated")
+    process.add_argument("--joints", nargs="+", help="joints to extract, defaults to every joint in the joint map")
+    process.add_argument("--base-joint", help="base joint for relative translations")
+    process.add_argument("--format", choices=["npz", "csv"], default="npz", help="format of extracted joint data, default npz")
+    process.add_argument("--export-fbx", action="store_true", help="export each processed file as <output>/<name>.fbx")
+    process.add_argument("--ascii", action="store_true", help="export ASCII rather than binary FBX files")
+    process.add_argument("--embed-media", action="store_true", help="embed media such as textures in exported FBX files")
+    process.add_argument("--export-container", action="store_true", help="export each processed file as a motion container, <output>/<name>.npz")
+    process.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes, default is the number of CPUs")
+    process.add_argument("--animation-only", action="store_true", help="skip content not needed for animation when importing")
+    process.add_argument("--force", action="store_true", help="process files even if their outputs are up to date")
+    process.set_defaults(run=runProcess)
+
+    similarity = commands.add_parser("similarity", help="write the frame by frame similarity matrix of two motions")
+    similarity.add_argument("input", help="FBX file or motion container of the input motion")
+    similarity.add_argument("target", help="FBX file or motion container of the target motion")
+    similarity.add_argument("--map", help="joint map .csv file, needed for FBX files")
+    similarity.add_argument("--output", required=True, help="similarity matrix file, .csv or .npy")
+    similarity.add_argument("--extract", choices=similarityRepresentations, default="quaternions", help="joint data compared, default quaternions")
+    similarity.add_argument("--joints", nargs="+", help="joints compared, defaults to every joint in the joint map")
+    similarity.add_argument("--base-joint", help="base joint for relative translations")
+    similarity.add_argument("--resample", type=int, metavar="FPS", help="resample FBX files at this frame rate before comparing")
+    similarity.add_argument("--force", action="store_true", help="write the matrix even if it is up to date")
+    similarity.add_argument("--timings", action="store_true", help="write the time spent in each operation when finished")
+    similarity.set_defaults(run=runSimilarity)
+
+    return parser
+
+def runProcess(args):
+
+    startTime = time.perf_counter()
+    joints = args.joints if args.joints is not None else readMapJoints(args.map)
+    steps = getProcessSteps(args, joints)
+    files = findFiles(args.inputs)
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+
+    # outputs are named after the file name alone, so files with the same name in different folders would overwrite
+    # each other's outputs, and could be skipped as up to date using another file's outputs
+    filesByOutput = {}
+    for file in files:
+        for output in getProcessOutputs(file, args):
+            filesByOutput.setdefault(os.path.normcase(os.path.abspath(output)), []).append(file)
+
+    # files whose outputs are newer than the file and joint map don't need processing again
+    filesToProcess = []
+    for file in files:
+        outputs = getProcessOutputs(file, args)
+        collidingFiles = [otherFile for output in outputs for otherFile in filesByOutput[os.path.normcase(os.path.abspath(output))]
+                          if otherFile != file]
+        if os.path.abspath(file) in [os.path.abspath(output) for output in outputs]:
+            counts["failed"] += 1
+            writeEvent({"event": "file", "file": file, "status": "failed", "error": "output would overwrite the input file"})
+        elif len(collidingFiles) > 0:
+            counts["failed"] += 1
+            writeEvent({"event": "file", "file": file, "status": "failed", "error": "outputs would collide with " + collidingFiles[0]})
+        elif args.force == False and isUpToDate(outputs, [file, args.map]):
+            counts["skipped"] += 1
+            writeEvent({"event": "file", "file": file, "status": "skipped", "outputs": outputs})
+        else:
+            filesToProcess.append(file)
+
+    completed = 0
+    for result in fmt.bt.processFiles(filesToProcess, steps, workers=args.workers, outputFolder=args.output,
+                                      outputFormat=args.format, animationOnly=args.animation_only):
+        completed += 1
+        event = {"event": "file",
+                 "file": result.file,
+                 "status": "succeeded" if result.succeeded() else "failed",
+                 "duration": round(result.duration, 4),
+                 "outputs": result.outputs,
+                 "completed": completed,
+                 "total": len(filesToProcess),
+                 }
+        if result.succeeded():
+            counts["succeeded"] += 1
+        else:
+            counts["failed"] += 1
+            event["error"] = result.error
+        writeEvent(event)
+
+    summary = {"event": "summary", "files": len(files), "duration": round(time.perf_counter() - startTime, 4)}
+    summary.update(counts)
+    writeEvent(summary)
+
+    return 0 if counts["failed"] == 0 else 1
+
+def runSimilarity(args):
+
+    startTime = time.perf_counter()
+    inputFiles = [args.input, args.target]
+    if args.map is not None:
+        inputFiles.append(args.map)
+
+    if args.force == False and isUpToDate([args.output], inputFiles):
+        writeEvent({"event": "similarity", "status": "skipped", "output": args.output})
+        return 0
+
+    # progress of the similarity matrix is written as events, as stdout is kept for events only
+    fmt.ins.setProgressCallback(writeProgressEvent)
+    if args.timings:
+        fmt.ins.enableTimings()
+
+    jointData = []
+    for file in [args.input, args.target]:
+        motion = openMotion(file, args)
+        try:
+            joints = args.joints if args.joints is not None else list(motion.jointNameMap.keys())
+            jointData.append(extractJointData(motion, args.extract, joints, args.base_joint))
+        finally:
+            motion.destroy()
+
+    # the similarity module's own checks exit without an event, so mismatched motions are reported here
+    error = getSimilarityInputError(jointData[0], jointData[1])
+    if error is not None:
+        writeEvent({"event": "similarity", "status": "failed", "output": args.output, "error": error})
+        return 1
+
+    costMatrix = fmt.st.getSimilarityMatrix(jointData[0], jointData[1])
+
+    outputFolder = os.path.dirname(args.output)
+    if outputFolder != "":
+        os.makedirs(outputFolder, exist_ok=True)
+    if args.output.endswith(".npy"):
+        np.save(args.output, costMatrix)
+    else:
+        np.savetxt(args.output, costMatrix, delimiter=",")
+
+    writeEvent({"event": "similarity",
+                "status": "succeeded",
+                "output": args.output,
+                "shape": list(costMatrix.shape),
+                "duration": round(time.perf_counter() - startTime, 4),
+                })
+    if args.timings:
+        writeEvent({"event": "timings", "timings": fmt.ins.getTimings()})
+    return 0
+
+# returns why two motions can't be compared by the similarity command, or None if they can
+def getSimilarityInputError(inputJointData, targetJointData):
+
+    if inputJointData.checkMatchingClass(targetJointData) == False:
+        return "the motions do not have matching joint data types"
+    if inputJointData.checkMatchingJointCount(targetJointData) == False:
+        return "the motions do not have matching numbers of joints"
+    if list(inputJointData.joints) != list(targetJointData.joints):
+        return "the motions do not have matching joints"
+    if inputJointData.checkHasDifferenceFunction() == False:
+        return "joint data of type " + inputJointData.dataType + " doesn't support measuring differences between frames"
+    return None
+
+# returns the batch steps applied to every file by the process command
+def getProcessSteps(args, joints):
+
+    steps = [("mapJoints", args.map)]
+
+    if args.unroll:
+        steps.append(("unrollAllJoints",))
+    if args.resample is not None:
+        steps.append(("resample", args.resample))
+    if args.utw is not None:
+        steps.append(("UTW", None, args.utw[0], int(args.utw[1])))
+
+    for representation in args.extract or []:
+        steps.append(getExtractionStep(representation, joints, args.base_joint))
+
+    if args.export_fbx:
+        steps.append(("export", os.path.join(args.output, "{name}.fbx"), args.ascii, args.embed_media))
+    if args.export_container:
+        steps.append(("exportMotionContainer", os.path.join(args.output, "{name}.npz")))
+
+    return steps
+
+def getExtractionStep(representation, joints, baseJoint):
+    if representation == "relative":
+        return (representations[representation], joints, baseJoint)
+    return (representations[representation], joints)
+
+# returns the files the process command writes for a single input file, matching the names used by batchTools
+def getProcessOutputs(file, args):
+
+    name = os.path.splitext(os.path.basename(file))[0]
+    outputs = []
+
+    for representation in args.extract or []:
+        outputs.append(os.path.join(args.output, name + "_" + representations[representation] + "." + args.format))
+    if args.export_fbx:
+        outputs.append(os.path.join(args.output, name + ".fbx"))
+    if args.export_container:
+        outputs.append(os.path.join(args.output, name + ".npz"))
+
+    return outputs
+
+def extractJointData(motion, representation, joints, baseJoint):
+    step = getExtractionStep(representation, joints, baseJoint)
+    return getattr(motion, step[0])(*step[1:])
+
+# opens an FBX file or motion container (.npz) for the similarity command
+def openMotion(file, args):
+
+    if file.endswith(".npz"):
+        motion = fmt.importMotionContainer(file)
+        if args.map is not None:
+            motion.mapJoints(args.map)
+        return motion
+
+    if args.map is None:
+        raise fmt.FBXSequenceError("A joint map is needed to compare FBX files: " + str(file))
+
+    motion = fmt.importFBXSequence(file, animationOnly=True)
+    try:
+        motion.mapJoints(args.map)
+        if args.resample is not None:
+            motion.resample(args.resample)
+    except Exception:
+        motion.destroy()
+        raise
+
+    return motion
+
+# expands a list of files, folders and glob patterns into a list of FBX files, in the order given
+def findFiles(inputs):
+
+    files = []
+    foundPaths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = sorted([os.path.join(item, name) for name in os.listdir(item) if name.lower().endswith(".fbx")])
+        elif any([character in item for character in "*?["]):
+            matches = sorted(glob.glob(item, recursive=True))
+        else:
+            matches = [item]
+
+        for match in matches:
+            if os.path.abspath(match) not in foundPaths:
+                foundPaths.add(os.path.abspath(match))
+                files.append(match)
+
+    return files
+
+# returns the standardised joint names listed in a joint map file
+def readMapJoints(mapFile):
+    with open(mapFile) as mapfile:
+        return [row[0] for row in csv.reader(mapfile, csv.excel) if len(row) > 0]
+
+# outputs are up to date if they all exist and are newer than every input
+def isUpToDate(outputs, inputs):
+
+    if len(outputs) == 0:
+        return False
+
+    try:
+        oldestOutput = min([os.path.getmtime(output) for output in outputs])
+        newestInput = max([os.path.getmtime(file) for file in inputs])
+    except OSError:
+        return False
+
+    return oldestOutput >= newestInput
+
+def writeEvent(event):
+    print(json.dumps(event), flush=True)
+
+def writeProgressEvent(operation, completed, total):
+    writeEvent({"event": "progress", "operation": operation, "completed": completed, "total": total})
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,55 +1,234 @@
-import fbx
-import sys
 import csv
 import os
+import time
+import threading
 import JointDataClasses as jc
+import curveTools as ct
+import motionContainer as mc
+import instrumentation as ins
 from scipy.spatial.transform import Rotation as R
 import numpy as np
 import FBXMotionToolkit as fmt
 
+# the FBX SDK is only needed to import FBX files, so the rest of the toolkit, including motion containers,
+# can be used without it
+try:
+    import fbx
+except ImportError:
+    fbx = None
+
+# raised when an FBX file can't be imported or joints are used before they have been mapped or animated
+class FBXSequenceError(Exception):
+    pass
+
+# Pool of FBX managers shared between FBXSequence objects.  Each manager is created once, along with its IO settings,
+# and is returned to the pool for reuse when the sequence using it is destroyed.  If maxResidentScenes is given,
+# acquire() waits until a sequence using the pool is destroyed whenever that many scenes are already in memory.
+class FBXManagerPool():
+
+    def __init__(self, **kwargs):
+
+        self.maxResidentScenes = kwargs.get("maxResidentScenes")
+        self.managersCreated = 0
+
+        self.__idleManagers = []
+        self.__lock = threading.Lock()
+        self.__sceneSlots = None
+        if self.maxResidentScenes is not None:
+            self.__sceneSlots = threading.BoundedSemaphore(self.maxResidentScenes)
+
+    # returns an idle manager, creating a new one if none are available
+    def acquire(self):
+
+        if fbx is None:
+            raise FBXSequenceError("The FBX Python SDK is needed to create FBX managers, but it couldn't be imported")
+
+        if self.__sceneSlots is not None:
+            self.__sceneSlots.acquire()
+
+        with self.__lock:
+            if len(self.__idleManagers) > 0:
+                return self.__idleManagers.pop()
+            self.managersCreated += 1
+
+        try:
+            manager = fbx.FbxManager.Create()
+            ioSettings = fbx.FbxIOSettings.Create(manager, fbx.IOSROOT)
+            manager.SetIOSettings(ioSettings)
+        except BaseException:
+            with self.__lock:
+                self.managersCreated -= 1
+            if self.__sceneSlots is not None:
+                self.__sceneSlots.release()
+            raise
+
+        return manager
+
+    # returns a manager to the pool once the scene using it has been destroyed
+    def release(self, manager):
+
+        with self.__lock:
+            self.__idleManagers.append(manager)
+
+        if self.__sceneSlots is not None:
+            self.__sceneSlots.release()
+
+    # destroys every idle manager in the pool
+    def destroy(self):
+        with self.__lock:
+            for manager in self.__idleManagers:
+                manager.Destroy()
+            self.__idleManagers.clear()
+
 class FBXSequence():
 
-    # constuctor
-    def __init__(self, motionFile):
+    # importer settings switched off in animation only mode, skipping content that isn't needed to read the skeleton and its
+    # animation curves.  Settings are looked up by name, as not every version of the SDK defines all of them.
+    __nonAnimationImportSettings = ["IMP_FBX_MATERIAL", "IMP_FBX_TEXTURE", "IMP_FBX_SHAPE", "IMP_FBX_LINK", "IMP_FBX_GOBO",
+                                    "IMP_FBX_CONSTRAINT", "IMP_FBX_CHARACTER", "IMP_FBX_AUDIO", "IMP_FBX_EXTRACT_EMBEDDED_DATA"]
+
+    # counts of scenes created, destroyed and currently held in memory by all FBXSequence objects
+    __sceneCounters = {"created": 0, "destroyed": 0, "resident": 0, "peakResident": 0, "residentFileBytes": 0}
+    __sceneCountersLock = threading.Lock()
+
+    # constuctor, optionally using an existing FBX manager passed as the fbxManager keyword argument, or borrowing one
+    # from an FBXManagerPool passed as the managerPool keyword argument.  A borrowed manager is left alive when the
+    # sequence is destroyed, so it can be reused for other files.
+    # passing animationOnly=True skips materials, textures, shapes, skin links and other content not needed for animation.
+    def __init__(self, motionFile, **kwargs):
+
+        if fbx is None:
+            raise FBXSequenceError("The FBX Python SDK is needed to import FBX files, but it couldn't be imported")
 
         # initialise public properties
         self.file = motionFile
         self.jointNameMap = {}
-        
+        self.importTime = 0.
+
         # initialise private properties
         self.__jointMap = {}
         self.__animStackIndex = 0
         self.__animLayerIndex = 0
+        self.__curveTables = {}
+        self.__isDestroyed = False
+        self.__createdTime = time.perf_counter()
 
         # create empty FBX scene
-        self.fbxManager = fbx.FbxManager.Create()
-
-        # import motion file
-        self.__fbxImporter = fbx.FbxImporter.Create(self.fbxManager, 'theImporter')
-        self.__importStatus = self.__fbxImporter.Initialize(self.file)
-
-        # check the import status before moving on - exit if needed
-        if self.__importStatus == False:
-            print("FBX import failed check file name")
-            sys.exit()
-
-        # if status is good create a new scene form the imported scene
-        self.scene = fbx.FbxScene.Create(self.fbxManager, 'theScene')
-        self.__fbxImporter.Import(self.scene)
-        self.__fbxImporter.Destroy() # destroy importer once imported.
-        self.__rootNode = self.scene.GetRootNode()
-        self.__eval = self.scene.GetAnimationEvaluator()
-
-        # get the first animation stack and animation layer
-        self.__animStack = self.scene.GetSrcObject(fbx.FbxCriteria().ObjectType(fbx.FbxAnimStack.ClassId),
-                                             self.__animStackIndex)
-        self.__animLayer = self.__animStack.GetMember(fbx.FbxCriteria().ObjectType(fbx.FbxAnimLayer.ClassId),
-                                          self.__animLayerIndex)
+        self.__managerPool = kwargs.get("managerPool")
+        self.fbxManager = kwargs.get("fbxManager")
+        if self.__managerPool is not None:
+            self.fbxManager = self.__managerPool.acquire()
+        self.__ownsManager = self.fbxManager is None
+        if self.__ownsManager:
+            self.fbxManager = fbx.FbxManager.Create()
+
+        # if the import fails, destroy what was created and release the manager, so its pool slot isn't lost
+        self.__fbxImporter = None
+        self.scene = None
+        try:
+            # import motion file, using the manager's IO settings if it has them
+            self.animationOnly = kwargs.get("animationOnly", False)
+            self.__fbxImporter = fbx.FbxImporter.Create(self.fbxManager, 'theImporter')
+            ioSettings = self.fbxManager.GetIOSettings()
+            if ioSettings == None and self.animationOnly:
+                ioSettings = fbx.FbxIOSettings.Create(self.fbxManager, fbx.IOSROOT)
+                self.fbxManager.SetIOSettings(ioSettings)
+            if ioSettings != None:
+                self.__configureImportSettings(ioSettings)
+                self.__importStatus = self.__fbxImporter.Initialize(self.file, -1, ioSettings)
+            else:
+                self.__importStatus = self.__fbxImporter.Initialize(self.file)
+
+            # check the import status before moving on - raise an error if needed
+            if self.__importStatus == False:
+                raise FBXSequenceError("FBX import failed check file name: " + str(self.file))
+
+            # if status is good create a new scene form the imported scene
+            self.scene = fbx.FbxScene.Create(self.fbxManager, 'theScene')
+            self.__fbxImporter.Import(self.scene)
+            self.__fbxImporter.Destroy() # destroy importer once imported.
+            self.__fbxImporter = None
+            self.__rootNode = self.scene.GetRootNode()
+            self.__eval = self.scene.GetAnimationEvaluator()
+
+            # get the first animation stack and animation layer
+            self.__animStack = self.__getAnimationStack(self.__animStackIndex)
+            self.__animLayer = self.__animStack.GetMember(fbx.FbxCriteria().ObjectType(fbx.FbxAnimLayer.ClassId),
+                                              self.__animLayerIndex)
+            self.__fileBytes = os.path.getsize(self.file)
+
+        except BaseException:
+            if self.__fbxImporter is not None:
+                self.__fbxImporter.Destroy()
+            if self.scene is not None and self.__ownsManager == False:
+                self.scene.Destroy()
+            self.__releaseManager()
+            raise
+
+        self.importTime = time.perf_counter() - self.__createdTime
+        if ins.isTimingEnabled():
+            ins.recordTiming("FBXSequence.import", self.importTime)
+        self.__updateSceneCounters(1, self.__fileBytes)
+
+    # sets the importer settings for the import mode.  settings are always set, as managers and their settings may be shared.
+    def __configureImportSettings(self, ioSettings):
+        for settingName in FBXSequence.__nonAnimationImportSettings:
+            if hasattr(fbx, settingName):
+                ioSettings.SetBoolProp(getattr(fbx, settingName), self.animationOnly == False)
+        if hasattr(fbx, "IMP_FBX_ANIMATION"):
+            ioSettings.SetBoolProp(fbx.IMP_FBX_ANIMATION, True)
+
+    # allows a sequence to be used in a with statement, destroying the scene when the statement ends
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, exceptionValue, traceback):
+        self.destroy()
+        return False
 
     def destroy(self):
-        self.fbxManager.Destroy()
-        # function maps nodes to standard names using a joint map
 
+        # destroying twice, e.g. inside and at the end of a with statement, is harmless
+        if self.__isDestroyed:
+            return
+        self.__isDestroyed = True
+
+        if self.__ownsManager == False:
+            self.scene.Destroy()
+        self.__releaseManager()
+        self.__updateSceneCounters(-1, -self.__fileBytes)
+
+    # returns the number of seconds since the sequence was created
+    def getLifetime(self):
+        return time.perf_counter() - self.__createdTime
+
+    # returns a copy of the scene counters shared by all FBXSequence objects: the number of scenes created, destroyed,
+    # and currently resident, the peak number resident at once, and the total file size of the resident scenes.
+    @staticmethod
+    def getSceneCounters():
+        with FBXSequence.__sceneCountersLock:
+            return dict(FBXSequence.__sceneCounters)
+
+    def __updateSceneCounters(self, residentChange, fileBytesChange):
+        with FBXSequence.__sceneCountersLock:
+            counters = FBXSequence.__sceneCounters
+            if residentChange > 0:
+                counters["created"] += residentChange
+            else:
+                counters["destroyed"] -= residentChange
+            counters["resident"] += residentChange
+            counters["peakResident"] = max(counters["peakResident"], counters["resident"])
+            counters["residentFileBytes"] += fileBytesChange
+
+    # destroys the manager if it belongs to this sequence, otherwise hands it back to its pool
+    def __releaseManager(self):
+        if self.__ownsManager:
+            self.fbxManager.Destroy()
+        elif self.__managerPool is not None:
+            self.__managerPool.release(self.fbxManager)
+
+    # function maps nodes to standard names using a joint map
+    @ins.timed("FBXSequence.mapJoints")
     def mapJoints(self, map):
 
         # clear then read in the joint name map
@@ -57,8 +236,7 @@ class FBXSequence():
 
         # check file exists
         if os.path.exists(map) == False:
-            print("Joint map file specified doesn't exist")
-            sys.exit()
+            raise FBXSequenceError("Joint map file specified doesn't exist: " + str(map))
 
         # reading mapping of joint names from CSV file
         with open(map) as mapfile:
@@ -66,8 +244,9 @@ class FBXSequence():
             for row in mapReader:
                 self.jointNameMap[row[0]] = row[1]
 
-        # clear the current joint map
+        # clear the current joint map, and any curve table built from the old root joint
         self.__jointMap.clear()
+        self.invalidateCurveCache()
 
         # go through each joint in nanme map calling function to find joint
         for joint in self.jointNameMap:
@@ -78,10 +257,7 @@ class FBXSequence():
     # Checks if the joint map exists
     def __checkJointMapExists(self):
         if len(self.__jointMap) == 0:
-            print("joints haven't been mapped, programme stopped")
-            print("use mapJoints to create a jointMap")
-            sys.exit()
-            return False
+            raise FBXSequenceError("joints haven't been mapped, use mapJoints to create a jointMap")
         else:
             return True
 
@@ -118,17 +294,114 @@ class FBXSequence():
     def __checkIfAnimated(self, joint, animationType):
 
         if self.__isJointAnimated(joint, animationType) == False:
-            print(
-                "Joint is not animated. Joint must have animation curve to get joint global position. Use makeJointAnimatable() function to carete animation curves")
-            sys.exit()
+            raise FBXSequenceError("Joint is not animated. Joint must have animation curve to get joint global position. Use makeJointAnimatable() function to carete animation curves")
 
-    def __getAllChildren(self, node):
+    # returns a flat list of the root joint and every node below it, in depth first order.
+    def __getAllNodes(self):
+        return self.__getNodeHierarchy()[0]
+
+    # returns a flat list of the root joint and every node below it in depth first order, along with the index of each
+    # node's parent in the list (-1 for the root joint).
+    # uses a stack rather than recursion so deep chains are not copied at every level.
+    def __getNodeHierarchy(self):
+        motionRoot = self.__jointMap[fmt.joint.root]
         nodeList = []
-        for i in range(node.GetChildCount()):
-            childNode = node.GetChild(i)
-            nodeList.append(childNode)
-            nodeList += self.__getAllChildren(childNode)
-        return nodeList
+        parentIndexes = []
+        nodeStack = [(motionRoot, -1)]
+        while len(nodeStack) > 0:
+            node, parentIndex = nodeStack.pop()
+            nodeIndex = len(nodeList)
+            nodeList.append(node)
+            parentIndexes.append(parentIndex)
+            for i in range(node.GetChildCount() - 1, -1, -1):
+                nodeStack.append((node.GetChild(i), nodeIndex))
+        return nodeList, parentIndexes
+
+    # returns the curve table for the current animation layer, building it the first time it is needed.
+    # each row holds a node, its XYZ translation curves and its XYZ rotation curves (None if an axis isn't animated).
+    def __getCurveTable(self):
+        tableKey = (self.__animStackIndex, self.__animLayerIndex)
+        if tableKey not in self.__curveTables:
+            curveTable = []
+            for node in self.__getAllNodes():
+                translationCurves = [node.LclTranslation.GetCurve(self.__animLayer, ax, False) for ax in ["X", "Y", "Z"]]
+                rotationCurves = [node.LclRotation.GetCurve(self.__animLayer, ax, False) for ax in ["X", "Y", "Z"]]
+                curveTable.append((node, translationCurves, rotationCurves))
+            self.__curveTables[tableKey] = curveTable
+        return self.__curveTables[tableKey]
+
+    # returns a flat list of every animated curve in the curve table for a given animation type, or both types if None
+    def __getAnimatedCurves(self, animationType=None):
+        curves = []
+        for node, translationCurves, rotationCurves in self.__getCurveTable():
+            if animationType != fmt.animationCurveType.ROTATION:
+                curves += [curve for curve in translationCurves if curve != None]
+            if animationType != fmt.animationCurveType.TRANSLATION:
+                curves += [curve for curve in rotationCurves if curve != None]
+        return curves
+
+    # discards cached curve tables. Must be called whenever curves are added to, or removed from, the scene.
+    def invalidateCurveCache(self):
+        self.__curveTables.clear()
+
+    # returns the number of animation stacks (takes) in the scene
+    def getAnimationStackCount(self):
+        return self.scene.GetSrcObjectCount(fbx.FbxCriteria().ObjectType(fbx.FbxAnimStack.ClassId))
+
+    # returns the names of every animation stack (take) in the scene
+    def getAnimationStackNames(self):
+        return [self.__getAnimationStack(i).GetName() for i in range(self.getAnimationStackCount())]
+
+    # returns the number of animation layers in an animation stack
+    def getAnimationLayerCount(self, stackIndex):
+        return self.__getAnimationStack(stackIndex).GetMemberCount(fbx.FbxCriteria().ObjectType(fbx.FbxAnimLayer.ClassId))
+
+    # returns the names of every animation layer in an animation stack
+    def getAnimationLayerNames(self, stackIndex):
+        stack = self.__getAnimationStack(stackIndex)
+        layerCriteria = fbx.FbxCriteria().ObjectType(fbx.FbxAnimLayer.ClassId)
+        return [stack.GetMember(layerCriteria, i).GetName() for i in range(self.getAnimationLayerCount(stackIndex))]
+
+    # returns the indexes of the animation stack and layer that functions currently read from and modify
+    def getAnimationLayer(self):
+        return (self.__animStackIndex, self.__animLayerIndex)
+
+    # sets the animation stack (take) and layer that all other functions read from and modify.
+    # the stack is also made the scene's current stack so global transforms are evaluated using the same take.
+    def setAnimationLayer(self, stackIndex, layerIndex=0):
+
+        if stackIndex < 0 or stackIndex >= self.getAnimationStackCount():
+            raise FBXSequenceError("Animation stack index out of range: " + str(stackIndex))
+        if layerIndex < 0 or layerIndex >= self.getAnimationLayerCount(stackIndex):
+            raise FBXSequenceError("Animation layer index out of range: " + str(layerIndex))
+
+        self.__animStackIndex = stackIndex
+        self.__animLayerIndex = layerIndex
+        self.__animStack = self.__getAnimationStack(stackIndex)
+        self.__animLayer = self.__animStack.GetMember(fbx.FbxCriteria().ObjectType(fbx.FbxAnimLayer.ClassId), layerIndex)
+        self.scene.SetCurrentAnimationStack(self.__animStack)
+
+    # extracts joint data from several animation layers of a single import, using the name of a joint data extraction function
+    # (e.g. "getJointRotationAsQuaternions") and its arguments.  Returns a dictionary of joint data keyed by (stackIndex, layerIndex).
+    # by default the first layer of every stack is used, other layers can be given as a list of (stackIndex, layerIndex) using the layers
+    # keyword argument.  The current animation layer is restored afterwards.
+    def getJointDataFromLayers(self, functionName, *args, **kwargs):
+
+        layers = kwargs.get("layers", [(stackIndex, 0) for stackIndex in range(self.getAnimationStackCount())])
+        currentLayer = self.getAnimationLayer()
+
+        jointDataLayers = {}
+        try:
+            for stackIndex, layerIndex in layers:
+                self.setAnimationLayer(stackIndex, layerIndex)
+                jointDataLayers[(stackIndex, layerIndex)] = getattr(self, functionName)(*args)
+        finally:
+            self.setAnimationLayer(currentLayer[0], currentLayer[1])
+
+        return jointDataLayers
+
+    def __getAnimationStack(self, stackIndex):
+        return self.scene.GetSrcObject(fbx.FbxCriteria().ObjectType(fbx.FbxAnimStack.ClassId), stackIndex)
 
     # Get the time of the last keyframe in a specified animation curve, based on specfified joint, animation curve type ("rotation" or "translation") and axis.
     def getTimeOfLastKey(self, joint, animationType, axis):
@@ -159,9 +432,7 @@ class FBXSequence():
             if node.LclTranslation.GetCurve(self.__animLayer, axisIndex, False) == None:
                 curveIsAnimated = False
         if curveIsAnimated == False:
-            print(
-                "Joint is not animated. Joint must have animation curve to get joint global position. Use makeJointAnimatable() function to carete animation curves")
-            sys.exit()
+            raise FBXSequenceError("Joint is not animated. Joint must have animation curve to get joint global position. Use makeJointAnimatable() function to carete animation curves")
 
         # get time point for each ketframe in the animation curve
         timeCurve = self.__getJointAnimCurves(joint, animationType)[axis]
@@ -221,6 +492,7 @@ class FBXSequence():
         return lcurves
 
     # this function extracts the motion curves for a set of joints into a eular joint data class
+    @ins.timed("FBXSequence.getJointRotationAsEulers")
     def getJointRotationAsEulers(self, jointList):
 
         if type(jointList) == type("string"):
@@ -245,17 +517,8 @@ class FBXSequence():
 
                     if jointCurves[axis] != None:
 
-                        # craete empty list of samples
-                        samples = []
-
-                        # go through each key in curve
-                        for frame in range(jointCurves[axis].KeyGetCount()):
-
-                            # get the key value and add it ot the sample list
-                            samples.append(jointCurves[axis].KeyGet(frame).GetValue())
-
-                        # add the list of smaples to the curve list
-                        axisCurves.append(samples)
+                        # read the value of every key in the curve and add it to the curve list
+                        axisCurves.append(self.__getCurveValues(jointCurves[axis]))
 
                 curves.append(axisCurves)
 
@@ -264,57 +527,25 @@ class FBXSequence():
 
         return jointData
 
+    @ins.timed("FBXSequence.getJointRotationAsQuaternions")
     def getJointRotationAsQuaternions(self, jointList):
 
         if type(jointList) == type("string"):
             jointList = [jointList]
 
         eulerData = self.getJointRotationAsEulers(jointList)
-        QuaternionData = np.empty((len(jointList), 4, eulerData.getFrameCount()))
-        axes = ["x", "y", "z", "w"]
-
-        for j in range(len(jointList)):
-
-            joint = jointList[j]
-            jointRotationOrder = self.getRotationOrder(joint)
-
-            jointEulerData = eulerData.getJointData(joint)
-            jointRotationData = R.from_euler(jointRotationOrder, jointEulerData.transpose(), degrees=True)
-            jointQuaternionData = jointRotationData.as_quat(canonical=True).transpose()
-
-            QuaternionData[j] = jointQuaternionData
-
-        jointData = jc.JointDataQuaternions(jointList, axes, QuaternionData)
-
-        return jointData
+        return eulerData.getJointsAsQuaternions([self.getRotationOrder(joint) for joint in jointList])
 
+    @ins.timed("FBXSequence.getJointRotationAsMatrices")
     def getJointRotationAsMatrices(self, jointList):
 
         if type(jointList) == type("string"):
             jointList = [jointList]
 
         eulerData = self.getJointRotationAsEulers(jointList)
-        MartrixData = np.empty((len(jointList), 9, eulerData.getFrameCount()))
-        axes = ["m00", "m01", "m02", "m10", "m11", "m12", "m20", "m21", "m22"]
-
-        for j in range(len(jointList)):
-            joint = jointList[j]
-            jointRotationOrder = self.getRotationOrder(joint)
-
-            jointEulerData = eulerData.getJointData(joint)
-            jointRotationData = R.from_euler(jointRotationOrder, jointEulerData.transpose(), degrees=True)
-            jointMatrixData = jointRotationData.as_matrix().transpose()
-
-            stackedMatrix = np.stack((jointMatrixData[0,0], jointMatrixData[0,1], jointMatrixData[0,2],
-                                      jointMatrixData[1,0], jointMatrixData[1,1], jointMatrixData[1,2],
-                                      jointMatrixData[2,0], jointMatrixData[2,1], jointMatrixData[2,2]))
-
-            MartrixData[j] = stackedMatrix
-
-            jointData = jc.JointDataMatrices(jointList, axes, MartrixData)
-
-            return jointData
+        return eulerData.getJointsAsMatrices([self.getRotationOrder(joint) for joint in jointList])
 
+    @ins.timed("FBXSequence.getJointRotationAsDisplacementVectors")
     def getJointRotationAsDisplacementVectors(self, jointList):
 
         if type(jointList) == type("string"):
@@ -358,12 +589,16 @@ class FBXSequence():
         return jointData
 
     # this function extracts global translations of a list of joint.
-    # the global translation of each joint is sampled at the time of each key frame in the joint specified in the syncSampleJoint.
-    def getJointAsGlobalTranslations(self, jointList, sampleTimes):
+    # the global translation of each joint is sampled at each of the sample times, which default to the key times of the root joint's x rotation.
+    @ins.timed("FBXSequence.getJointAsGlobalTranslations")
+    def getJointAsGlobalTranslations(self, jointList, sampleTimes=None):
 
         if type(jointList) == type("string"):
             jointList = [jointList]
 
+        if sampleTimes is None:
+            sampleTimes = self.getJointKeyTimes(fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x)
+
         axes = ["x", "y", "z"]
 
         # create empty list of curves
@@ -391,11 +626,15 @@ class FBXSequence():
         jointData = jc.JointDataGlobalTranslations(jointList, axes, curves)
         return jointData
 
-    def getJointAsRelativeTranslations(self, jointList, baseJoint, sampleTimes):
+    @ins.timed("FBXSequence.getJointAsRelativeTranslations")
+    def getJointAsRelativeTranslations(self, jointList, baseJoint, sampleTimes=None):
 
         if type(jointList) == type("string"):
             jointList = [jointList]
 
+        if sampleTimes is None:
+            sampleTimes = self.getJointKeyTimes(fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x)
+
         axes = ["x", "y", "z"]
 
         # create empty list of curves
@@ -438,143 +677,375 @@ class FBXSequence():
         jointData = jc.JointDataRelativeTranslations(jointList, axes, curves, baseJoint)
         return jointData
 
+    # this function extracts the translation curves for a set of joints, which are relative to each joint's parent.
+    # joints must have translation curves with keys at matching times, use makeJointsAnimatable() and resample() if needed.
+    @ins.timed("FBXSequence.getJointAsLocalTranslations")
+    def getJointAsLocalTranslations(self, jointList):
+
+        if type(jointList) == type("string"):
+            jointList = [jointList]
+
+        curves = []
+        for joint in jointList:
+            self.__checkIfAnimated(joint, fmt.animationCurveType.TRANSLATION)
+            jointCurves = self.__getJointAnimCurves(joint, fmt.animationCurveType.TRANSLATION)
+            curves.append([self.__getCurveValues(curve) for curve in jointCurves])
+
+        axes = ["x", "y", "z"]
+        jointData = jc.JointDataLocalTranslations(jointList, axes, curves)
+
+        return jointData
+
     # function resamples all the curves in a motion using specified frame rate, up to a given time limit specified in seconds.  Any frames beyond the time limit will be lost.
-    def resample(self, fps, timeLimit):
+    # if no time limit is given the time of the last key in the root joint's x rotation is used.
+    @ins.timed("FBXSequence.resample")
+    def resample(self, fps, timeLimit=None):
+
+        if timeLimit is None:
+            timeLimit = self.getTimeOfLastKey(fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x)
 
         # need to get totalTime at the start so that all curves confirm to the same standard.
-        #originalFPS = self.getFramesPerSecond()
         totalTime = timeLimit
         totalFrames = int(round(totalTime * fps) + 1)
 
-        # create a list of all the joints in sequence
-        motionRoot = self.__jointMap["root"]
-        nodeList = [motionRoot]
-        nodeList += self.__getAllChildren(motionRoot)
+        # every resampled curve shares the same key times, so only create them once
+        keyTimes = self.__getFbxTimes(np.arange(totalFrames) / float(fps))
+
+        # resample every animated curve in every joint
+        for curve in self.__getAnimatedCurves():
+            self.__resampleCurve(curve, keyTimes, keyTimes)
+
+    # evaluates an animation curve at each of the sample times, then replaces its keys with the sampled values placed at the key times.
+    def __resampleCurve(self, curve, sampleTimes, keyTimes):
+
+        # all the samples must be read before the existing keys are wiped
+        values = [curve.Evaluate(time)[0] for time in sampleTimes]
+        self.__setCurveKeys(curve, keyTimes, values)
+
+    # Reports the gaps in the keys of each joint's rotation and translation curves, compared with a frame at every
+    # 1/fps seconds from 0 to the end time.  A frame is missing if an axis of the joint has no key within a quarter of
+    # a frame of it.  Only joints with rotation or translation curves are reported, see makeJointsAnimatable().
+    # Returns a dictionary of joint -> animation type -> gap statistics, see curveTools.getGapStatistics().
+    # Optional keyword arguments:
+    #   jointList - joints to check, defaults to every mapped joint
+    #   animationTypes - animation types to check, default [fmt.animationCurveType.ROTATION, fmt.animationCurveType.TRANSLATION]
+    #   endTime - time of the last frame in seconds, defaults to the time of the last key in any of the curves checked
+    #   tolerance - largest distance between a frame and its key as a fraction of a frame, default 0.25
+    @ins.timed("FBXSequence.getGapStatistics")
+    def getGapStatistics(self, fps, **kwargs):
+
+        jointKeys, frameTimes, tolerance = self.__getGapKeys(fps, kwargs)
+        gapStatistics = {}
+
+        for (joint, animationType), axisKeys in jointKeys.items():
+            keyTimes, isMissing, nearestKeys = self.__matchJointKeys(axisKeys, frameTimes, tolerance)
+            gapStatistics.setdefault(joint, {})[animationType] = ct.getGapStatistics(isMissing, len(keyTimes))
+
+        return gapStatistics
+
+    # Fills the gaps in the keys of each joint's rotation and translation curves, so that every curve has a key at
+    # every 1/fps seconds from 0 to the end time.  Keys are read from each curve in a single pass and all the joints
+    # whose keys are at the same times are interpolated together as arrays.  Rotations are interpolated as
+    # quaternions and translations with a cubic spline, frames that already have a key keep its value and frames
+    # beyond the first or last key hold its value.  Axes keyed at different times are first interpolated at every
+    # key time of the joint.  Curves are rewritten with setJointRotationFromEulers() and setJointLocalTranslations(),
+    # skipping joints that already have a key on every frame.  Takes the same optional keyword arguments as
+    # getGapStatistics(), which describe the gaps found, and returns the same gap statistics.
+    # Optional keyword arguments:
+    #   rotationInterpolation - "slerp" (default) or "squad" to interpolate quaternions, or "cubic" or "linear" to
+    #                           interpolate each Euler angle, see curveTools.interpolateQuaternions()
+    #   translationInterpolation - "cubic" (default) or "linear", see curveTools.interpolateCurves()
+    @ins.timed("FBXSequence.fillGaps")
+    def fillGaps(self, fps, **kwargs):
+
+        rotationInterpolation = kwargs.get("rotationInterpolation", "slerp")
+        translationInterpolation = kwargs.get("translationInterpolation", "cubic")
+        if rotationInterpolation not in ["slerp", "squad", "cubic", "linear"]:
+            raise FBXSequenceError("Rotation interpolation must be \"slerp\", \"squad\", \"cubic\" or \"linear\": " + str(rotationInterpolation))
+        if translationInterpolation not in ["cubic", "linear"]:
+            raise FBXSequenceError("Translation interpolation must be \"cubic\" or \"linear\": " + str(translationInterpolation))
+
+        jointKeys, frameTimes, tolerance = self.__getGapKeys(fps, kwargs)
+        gapStatistics = {}
+
+        # joints are grouped by animation type and key times, so each group can be interpolated as one array
+        groups = {}
+        for (joint, animationType), axisKeys in jointKeys.items():
+
+            # axes keyed at different times are interpolated in the same way as the gaps
+            isRotation = animationType == fmt.animationCurveType.ROTATION
+            axisInterpolation = translationInterpolation
+            if isRotation:
+                axisInterpolation = "linear" if rotationInterpolation in ["slerp", "linear"] else "cubic"
+
+            keyTimes, isMissing, nearestKeys = self.__matchJointKeys(axisKeys, frameTimes, tolerance)
+            statistics = ct.getGapStatistics(isMissing, len(keyTimes))
+            gapStatistics.setdefault(joint, {})[animationType] = statistics
+
+            if statistics["missingFrames"] == 0 and statistics["keys"] == statistics["frames"]:
+                continue
+
+            keyValues = np.array([values if np.array_equal(times, keyTimes) else ct.interpolateCurves(times, values, keyTimes, method=axisInterpolation)
+                                  for times, values in axisKeys])
+            if isRotation:
+                keyValues = ct.unrollAngles(keyValues)
+
+            group = groups.setdefault((animationType, keyTimes.tobytes()), (keyTimes, []))
+            group[1].append((joint, keyValues, isMissing, nearestKeys))
+
+        filledJoints = {fmt.animationCurveType.ROTATION: ([], []), fmt.animationCurveType.TRANSLATION: ([], [])}
+
+        for (animationType, timesKey), (keyTimes, groupJoints) in groups.items():
+
+            keyValues = np.array([values for joint, values, isMissing, nearestKeys in groupJoints])
+
+            if animationType == fmt.animationCurveType.TRANSLATION:
+                filledValues = ct.interpolateCurves(keyTimes, keyValues, frameTimes, method=translationInterpolation)
+            elif rotationInterpolation in ["cubic", "linear"]:
+                filledValues = ct.interpolateCurves(keyTimes, keyValues, frameTimes, method=rotationInterpolation)
+            else:
+                filledValues = self.__interpolateJointRotations([groupJoint[0] for groupJoint in groupJoints], keyTimes, keyValues, frameTimes, rotationInterpolation)
+
+            for j in range(len(groupJoints)):
+                joint, values, isMissing, nearestKeys = groupJoints[j]
+                filledValues[j][:, ~isMissing] = values[:, nearestKeys[~isMissing]]
+                filledJoints[animationType][0].append(joint)
+                filledJoints[animationType][1].append(filledValues[j])
 
-        # set up a list of axis
-        axis = ["X", "Y", "Z"]
+        axes = ["x", "y", "z"]
+        rotationJoints, rotationCurves = filledJoints[fmt.animationCurveType.ROTATION]
+        if len(rotationJoints) > 0:
+            self.setJointRotationFromEulers(jc.JointDataEulers(rotationJoints, axes, rotationCurves), fps)
+        translationJoints, translationCurves = filledJoints[fmt.animationCurveType.TRANSLATION]
+        if len(translationJoints) > 0:
+            self.setJointLocalTranslations(jc.JointDataLocalTranslations(translationJoints, axes, translationCurves), fps)
 
-        # resample of the frame in every joint
-        for node in nodeList:
+        return gapStatistics
 
-            # resample the translation curves
-            for ax in axis:
-                curve = node.LclTranslation.GetCurve(self.__animLayer, ax, False)
-                if curve != None:
-                    self.__resampleCurve(curve, fps, totalFrames)
+    # reads the keys of every joint and animation type checked by getGapStatistics() or fillGaps(), returning a
+    # dictionary of (joint, animation type) -> list of (key times, key values) for each axis, the frame times and the
+    # tolerance in seconds.  Axes without keys have a single key holding the joint's static value.
+    def __getGapKeys(self, fps, kwargs):
 
-            # resample the rotation curves
-            for ax in axis:
-                curve = node.LclRotation.GetCurve(self.__animLayer, ax, False)
-                if curve != None:
-                    self.__resampleCurve(curve, fps, totalFrames)
+        jointKeys = {}
+        lastKeyTime = 0.
+        for (joint, animationType), curveKeys in self.__getJointCurveKeys(kwargs).items():
+
+            node = self.__jointMap[joint]
+            staticValues = node.LclTranslation.Get() if animationType == fmt.animationCurveType.TRANSLATION else node.LclRotation.Get()
+
+            axisKeys = []
+            for axis in range(3):
+                curve, times, values = curveKeys[axis]
+                if len(times) == 0:
+                    times, values = np.zeros(1), np.array([float(staticValues[axis])])
+                axisKeys.append((times, values))
+                lastKeyTime = max(lastKeyTime, times[-1])
+
+            jointKeys[(joint, animationType)] = axisKeys
+
+        frameTimes = ct.getFrameTimes(kwargs.get("endTime", lastKeyTime), fps)
+
+        return jointKeys, frameTimes, kwargs.get("tolerance", 0.25) / float(fps)
+
+    # Removes keys from each joint's rotation and translation curves while keeping every removed key within a tolerance
+    # of the straight line between the keys either side of it, using curveTools.reduceKeys().  The remaining keys are
+    # given linear interpolation, so the curves pass within the tolerance of every original key, making exported files
+    # smaller and quicker to evaluate.  The XYZ curves of a joint keep the same keys if they are keyed at the same
+    # times, and all the curves with the same key times are reduced at once.  Curves that can't lose any keys are left
+    # unaltered.  Best used as the last step before export, e.g. after resample(), as curves no longer have a key on
+    # every frame.  Returns a dictionary of joint -> animation type -> reduction statistics, see
+    # curveTools.getReductionStatistics().
+    # Optional keyword arguments:
+    #   rotationTolerance - largest error of a rotation curve in degrees, default 0.1.  A single value or a dictionary
+    #                       of joint -> tolerance.
+    #   translationTolerance - largest error of a translation curve in scene units, default 0.1.  A single value or a
+    #                          dictionary of joint -> tolerance.
+    #   jointList - joints to reduce, defaults to every mapped joint
+    #   animationTypes - animation types to reduce, default [fmt.animationCurveType.ROTATION, fmt.animationCurveType.TRANSLATION]
+    @ins.timed("FBXSequence.reduceKeys")
+    def reduceKeys(self, **kwargs):
+
+        tolerances = {fmt.animationCurveType.ROTATION: kwargs.get("rotationTolerance", 0.1),
+                      fmt.animationCurveType.TRANSLATION: kwargs.get("translationTolerance", 0.1)}
+
+        # curves are grouped by their key times and whether the axes of a joint share keys, so each group can be
+        # reduced as one array
+        groups = {}
+        for (joint, animationType), curveKeys in self.__getJointCurveKeys(kwargs).items():
+
+            tolerance = tolerances[animationType]
+            if isinstance(tolerance, dict):
+                tolerance = tolerance[joint]
+
+            curveKeys = [(axis,) + curveKeys[axis] for axis in range(3) if len(curveKeys[axis][1]) > 0]
+            if len(curveKeys) == 3 and all(np.array_equal(keys[2], curveKeys[0][2]) for keys in curveKeys):
+                channels = [curveKeys]
+            else:
+                channels = [[keys] for keys in curveKeys]
+
+            for channelKeys in channels:
+                keyTimes = channelKeys[0][2]
+                group = groups.setdefault((len(channelKeys), keyTimes.tobytes()), (keyTimes, []))
+                group[1].append((joint, animationType, tolerance, channelKeys))
+
+        reductions = {}
+        for (channelCount, timesKey), (keyTimes, groupCurves) in groups.items():
+
+            keyValues = np.array([[keys[3] for keys in channelKeys] for joint, animationType, tolerance, channelKeys in groupCurves])
+            groupTolerances = np.array([[tolerance] * channelCount for joint, animationType, tolerance, channelKeys in groupCurves], dtype=float)
+
+            isKept = ct.reduceKeys(keyTimes, keyValues, groupTolerances)
+            maxErrors = ct.getReductionErrors(keyTimes, keyValues, isKept)
+            fbxTimes = None
+
+            for c in range(len(groupCurves)):
+                joint, animationType, tolerance, channelKeys = groupCurves[c]
+                keptKeys = np.flatnonzero(isKept[c])
+
+                if len(keptKeys) < len(keyTimes):
+                    if fbxTimes is None:
+                        fbxTimes = self.__getFbxTimes(keyTimes)
+                    keptTimes = [fbxTimes[key] for key in keptKeys]
+                    for axis, curve, times, values in channelKeys:
+                        self.__setCurveKeys(curve, keptTimes, values[keptKeys], fbx.FbxAnimCurveDef.eInterpolationLinear)
+
+                reduction = reductions.setdefault((joint, animationType), {})
+                for a in range(channelCount):
+                    reduction[channelKeys[a][0]] = (len(keyTimes), len(keptKeys), maxErrors[c, a])
+
+        statistics = {}
+        for (joint, animationType), reduction in reductions.items():
+            axisReductions = [reduction[axis] for axis in sorted(reduction)]
+            statistics.setdefault(joint, {})[animationType] = ct.getReductionStatistics(sum(keys for keys, keptKeys, error in axisReductions),
+                                                                                         sum(keptKeys for keys, keptKeys, error in axisReductions),
+                                                                                         [error for keys, keptKeys, error in axisReductions])
+
+        return statistics
+
+    # reads the keys of each joint's XYZ rotation and translation curves, returning a dictionary of
+    # (joint, animation type) -> list of (curve, key times, key values) for each axis.  Joints without any curves of
+    # an animation type are left out.  Takes the jointList and animationTypes keyword arguments of getGapStatistics().
+    def __getJointCurveKeys(self, kwargs):
 
-    # resmaples an animation curve to a given frame rate and time limit
-    def __resampleCurve(self, input, fps, totalFrames):
+        self.__checkJointMapExists()
 
-        # create a new curve
-        newCurve = fbx.FbxAnimCurve.Create(self.scene, "nCurve")
+        jointList = kwargs.get("jointList", list(self.__jointMap.keys()))
+        if type(jointList) == type("string"):
+            jointList = [jointList]
+        animationTypes = kwargs.get("animationTypes", [fmt.animationCurveType.ROTATION, fmt.animationCurveType.TRANSLATION])
 
-        # for each frame in the reference motion, sample the input motion, building a new curve
-        for frame in range(totalFrames):
+        curveKeys = {}
+        for animationType in animationTypes:
+            for joint in jointList:
+                curves = self.__getJointAnimCurves(joint, animationType)
+                if any(curve != None for curve in curves):
+                    curveKeys[(joint, animationType)] = [(curve,) + self.__getCurveKeys(curve) for curve in curves]
 
-            # get the time of the new frame
-            time = fbx.FbxTime()
-            time.SetSecondDouble(frame * (1. / fps))
+        return curveKeys
 
-            # get the value of the curve at the time of the new frame
-            value = input.Evaluate(time)
+    # returns every time any axis of a joint has a key, a boolean array that is True for each frame missing a key in
+    # any axis, and the index of the nearest key time to each frame
+    def __matchJointKeys(self, axisKeys, frameTimes, tolerance):
 
-            # add a key to the new curve
-            newKeyIndex = newCurve.KeyAdd(time)
-            newCurve.KeySetValue(newKeyIndex[0], value[0])
+        keyTimes = np.unique(np.concatenate([times for times, values in axisKeys]))
+        isMissing = np.any([ct.matchKeys(times, frameTimes, tolerance)[1] for times, values in axisKeys], axis=0)
+        nearestKeys = ct.matchKeys(keyTimes, frameTimes, tolerance)[0]
 
-        # copy all the keys from the new curve to the input curve, wiping existing keys.
-        input.CopyFrom(newCurve, True)
+        return keyTimes, isMissing, nearestKeys
 
-    # perform universal timewarp of motion to a given duration in seconds by moving the key in each curve
-    def UTW(self, currentDuration, newDuration, fps):
+    # interpolates the Euler keys of shape (joints, 3, keys) of joints sharing the same key times as quaternions,
+    # returning Eulers of shape (joints, 3, frames).  Each angle is wrapped to the period nearest the linearly
+    # interpolated Eulers, so curves stay unrolled.
+    def __interpolateJointRotations(self, jointList, keyTimes, keyEulers, frameTimes, method):
 
-        # create a list of all the joints in sequence
-        motionRoot = self.__jointMap[fmt.joint.root]
-        nodeList = [motionRoot]
-        nodeList += self.__getAllChildren(motionRoot)
+        rotationOrders = [self.getRotationOrder(joint) for joint in jointList]
+        keyQuaternions = np.array([ct.eulersToRotations(keyEulers[j], rotationOrders[j]).as_quat() for j in range(len(jointList))])
+        quaternions = ct.interpolateQuaternions(keyTimes, keyQuaternions, frameTimes, method=method)
+
+        linearEulers = ct.interpolateCurves(keyTimes, keyEulers, frameTimes, method="linear")
+        eulers = np.array([ct.rotationsToEulers(R.from_quat(quaternions[j]), rotationOrders[j]) for j in range(len(jointList))])
+        eulers += 360. * np.round((linearEulers - eulers) / 360.)
 
-        curveList = []
-        axes = ["X", "Y", "Z"]
+        return eulers
 
-        for node in nodeList:
-            for a in axes:
+    # reads the time in seconds and the value of every key in an animation curve into numpy arrays, in a single pass
+    # over the keys.  A curve that doesn't exist has no keys.
+    def __getCurveKeys(self, curve):
 
-                tcurve = node.LclTranslation.GetCurve(self.__animLayer, a, False)
-                if tcurve != None:
-                    curveList.append(tcurve)
+        keyCount = curve.KeyGetCount() if curve != None else 0
+        times = np.empty(keyCount)
+        values = np.empty(keyCount)
+        for key in range(keyCount):
+            times[key] = curve.KeyGetTime(key).GetSecondDouble()
+            values[key] = curve.KeyGetValue(key)
 
-                rcurve = node.LclRotation.GetCurve(self.__animLayer, a, False)
-                if rcurve != None:
-                    curveList.append(rcurve)
+        return times, values
 
-        for animCurve in curveList:
+    # perform universal timewarp of motion to a given duration in seconds, resampling each curve at the new frame rate in a single pass.
+    @ins.timed("FBXSequence.UTW")
+    def UTW(self, currentDuration, newDuration, fps):
 
-            numKeys = animCurve.KeyGetCount()
+        if currentDuration is None:
+            currentDuration = self.getTimeOfLastKey(fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x)
 
-            if(newDuration > currentDuration):
-                for keyNum in range(numKeys - 1, -1, -1):
-                    self.__retimeKey(animCurve, keyNum, newDuration, currentDuration)
+        totalFrames = int(round(newDuration * fps) + 1)
+        frameTimes = np.arange(totalFrames) / float(fps)
 
-            # if making it shorter go from first frame to last
-            elif(newDuration < currentDuration):
-                for keyNum in range(numKeys):
-                    self.__retimeKey(animCurve, keyNum, newDuration, currentDuration)
+        # each new frame samples the original curves at the same normalised position within the motion
+        keyTimes = self.__getFbxTimes(frameTimes)
+        sampleTimes = self.__getFbxTimes(frameTimes * (currentDuration / newDuration))
 
-        self.resample(fps, newDuration)
+        for curve in self.__getAnimatedCurves():
+            self.__resampleCurve(curve, sampleTimes, keyTimes)
 
-    # retime a key to fit a new motion duration
-    def __retimeKey(self, animCurve, keyNum, targetDuration, oldDuration):
+    # applies a timewarp to every animated curve using a frame map.  Integer maps copy key values from the mapped
+    # frames, fractional maps (e.g. from tw.smoothDTWmap) interpolate between neighbouring frames, using linear
+    # interpolation for translations and slerp for rotations.
+    @ins.timed("FBXSequence.applyTimewarp")
+    def applyTimewarp(self, frameMap):
 
-        #get the normalised postion of the frame in relation to the position of the last frame
-        oldKeyTime = animCurve.KeyGet(keyNum).GetTime().GetSecondDouble()
-        normalisedFramePos = oldKeyTime / oldDuration
+        totalFramesOfOrginalMotion = self.getNumberKeyframes(fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x)
+        fps = self.getFramesPerSecond(fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x)
 
-        # calc new frame time
-        frameTimeSec = normalisedFramePos * targetDuration
+        # get the first animation stack
+        lAnimStack = self.__animStack
 
-        # create time object with new time
-        frameTime = fbx.FbxTime()
-        frameTime.SetSecondDouble(frameTimeSec)
+        # the warped curves all share the same key times, so only create them once
+        frameMap = np.asarray(frameMap)
+        keyTimes = self.__getFbxTimes(np.arange(len(frameMap)) / float(fps))
 
-        # set the key frame to the new time
-        keyVal = animCurve.KeyGet(keyNum).GetValue()
-        animCurve.KeySet(keyNum, frameTime, keyVal)
+        # work out which two frames each warped frame lies between
+        lowerFrames = np.clip(np.floor(frameMap).astype(int), 0, totalFramesOfOrginalMotion - 1)
+        upperFrames = np.minimum(lowerFrames + 1, totalFramesOfOrginalMotion - 1)
+        weights = np.clip(frameMap - lowerFrames, 0., 1.)
+        isFractional = np.any(weights > 0.)
 
-    def applyTimewarp(self, frameMap):
+        # timewarp the rotation and translation curves of each node
+        for node, translationCurves, rotationCurves in self.__getCurveTable():
 
-        totalFramesOfOrginalMotion = self.getNumberKeyframes(fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x)
+            curves = [curve for curve in translationCurves + rotationCurves if curve != None and curve.KeyGetCount() == totalFramesOfOrginalMotion]
+            if len(curves) == 0:
+                continue
 
-        motionRoot = self.__jointMap["root"]
-        nodeList = [motionRoot]
-        nodeList += self.__getAllChildren(motionRoot)
+            curveValues = [self.__getCurveValues(curve) for curve in curves]
 
-        # get the first animation stack and animation layer
-        lAnimStack = self.__animStack
-        lAnimLayer = self.__animLayer
+            if isFractional == False:
+                warpedValues = [values[lowerFrames] for values in curveValues]
+            else:
+                warpedValues = [values[lowerFrames] * (1. - weights) + values[upperFrames] * weights for values in curveValues]
 
-        # set up a list of axis
-        axis = ["X", "Y", "Z"]
+                # rotations are interpolated together, as quaternions, when all three axes are being warped
+                if all(curve in curves for curve in rotationCurves):
+                    rotationIndexes = [curves.index(curve) for curve in rotationCurves]
+                    eulers = np.array([curveValues[i] for i in rotationIndexes])
+                    linearEulers = np.array([warpedValues[i] for i in rotationIndexes])
+                    slerpEulers = self.__slerpEulers(eulers, lowerFrames, upperFrames, weights, linearEulers, self.__getNodeRotationOrder(node))
+                    for a in range(3):
+                        warpedValues[rotationIndexes[a]] = slerpEulers[a]
 
-        # timewarp the rotation curves of each subsequent node
-        for node in nodeList:
-            for ax in axis:
-                curve = node.LclRotation.GetCurve(lAnimLayer, ax, False)
-                if curve != None:
-                    if curve.KeyGetCount() == totalFramesOfOrginalMotion:
-                        #print("rot" + node.GetName())
-                        self.__DTWtimewarpCurve(curve, frameMap)
-                curve = node.LclTranslation.GetCurve(lAnimLayer, ax, False)
-                if curve != None:
-                    if curve.KeyGetCount() == totalFramesOfOrginalMotion:
-                        #print("trans" + node.GetName())
-                        self.__DTWtimewarpCurve(curve, frameMap)
+            for c in range(len(curves)):
+                self.__setCurveKeys(curves[c], keyTimes, warpedValues[c])
 
         # set the timespane of the take
         startTime = fbx.FbxTime()
@@ -588,81 +1059,76 @@ class FBXSequence():
         lAnimStack.SetLocalTimeSpan(timeSpan)
         lAnimStack.SetReferenceTimeSpan(timeSpan)
 
-    # applies a timewarp to a curve using DTWmap
-    def __DTWtimewarpCurve(self, curve, DTWmap):
+    # slerps between the rotations at the lower and upper frames, returning Eulers of shape (3, frames).
+    # Each angle is wrapped to the period nearest the linearly interpolated Eulers, so curves stay unrolled.
+    def __slerpEulers(self, eulers, lowerFrames, upperFrames, weights, linearEulers, rotationOrder):
 
-        fps = self.getFramesPerSecond(fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x)
-        frameInterval = 1. / float(fps)
+        quaternions = ct.eulersToRotations(eulers, rotationOrder).as_quat()
+        slerpQuaternions = ct.slerp(quaternions[lowerFrames], quaternions[upperFrames], weights)
+        slerpEulers = ct.rotationsToEulers(R.from_quat(slerpQuaternions), rotationOrder)
+        slerpEulers += 360. * np.round((linearEulers - slerpEulers) / 360.)
 
-        time = 0.
+        # frames that land exactly on a source frame keep their original Eulers
+        isWholeFrame = weights == 0.
+        slerpEulers[:, isWholeFrame] = linearEulers[:, isWholeFrame]
 
-        # save unwarped values of the curve
-        oldCurveValues = []
-        for i in range(curve.KeyGetCount()):
-            oldCurveValues.append(curve.KeyGet(i).GetValue())
+        return slerpEulers
 
-        # wipe the keys on the curve
+    # creates a list of FbxTime objects from a list of times in seconds
+    def __getFbxTimes(self, seconds):
+        fbxTimes = []
+        for second in seconds:
+            time = fbx.FbxTime()
+            time.SetSecondDouble(float(second))
+            fbxTimes.append(time)
+        return fbxTimes
+
+    # replaces all the keys in a curve with new keys, as a single modification of the curve.  The interpolation of
+    # the new keys can be set with an FbxAnimCurveDef interpolation type, otherwise the SDK's default is used.
+    def __setCurveKeys(self, curve, fbxTimes, values, interpolation=None):
+        curve.KeyModifyBegin()
         curve.KeyClear()
-
-        # write the old values fo the curve back to the curve using the warp.
-        for i in range(len(DTWmap)):
-            newValue = oldCurveValues[DTWmap[i]]
-
-            newTime = fbx.FbxTime()
-            newTime.SetSecondDouble(time)
-
-            newKeyIndex = curve.KeyAdd(newTime)
-            curve.KeySetValue(newKeyIndex[0], newValue)
-
-            time += frameInterval
-
-    def unrollJointAxis(self, joint, axis):
+        for key in range(len(fbxTimes)):
+            newKeyIndex = curve.KeyAdd(fbxTimes[key])
+            curve.KeySetValue(newKeyIndex[0], float(values[key]))
+            if interpolation is not None:
+                curve.KeySetInterpolation(newKeyIndex[0], interpolation)
+        curve.KeyModifyEnd()
+
+    def unrollJointAxis(self, joint, axis, **kwargs):
         curve = self.__getJointAnimCurves(joint, fmt.animationCurveType.ROTATION)[axis]
-        self.__unrollCurves([curve])
+        self.__unrollCurves([curve], **kwargs)
 
-    def unrollJoint(self, joint):
+    def unrollJoint(self, joint, **kwargs):
         curves = self.__getJointAnimCurves(joint, fmt.animationCurveType.ROTATION)
-        self.__unrollCurves(curves)
-
-    def unrollAllJoints(self):
-        curves = []
-
-        # create a list of all the joints in sequence
-        motionRoot = self.__jointMap["root"]
-        nodeList = [motionRoot]
-        nodeList += self.__getAllChildren(motionRoot)
+        self.__unrollCurves(curves, **kwargs)
 
-        # set up a list of axis
-        axis = ["X", "Y", "Z"]
+    @ins.timed("FBXSequence.unrollAllJoints")
+    def unrollAllJoints(self, **kwargs):
+        curves = self.__getAnimatedCurves(fmt.animationCurveType.ROTATION)
+        self.__unrollCurves(curves, **kwargs)
 
-        for node in nodeList:
-            for ax in axis:
-                rCurve = node.LclRotation.GetCurve(self.__animLayer, ax, False)
-                if rCurve != None:
-                    curves.append(rCurve)
-        self.__unrollCurves(curves)
-
-    def __unrollCurves(self, curves):
-
-        threshold = 340
+    # unrolls each curve as an array, only writing back the keys whose values have changed.
+    # threshold and period can be passed as keyword arguments, see curveTools.unrollAngles.
+    def __unrollCurves(self, curves, **kwargs):
 
         for curve in curves:
-            increment = 0
-            keyCount = curve.KeyGetCount()
-            for key in range(1, keyCount):
-                lastkeyVal = curve.KeyGetValue(key - 1)
-                keyVal = curve.KeyGetValue(key)
-                keyVal += increment
-                dif = keyVal - lastkeyVal
-                if dif > threshold:
-                    increment -= 360
-                    keyVal -= 360
-                if dif < -threshold:
-                    increment += 360
-                    keyVal += 360
-                curve.KeySetValue(key, keyVal)
-
-
+            values = self.__getCurveValues(curve)
+            unrolledValues = ct.unrollAngles(values, **kwargs)
+            changedKeys = np.flatnonzero(unrolledValues != values)
+            if len(changedKeys) > 0:
+                self.__setCurveValues(curve, unrolledValues, changedKeys)
+
+    # reads the value of every key in an animation curve into a numpy array
+    def __getCurveValues(self, curve):
+        return np.array([curve.KeyGetValue(key) for key in range(curve.KeyGetCount())], dtype=float)
+
+    # writes new values to the keys listed in keyIndices, as a single modification of the curve
+    def __setCurveValues(self, curve, values, keyIndices):
+        curve.KeyModifyBegin()
+        for key in keyIndices:
+            curve.KeySetValue(int(key), float(values[key]))
+        curve.KeyModifyEnd()
 
     def makeJointsAnimatable(self, jointList, animationType):
 
@@ -672,18 +1138,164 @@ class FBXSequence():
         if type(jointList) == type("string"):
             jointList = [jointList]
 
+        curvesCreated = False
         for joint in jointList:
             node = self.__jointMap[joint]
+            nodeProperty = node.LclTranslation if animationType == fmt.animationCurveType.TRANSLATION else node.LclRotation
 
             for axis in ["X", "Y", "Z"]:
-                node.LclRotation.GetCurve(self.__animLayer, axis, True)
+                if nodeProperty.GetCurve(self.__animLayer, axis, False) == None:
+                    nodeProperty.GetCurve(self.__animLayer, axis, True)
+                    curvesCreated = True
+
+        # new curves have been created, so the cached curve table is out of date
+        if curvesCreated:
+            self.invalidateCurveCache()
+
+    # replaces the keys in the rotation curves of every joint in a JointDataEulers object with a key for each frame of joint data.
+    # keys are placed at the given frame rate, starting from the startTime keyword argument in seconds (default 0).
+    # rotation curves are created for joints that aren't animated.
+    def setJointRotationFromEulers(self, jointData, fps, **kwargs):
+        self.__setJointDataKeys(jointData, fmt.animationCurveType.ROTATION, fps, kwargs.get("startTime", 0.))
+
+    # converts quaternion joint data to Euler angles using the rotation order of each joint, unrolls them, then replaces
+    # the keys in the joints' rotation curves as setJointRotationFromEulers does
+    def setJointRotationFromQuaternions(self, jointData, fps, **kwargs):
+        eulerData = jointData.getJointsAsEulers([self.getRotationOrder(joint) for joint in jointData.joints])
+        eulerData.unroll()
+        self.setJointRotationFromEulers(eulerData, fps, **kwargs)
+
+    # converts matrix joint data to Euler angles using the rotation order of each joint, unrolls them, then replaces
+    # the keys in the joints' rotation curves as setJointRotationFromEulers does
+    def setJointRotationFromMatrices(self, jointData, fps, **kwargs):
+        eulerData = jointData.getJointsAsEulers([self.getRotationOrder(joint) for joint in jointData.joints])
+        eulerData.unroll()
+        self.setJointRotationFromEulers(eulerData, fps, **kwargs)
+
+    # replaces the keys in the translation curves of every joint in a JointDataLocalTranslations object, as
+    # setJointRotationFromEulers does for rotations
+    def setJointLocalTranslations(self, jointData, fps, **kwargs):
+        self.__setJointDataKeys(jointData, fmt.animationCurveType.TRANSLATION, fps, kwargs.get("startTime", 0.))
+
+    # writes joint data back to the curves of its joints, using the set function matching the joint data class
+    @ins.timed("FBXSequence.setJointData")
+    def setJointData(self, jointData, fps, **kwargs):
+
+        if isinstance(jointData, jc.JointDataEulers):
+            self.setJointRotationFromEulers(jointData, fps, **kwargs)
+        elif isinstance(jointData, jc.JointDataQuaternions):
+            self.setJointRotationFromQuaternions(jointData, fps, **kwargs)
+        elif isinstance(jointData, jc.JointDataMatrices):
+            self.setJointRotationFromMatrices(jointData, fps, **kwargs)
+        elif isinstance(jointData, jc.JointDataLocalTranslations):
+            self.setJointLocalTranslations(jointData, fps, **kwargs)
+        else:
+            raise FBXSequenceError("Joint data can't be written to animation curves: " + str(jointData.dataType))
+
+    def __setJointDataKeys(self, jointData, animationType, fps, startTime):
+
+        self.makeJointsAnimatable(jointData.joints, animationType)
+
+        # every curve is keyed on the same frames, so the FBX times are only created once
+        fbxTimes = self.__getFbxTimes(startTime + np.arange(jointData.getFrameCount()) / float(fps))
+
+        for j in range(jointData.getJointCount()):
+            curves = self.__getJointAnimCurves(jointData.joints[j], animationType)
+            for axis in range(3):
+                self.__setCurveKeys(curves[axis], fbxTimes, jointData.data[j, axis])
+
+    # saves the skeleton below the root joint and the animation of the current animation layer as a motion container,
+    # which can be read without the FBX SDK using motionContainer.MotionContainer.  Every translation and rotation curve
+    # is sampled once per frame at the frame rate of the root joint, up to its last key.  The frame rate can be changed
+    # using the fps keyword argument.
+    @ins.timed("FBXSequence.exportMotionContainer")
+    def exportMotionContainer(self, outputFile, **kwargs):
+
+        self.__checkJointMapExists()
+
+        rootArgs = (fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x)
+        fps = kwargs.get("fps", self.getFramesPerSecond(*rootArgs))
+        frameCount = int(round(self.getTimeOfLastKey(*rootArgs) * fps)) + 1
+        frameTimes = self.__getFbxTimes(np.arange(frameCount) / float(fps))
+
+        nodeList, parentIndexes = self.__getNodeHierarchy()
+        nodeNames = [node.GetName() for node in nodeList]
+        curves = np.empty((len(nodeList), 6, frameCount))
+        animatedChannels = np.zeros((len(nodeList), 6), dtype=bool)
+
+        # channels without a curve keep their default value on every frame
+        for n, (node, translationCurves, rotationCurves) in enumerate(self.__getCurveTable()):
+            defaults = self.__getVector3(node.LclTranslation) + self.__getVector3(node.LclRotation)
+            for c, curve in enumerate(translationCurves + rotationCurves):
+                if curve != None:
+                    curves[n, c] = [curve.Evaluate(t)[0] for t in frameTimes]
+                    animatedChannels[n, c] = True
+                else:
+                    curves[n, c] = defaults[c]
+
+        # the transform of the node above the root joint, which places the whole skeleton in the scene
+        rootParentMatrix = np.identity(4)
+        rootParent = nodeList[0].GetParent()
+        if rootParent != None:
+            parentMatrix = rootParent.EvaluateGlobalTransform(frameTimes[0])
+            rootParentMatrix = np.array([[parentMatrix.Get(r, c) for c in range(4)] for r in range(4)]).transpose()
+
+        # mapped joints are stored as the index of their node, or -1 if the joint isn't below the root joint
+        mappedJoints = list(self.__jointMap.keys())
+        jointNodeIndexes = []
+        for joint in mappedJoints:
+            node = self.__jointMap[joint]
+            if node != None and node.GetName() in nodeNames:
+                jointNodeIndexes.append(nodeNames.index(node.GetName()))
+            else:
+                jointNodeIndexes.append(-1)
+
+        # static offsets, pivots and scaling needed to rebuild the transform of each node
+        nodeProperties = {}
+        for propertyName, arrayName in mc.nodeProperties.items():
+            nodeProperties[arrayName] = [self.__getVector3(getattr(node, propertyName)) for node in nodeList]
+
+        mc.writeMotionContainer(outputFile, fps, curves,
+                                sourceFile=os.path.basename(self.file),
+                                nodeNames=nodeNames,
+                                parentIndexes=parentIndexes,
+                                rotationOrders=[self.__getNodeRotationOrder(node) for node in nodeList],
+                                rotationActive=[bool(node.RotationActive.Get()) for node in nodeList],
+                                animatedChannels=animatedChannels,
+                                rootParentMatrix=rootParentMatrix,
+                                jointNames=mappedJoints,
+                                fbxJointNames=[self.jointNameMap[joint] for joint in mappedJoints],
+                                jointNodeIndexes=jointNodeIndexes,
+                                **nodeProperties)
+
+    # returns the value of a three component node property as a list
+    def __getVector3(self, nodeProperty):
+        value = nodeProperty.Get()
+        return [value[0], value[1], value[2]]
+
+    # save the scene as a .fbx file, in binary format unless ascii is True.  Media such as textures are only embedded
+    # in the file if embedMedia is True, otherwise they are left out and referenced by their paths.
+    @ins.timed("FBXSequence.export")
+    def export(self, fullpath, ascii=False, embedMedia=False):
+
+        ioSettings = self.fbxManager.GetIOSettings()
+        if ioSettings == None:
+            ioSettings = fbx.FbxIOSettings.Create(self.fbxManager, fbx.IOSROOT)
+            self.fbxManager.SetIOSettings(ioSettings)
+        ioSettings.SetBoolProp(fbx.EXP_FBX_EMBEDDED, embedMedia)
+
+        # look up the writer for the format, which is registered under a description rather than a fixed id
+        writerDescription = "FBX ascii (*.fbx)" if ascii else "FBX binary (*.fbx)"
+        fileFormat = self.fbxManager.GetIOPluginRegistry().FindWriterIDByDescription(writerDescription)
 
-    # save the scene as a .fbx file.
-    def export(self, fullpath):
         exporter = fbx.FbxExporter.Create(self.fbxManager, '')
-        exporter.Initialize(fullpath)
-        exporter.Export(self.scene)
-        exporter.Destroy()
+        try:
+            if exporter.Initialize(fullpath, fileFormat, ioSettings) == False:
+                raise FBXSequenceError("FBX export failed check file name: " + str(fullpath))
+            if exporter.Export(self.scene) == False:
+                raise FBXSequenceError("FBX export failed: " + str(fullpath))
+        finally:
+            exporter.Destroy()
 
     # print a hierarchical display of the nodes along with ley information each node.
     def printSceneHierarchy(self):
@@ -707,6 +1319,7 @@ class FBXSequence():
         for i in range(node.GetChildCount()):
             self.__printNodeName(node.GetChild(i), depth + 1)
 
+    @ins.timed("FBXSequence.exportJointInfo")
     def exportJointInfo(self, outputFile):
 
         header = ["Mapped Name", "FBX Name", "Rotation Order", "TX Key Count", "TY Key Count", "TZ Key Count", "RX Key Count", "RY Key Count", "RZ Key Count", "Time of Last Key (secs)"]
@@ -755,20 +1368,22 @@ class FBXSequence():
 
     #returns the order in which joint rotaitons are being applied in a form that can be used with SciPy
     def getRotationOrder(self, joint):
+        return self.__getNodeRotationOrder(self.__jointMap[joint])
+
+    def __getNodeRotationOrder(self, node):
 
-        theJoint = self.__jointMap[joint]
-        fbxRotationOrder = theJoint.RotationOrder.Get()
+        fbxRotationOrder = node.RotationOrder.Get()
         jointRotationOrder = "xyz"
 
-        if jointRotationOrder == fbx.EFbxRotationOrder.eEulerXZY:
+        if fbxRotationOrder == fbx.EFbxRotationOrder.eEulerXZY:
             jointRotationOrder = "xzy"
-        elif jointRotationOrder == fbx.EFbxRotationOrder.eEulerYXZ:
+        elif fbxRotationOrder == fbx.EFbxRotationOrder.eEulerYXZ:
             jointRotationOrder = "yxz"
-        elif jointRotationOrder == fbx.EFbxRotationOrder.eEulerYZX:
+        elif fbxRotationOrder == fbx.EFbxRotationOrder.eEulerYZX:
             jointRotationOrder = "yzx"
-        elif jointRotationOrder == fbx.EFbxRotationOrder.eEulerZXY:
+        elif fbxRotationOrder == fbx.EFbxRotationOrder.eEulerZXY:
             jointRotationOrder = "zxy"
-        elif jointRotationOrder == fbx.EFbxRotationOrder.eEulerZYX:
+        elif fbxRotationOrder == fbx.EFbxRotationOrder.eEulerZYX:
             jointRotationOrder = "zyx"
 
         return jointRotationOrder
@@ -1,12 +1,21 @@
 import numpy as np
 import FBXMotionToolkit as fmt
 import matplotlib.pyplot as plt
-import math
+import json
 import JointDataClasses
+import curveTools as ct
+import distanceMetrics as dm
+import plottingTools as pt
 import sys
+from scipy.spatial.transform import Rotation as R
 
 class JointData():
 
+    # the type of data compared by the metrics in distanceMetrics, and the metric used unless another is set with
+    # setDifferenceMetric().  Classes without a metric type can't measure the difference between frames.
+    metricType = None
+    defaultMetric = None
+
     def __init__(self, joints, axisLabels, data):
 
         self.data = np.array(data)
@@ -14,6 +23,11 @@ class JointData():
         self.axisLabels = axisLabels
         self.dataType = "type not specified"
         self.plotColors = ["r", "g", "b", "c", "m", "y", "tab:orange", "tab:brown", "k"]
+        self.differenceMetric = self.defaultMetric
+
+        # array with spare capacity for appended frames, data is a view of its used frames
+        self.__frameBuffer = None
+        self.__frameBufferOwner = None
 
     def getJointCount(self):
         return self.data.shape[0]
@@ -25,8 +39,8 @@ class JointData():
         return self.data.shape[2]
 
     def checkHasDifferenceFunction(self):
-        # check if joint type has a similarity matrix
-        if not hasattr(self, "getDifferenceBetweenFrames"):
+        # check if joint type has a distance metric for measuring the difference between frames
+        if self.metricType is None:
             return False
         else:
             return True
@@ -70,6 +84,105 @@ class JointData():
             sys.exit()
         return True
 
+    # Sets the metric used to measure the difference between frames, by name, e.g. "geodesic" or "chordal" for
+    # quaternions.  The metrics available for each class are listed by distanceMetrics.getMetricNames(metricType).
+    def setDifferenceMetric(self, metric):
+        self.__getMetricKernel(metric)
+        self.differenceMetric = metric
+
+    def __getMetricKernel(self, metric):
+        if self.checkHasDifferenceFunction() == False:
+            raise ValueError("Joint data of type " + self.dataType + " doesn't support measuring differences between frames")
+        return dm.getMetric(metric, self.metricType)
+
+    # Function retrieves the distance between individual frames of specified joints, using the difference metric.
+    # Frames can be within the same motion sequence or from two different motion sequences.
+    # If given multiple joints it will give you the sum of the difference of all the joints supplied
+    def getDifferenceBetweenFrames(self, jointList, firstMotionFrame, secondMotionJointData, secondMotionFrame):
+
+        kernel = self.__getMetricKernel(self.differenceMetric)
+        dist = 0.
+
+        for joint in jointList:
+
+            v1 = self.data[self.joints.index(joint), :, firstMotionFrame]
+            v2 = secondMotionJointData.data[secondMotionJointData.joints.index(joint), :, secondMotionFrame]
+
+            dist += float(kernel(v1, v2))
+
+        return dist
+
+    # Returns the difference between every frame of this motion and every frame of a second motion as an array of
+    # shape (frames, second motion frames), the same as calling getDifferenceBetweenFrames for every pair of frames.
+    # firstMotionFrames and secondMotionFrames optionally select the frames of each motion, e.g. as slices, to limit
+    # the size of the result.
+    def getDifferenceMatrix(self, jointList, secondMotionJointData, firstMotionFrames=slice(None), secondMotionFrames=slice(None)):
+
+        kernel = self.__getMetricKernel(self.differenceMetric)
+        differenceMatrix = 0.
+
+        for joint in jointList:
+
+            v1 = self.data[self.joints.index(joint)].transpose()[firstMotionFrames]
+            v2 = secondMotionJointData.data[secondMotionJointData.joints.index(joint)].transpose()[secondMotionFrames]
+
+            differenceMatrix = differenceMatrix + kernel(v1[:, np.newaxis, :], v2[np.newaxis, :, :])
+
+        return differenceMatrix
+
+    # Returns the difference between each frame of this motion and the same frame of a second motion with the same
+    # number of frames, as an array of shape (frames,).
+    def getFrameDifferences(self, jointList, secondMotionJointData):
+
+        kernel = self.__getMetricKernel(self.differenceMetric)
+        differences = np.zeros(self.getFrameCount())
+
+        for joint in jointList:
+
+            v1 = self.data[self.joints.index(joint)].transpose()
+            v2 = secondMotionJointData.data[secondMotionJointData.joints.index(joint)].transpose()
+
+            differences += kernel(v1, v2)
+
+        return differences
+
+    # Appends frames to the end of the joint data, e.g. as a motion is captured.  frameData has shape (joints, axes, frames).
+    # Data is kept in an array with spare capacity that grows geometrically, so appending a few frames at a time only
+    # copies the existing frames occasionally.  data remains a numpy array of every frame.
+    def appendFrames(self, frameData):
+
+        frameData = np.asarray(frameData, dtype=float).reshape(self.getJointCount(), self.getAxisCount(), -1)
+        frameCount = self.getFrameCount()
+        newFrameCount = frameCount + frameData.shape[2]
+
+        # the buffer can only be written to if data is still a view of it, and it isn't shared with a copy of this object
+        buffer = self.__frameBuffer
+        if buffer is None or self.data.base is not buffer or self.__frameBufferOwner != id(self) or buffer.shape[2] < newFrameCount:
+            buffer = np.empty(self.data.shape[:2] + (max(newFrameCount, 2 * frameCount, 64),))
+            buffer[:, :, :frameCount] = self.data
+            self.__frameBuffer = buffer
+            self.__frameBufferOwner = id(self)
+
+        buffer[:, :, frameCount:newFrameCount] = frameData
+        self.data = buffer[:, :, :newFrameCount]
+
+    # Finds the fewest frames of each joint that reproduce all its frames within a tolerance when linearly interpolated
+    # between, see curveTools.reduceKeys().  The axes of a joint keep the same frames.  tolerance is in the units of
+    # the data, as a single value or an array broadcast to shape (joints, axes).  Returns a list of the kept frames of
+    # each joint, and a dictionary of joint -> reduction statistics, see curveTools.getReductionStatistics().
+    def getReducedKeys(self, tolerance):
+
+        frames = np.arange(self.getFrameCount())
+        isKept = ct.reduceKeys(frames, self.data, tolerance)
+        maxErrors = ct.getReductionErrors(frames, self.data, isKept)
+
+        keyFrames = [np.flatnonzero(isKept[j]) for j in range(self.getJointCount())]
+        statistics = {}
+        for j in range(self.getJointCount()):
+            statistics[self.joints[j]] = ct.getReductionStatistics(self.getAxisCount() * self.getFrameCount(), self.getAxisCount() * len(keyFrames[j]), maxErrors[j])
+
+        return keyFrames, statistics
+
     # returns all the frame data for a given joint and axis as a numpy array
     def getJointAxisData(self, joint, axis):
         jointIndex = self.joints.index(joint)
@@ -137,77 +250,141 @@ class JointData():
 
         fmt.writeDataToCSV(outputFile, data, header)
 
+    # function exports joint data to a binary .npz file, which can be loaded again using loadJointDataNPZ().
+    def exportJointDataNPZ(self, outputFile):
+
+        metadata = {"className": self.__class__.__name__,
+                    "joints": list(self.joints),
+                    "axisLabels": list(self.axisLabels),
+                    "dataType": self.dataType,
+                    "differenceMetric": self.differenceMetric,
+                    }
+        for attribute in ["baseJoint", "order"]:
+            if hasattr(self, attribute):
+                metadata[attribute] = getattr(self, attribute)
+
+        np.savez(outputFile, data=self.data, metadata=np.array(json.dumps(metadata)))
+
+    # Plots every axis of a joint against frames.  Motions longer than the resolution are drawn as the band between
+    # the smallest and largest values of each axis, see plottingTools.drawCurves().  Optional keyword arguments:
+    #   title, figureSize - title and size in inches of the figure
+    #   outputFile - if given, the plot is rendered to this file without opening a window, see plottingTools.renderCurves()
+    #   resolution - largest number of points drawn for each axis, default 4000
     def plotJointData(self, joint, **kwargs):
 
         jointIndex = self.joints.index(joint)
         plotTitle = kwargs.get("title", fmt.getJointTitle(joint) + " " + self.dataType)
         figureSize = kwargs.get("figureSize", (7,3))
+        resolution = kwargs.get("resolution", 4000)
 
-        x = np.arange(0, self.getFrameCount())
+        if kwargs.get("outputFile") is not None:
+            pt.renderCurves(self.data[jointIndex], kwargs["outputFile"], labels=self.axisLabels, colors=self.plotColors,
+                            title=plotTitle, figureSize=figureSize, resolution=resolution)
+            return
 
         fig, ax = plt.subplots(figsize=figureSize)
 
-        for a in range(self.getAxisCount()):
-
-            ax.plot(x, self.data[jointIndex, a], c=self.plotColors[a])
-
+        pt.drawCurves(ax, self.data[jointIndex], labels=self.axisLabels, colors=self.plotColors, resolution=resolution)
         ax.set(xlabel='Frames', ylabel='Value', title=plotTitle)
-        ax.legend(self.axisLabels, bbox_to_anchor =(1, 1))
 
         plt.tight_layout()
         plt.show()
 
+# loads joint data saved using exportJointDataNPZ(), returning an object of the same joint data class that was saved
+def loadJointDataNPZ(file):
+
+    with np.load(file, allow_pickle=False) as jointDataFile:
+        metadata = json.loads(str(jointDataFile["metadata"]))
+        data = jointDataFile["data"]
+
+    # classes whose constructors take arguments beyond the joints, axis labels and data
+    extraArguments = {"JointDataRelativeTranslations": ["baseJoint"],
+                      "JointDataVectorSpeed": ["dataType"],
+                      "JointDataVectorVelocity": ["dataType"],
+                      "JointDataDifferential": ["dataType", "order"],
+                      }
+
+    jointDataClass = getattr(JointDataClasses, metadata["className"])
+    arguments = [metadata[name] for name in extraArguments.get(metadata["className"], [])]
+    jointData = jointDataClass(metadata["joints"], metadata["axisLabels"], data, *arguments)
+
+    if "dataType" in metadata:
+        jointData.dataType = metadata["dataType"]
+    if "differenceMetric" in metadata:
+        jointData.differenceMetric = metadata["differenceMetric"]
+
+    return jointData
+
 # class inherits joint data to create a class for working with Euler joints
 class JointDataEulers(JointData):
 
+    metricType = "eulers"
+    defaultMetric = "wrappedAngle"
+
     def __init__(self, joints, axisLabels, data):
         JointData.__init__(self, joints, axisLabels, data)
         self.axes = vector3Axes()
         self.dataType = "Eulers"
 
+    # Unrolls the joint angles of every joint axis in place, removing jumps caused by angles wrapping around.
+    # Optional threshold and period keyword arguments default to 340 and 360 degrees.
+    def unroll(self, **kwargs):
+        self.data = ct.unrollAngles(self.data, **kwargs)
+
+    # Converts the rotations of every joint to quaternions, given the rotation order of each joint (e.g. "xyz").
+    def getJointsAsQuaternions(self, rotationOrders):
+
+        quaternionData = np.empty((self.getJointCount(), 4, self.getFrameCount()))
+
+        for j in range(self.getJointCount()):
+            jointRotationData = ct.eulersToRotations(self.data[j], rotationOrders[j])
+            quaternionData[j] = jointRotationData.as_quat(canonical=True).transpose()
+
+        axisLabels = ["x", "y", "z", "w"]
+        return JointDataQuaternions(self.joints, axisLabels, quaternionData)
+
+    # Converts the rotations of every joint to rotation matrices, given the rotation order of each joint (e.g. "xyz").
+    # The matrix of each frame is stored row by row, as m00, m01, m02, m10 ... m22.
+    def getJointsAsMatrices(self, rotationOrders):
+
+        matrixData = np.empty((self.getJointCount(), 9, self.getFrameCount()))
+
+        for j in range(self.getJointCount()):
+            jointRotationData = ct.eulersToRotations(self.data[j], rotationOrders[j])
+            matrixData[j] = jointRotationData.as_matrix().reshape(-1, 9).transpose()
+
+        axisLabels = ["m00", "m01", "m02", "m10", "m11", "m12", "m20", "m21", "m22"]
+        return JointDataMatrices(self.joints, axisLabels, matrixData)
+
 # class inherits joint data to create a class for working with Quaternion joint data
 class JointDataQuaternions(JointData):
 
+    metricType = "quaternions"
+    defaultMetric = "geodesic"
+
     def __init__(self, joints, axisLabels, data):
         JointData.__init__(self, joints, axisLabels, data)
         self.axes = quaternionAxes()
         self.dataType = "Quaternions"
 
-    # Function retrieves the distance between individual frames of specified joints.
-    # Frames can be within the same motion sequence or from two different motion sequences.
-    # If given multiple joints it will give you the sum of the difference of all the joints supplied
-    def getDifferenceBetweenFrames(self, jointList, firstMotionFrame, secondMotionJointData, secondMotionFrame):
+    # Converts the rotations of every joint to Euler angles in degrees, given the rotation order of each joint (e.g. "xyz").
+    # Angles are within -180 to 180 degrees, use unroll() on the result to remove jumps where angles wrap around.
+    def getJointsAsEulers(self, rotationOrders):
 
-        dist = 0.
-
-        for joint in jointList:
+        eulerData = np.empty((self.getJointCount(), 3, self.getFrameCount()))
 
-            q1 = self.getJointFrameData(joint, firstMotionFrame)
-            q2 = secondMotionJointData.getJointFrameData(joint, secondMotionFrame)
-
-            dot = q1[0] * q2[0] + q1[1] * q2[1] + q1[2] * q2[2] + q1[3] * q2[3]
-
-            if dot > 1:
-                dot = 1
-
-            d = (2 / math.pi) * math.acos(math.fabs(dot))
-
-            dist += d
+        for j in range(self.getJointCount()):
+            jointRotationData = R.from_quat(self.data[j].transpose())
+            eulerData[j] = ct.rotationsToEulers(jointRotationData, rotationOrders[j])
 
-        return dist
+        return JointDataEulers(self.joints, ["x", "y", "z"], eulerData)
 
     # Gets the rotational speed of the joints in degrees per frame as a joint data object with a single axis.
     def getJointsAsRotationalSpeed(self):
 
-        jointSpeedData = []
-        for j in range(self.getJointCount()):
-            jointSpeedData.append([[]])
-
-        for f in range(1, self.getFrameCount()):
-            for j in range(self.getJointCount()):
-                jointFrameSpeed = self.getDifferenceBetweenFrames([self.joints[j]], f - 1, self, f)
-                jointFrameSpeed = jointFrameSpeed * 180.
-                jointSpeedData[j][0].append(jointFrameSpeed)
+        # the geodesic distance is used whichever difference metric is set, as it is the angle rotated
+        quaternions = self.data.transpose(0, 2, 1)
+        jointSpeedData = dm.quaternionGeodesic(quaternions[:, :-1], quaternions[:, 1:])[:, np.newaxis, :] * 180.
 
         axisLabels = ["deg/frame"]
         jointSpeedDataObj = JointDataClasses.JointDataRotationalSpeed(self.joints, axisLabels, jointSpeedData)
@@ -216,6 +393,9 @@ class JointDataQuaternions(JointData):
 # class inherits joint data to create a class containing Matrix joint data
 class JointDataMatrices(JointData):
 
+    metricType = "matrices"
+    defaultMetric = "geodesic"
+
     def __init__(self, joints, axisLabels, data):
         JointData.__init__(self, joints, axisLabels, data)
         self.axes = matrixAxes()
@@ -243,8 +423,24 @@ class JointDataMatrices(JointData):
 
         return jointMatrixData
 
+    # Converts the rotations of every joint to Euler angles in degrees, given the rotation order of each joint (e.g. "xyz").
+    # Angles are within -180 to 180 degrees, use unroll() on the result to remove jumps where angles wrap around.
+    def getJointsAsEulers(self, rotationOrders):
+
+        eulerData = np.empty((self.getJointCount(), 3, self.getFrameCount()))
+
+        for j in range(self.getJointCount()):
+            jointRotationData = R.from_matrix(self.getJointDataAsMatrix(self.joints[j]))
+            eulerData[j] = ct.rotationsToEulers(jointRotationData, rotationOrders[j])
+
+        return JointDataEulers(self.joints, ["x", "y", "z"], eulerData)
+
 # Class for add extra functionality specific to joints represented as vectors
 class JointDataVectors(JointData):
+
+    metricType = "vectors"
+    defaultMetric = "euclidean"
+
     def __init__(self, joints, axisLabels, data):
         JointData.__init__(self, joints, axisLabels, data)
 
@@ -258,32 +454,11 @@ class JointDataVectors(JointData):
 
         return vDist
 
-    def getDifferenceBetweenFrames(self, jointList, inputMotionFrame, targetMotionJointData, targetMotionFrame):
-
-        sumDiff = 0.
-
-        for j in jointList:
-
-            v1 = self.getJointFrameData(j, inputMotionFrame)
-            v2 = targetMotionJointData.getJointFrameData(j, targetMotionFrame)
-
-            vDist = v2 - v1
-            dist = math.sqrt(math.fabs(vDist[0]) + math.fabs(vDist[1]) + math.fabs(vDist[2]))
-            sumDiff += dist
-
-        return sumDiff
-
+    # Gets the speed of the joints as the euclidean distance between the vectors of adjacent frames.
     def getJointVectorsAsSpeed(self):
 
-        jointSpeedData = []
-        for j in range(self.getJointCount()):
-            jointSpeedData.append([[]])
-
-        for f in range(1, self.getFrameCount()):
-            for j in range(self.getJointCount()):
-                vDist = self.getDistanceBetweenFramesAsVector(self.joints[j], f - 1, self, f)
-                dis = math.sqrt(math.fabs(vDist[0]) + math.fabs(vDist[1]) + math.fabs(vDist[2]))
-                jointSpeedData[j][0].append(dis)
+        vectors = self.data.transpose(0, 2, 1)
+        jointSpeedData = dm.euclidean(vectors[:, 1:], vectors[:, :-1])[:, np.newaxis, :]
 
         axisLabels = ["$\Delta \Vert V \Vert$"]
         dataType = self.dataType + " Speed"
@@ -292,15 +467,7 @@ class JointDataVectors(JointData):
 
     def getJointVectorsAsVelocityVectors(self):
 
-        jointSpeedData = []
-        for j in range(self.getJointCount()):
-            jointSpeedData.append([[],[],[]])
-
-        for f in range(1, self.getFrameCount()):
-            for j in range(self.getJointCount()):
-                vDist = self.getDistanceBetweenFramesAsVector(self.joints[j], f - 1, self, f)
-                for a in range(3):
-                    jointSpeedData[j][a].append(vDist[a])
+        jointSpeedData = np.diff(self.data, axis=2)
 
         axisLabels = ["$\Delta x$", "$\Delta y$", "$\Delta z$"]
         dataType = self.dataType + " Velocity"
@@ -335,35 +502,27 @@ class JointDataRelativeTranslations(JointDataVectors):
         baseJointName = fmt.getJointTitle(baseJoint)
         self.dataType = "Translations Relative to " + baseJointName
 
-class JointDataSpeed(JointData):
+# class inherits joint data to create a class with joints parameterised as translations in the local space of their parent,
+# as stored in the joint's translation curves
+class JointDataLocalTranslations(JointDataVectors):
+
     def __init__(self, joints, axisLabels, data):
         JointData.__init__(self, joints, axisLabels, data)
+        self.axes = vector3Axes()
+        self.dataType = "Local Translations"
 
-    def getDifferenceBetweenFrames(self, jointList, firstMotionFrame, secondMotionJointData, secondMotionFrame):
-
-        sumDiff = 0.
-
-        for j in jointList:
-
-            s1 = self.getJointFrameData(j, firstMotionFrame)
-            s2 = secondMotionJointData.getJointFrameData(j, secondMotionFrame)
-
-            dif = math.fabs(s1[0] - s2[0])
+class JointDataSpeed(JointData):
 
-            sumDiff += dif
+    # speeds have a single axis, so the euclidean distance is the absolute difference between speeds
+    metricType = "vectors"
+    defaultMetric = "euclidean"
 
-        return sumDiff
+    def __init__(self, joints, axisLabels, data):
+        JointData.__init__(self, joints, axisLabels, data)
 
     def getJointsAsDifferentials(self):
 
-        jointSpeedData = []
-        for j in range(self.getJointCount()):
-            jointSpeedData.append([[]])
-
-        for f in range(1, self.getFrameCount()):
-            for j in range(self.getJointCount()):
-                jointFrameSpeed = self.getDifferenceBetweenFrames([self.joints[j]], f - 1, self, f)
-                jointSpeedData[j][0].append(jointFrameSpeed)
+        jointSpeedData = np.fabs(np.diff(self.data, axis=2))
 
         axisLabels = ["$\Delta s$"]
         order = self.order + 1
@@ -0,0 +1,238 @@
+import os
+import time
+import traceback
+import functools
+import collections
+import multiprocessing
+import JointDataClasses as jc
+
+# FBXSequence functions that write a file given as their first argument.  The folder of the file is created if needed
+# and the file is added to the outputs of the result.
+exportFunctions = ["export", "exportMotionContainer", "exportJointInfo"]
+
+# FBX manager belonging to the current worker process.  It is created once by initialiseWorker and reused
+# for every file the worker processes, rather than creating a new manager for each file.
+workerManager = None
+
+# The result of processing a single file in a batch
+class BatchResult():
+
+    def __init__(self, file):
+        self.file = file
+        self.outputs = []
+        self.error = None
+        self.duration = 0.
+
+    def succeeded(self):
+        return self.error is None
+
+# The result of exporting a single file with exportFiles, adding the time taken to write the FBX file and its size
+class ExportResult(BatchResult):
+
+    def __init__(self, file):
+        BatchResult.__init__(self, file)
+        self.outputFile = None
+        self.writeTime = 0.
+        self.fileSize = 0
+
+# Processes a list of FBX files across a pool of worker processes, applying the same list of steps to each file,
+# and yields a BatchResult for each file as soon as it completes, so results are not in the order of fileList.
+# Each step is a tuple of an FBXSequence function name followed by its arguments, for example:
+#   [("mapJoints", "jointMap.csv"), ("unrollAllJoints",), ("resample", 120), ("getJointRotationAsQuaternions", joints)]
+# Joint data returned by a step is added to the outputs of the result.  String arguments may contain {name}, which is
+# replaced with the file name without its extension, e.g. ("export", "aligned/{name}.fbx").
+# A file that fails is reported through the error of its result and doesn't stop the rest of the batch.
+# Optional keyword arguments:
+#   workers - number of worker processes, defaults to the number of CPUs.  1 processes files in the calling process.
+#   outputFolder - if given, joint data is written to files in this folder and their paths are returned instead
+#   outputFormat - format of joint data files, "npz" (default) or "csv"
+#   animationOnly - import files in animation only mode, see FBXSequence
+def processFiles(fileList, steps, **kwargs):
+
+    workers = kwargs.get("workers", os.cpu_count())
+    outputFolder = kwargs.get("outputFolder")
+    outputFormat = kwargs.get("outputFormat", "npz")
+    animationOnly = kwargs.get("animationOnly", False)
+
+    if outputFolder is not None:
+        os.makedirs(outputFolder, exist_ok=True)
+
+    processor = functools.partial(processFile, steps=steps, outputFolder=outputFolder, outputFormat=outputFormat, animationOnly=animationOnly)
+
+    if workers <= 1:
+        initialiseWorker()
+        try:
+            for file in fileList:
+                yield processor(file)
+        finally:
+            releaseWorker()
+        return
+
+    # files are handed out one at a time so a slow file doesn't hold up a queue of others behind it
+    with multiprocessing.Pool(workers, initializer=initialiseWorker) as pool:
+        for result in pool.imap_unordered(processor, fileList, chunksize=1):
+            yield result
+
+# Applies a list of steps to a single FBX file, returning a BatchResult.  Used by processFiles in each worker.
+def processFile(file, steps, outputFolder=None, outputFormat="npz", animationOnly=False):
+
+    # only import the toolkit inside the worker, as it loads the FBX SDK
+    import FBXMotionToolkit as fmt
+
+    result = BatchResult(file)
+    startTime = time.perf_counter()
+    seq = None
+    name = os.path.splitext(os.path.basename(file))[0]
+
+    try:
+        seq = fmt.importFBXSequence(file, fbxManager=workerManager, animationOnly=animationOnly)
+        _applySteps(seq, steps, name, result, outputFolder, outputFormat)
+
+    except Exception:
+        result.error = traceback.format_exc()
+
+    finally:
+        if seq is not None:
+            seq.destroy()
+
+    result.duration = time.perf_counter() - startTime
+    return result
+
+# Imports FBX files, optionally applies a list of steps to each, then writes each one to a new FBX file, spreading files
+# across a pool of worker processes.  outputFile is the path each file is written to, where {name} is replaced with the
+# file name without its extension, e.g. "aligned/{name}.fbx".  Yields an ExportResult for each file, in the order of
+# fileList, which may be a generator.  At most maxPending files are queued or in progress at any time, so a long or
+# generated file list is read gradually rather than queued all at once.
+# Optional keyword arguments:
+#   steps - steps applied before each file is exported, in the same form as processFiles
+#   workers - number of worker processes, defaults to the number of CPUs.  1 exports files in the calling process.
+#   maxPending - maximum number of files queued or in progress, defaults to twice the number of workers
+#   ascii - write ASCII rather than binary FBX files
+#   embedMedia - embed media such as textures in the exported files, by default they are left out
+#   animationOnly - import files in animation only mode.  Content skipped on import is not exported.
+def exportFiles(fileList, outputFile, **kwargs):
+
+    workers = kwargs.get("workers", os.cpu_count())
+    maxPending = kwargs.get("maxPending", 2 * max(workers, 1))
+
+    exporter = functools.partial(exportFile, outputFile=outputFile, steps=kwargs.get("steps", ()),
+                                 ascii=kwargs.get("ascii", False), embedMedia=kwargs.get("embedMedia", False),
+                                 animationOnly=kwargs.get("animationOnly", False))
+
+    if workers <= 1:
+        initialiseWorker()
+        try:
+            for file in fileList:
+                yield exporter(file)
+        finally:
+            releaseWorker()
+        return
+
+    # files are only handed to the pool while fewer than maxPending are waiting for their results
+    with multiprocessing.Pool(workers, initializer=initialiseWorker) as pool:
+        pending = collections.deque()
+        for file in fileList:
+            pending.append(pool.apply_async(exporter, (file,)))
+            if len(pending) >= maxPending:
+                yield pending.popleft().get()
+        while len(pending) > 0:
+            yield pending.popleft().get()
+
+# Imports a single FBX file, applies a list of steps to it and exports it, returning an ExportResult.  Used by exportFiles in each worker.
+def exportFile(file, outputFile, steps=(), ascii=False, embedMedia=False, animationOnly=False):
+
+    import FBXMotionToolkit as fmt
+
+    result = ExportResult(file)
+    startTime = time.perf_counter()
+    seq = None
+    name = os.path.splitext(os.path.basename(file))[0]
+
+    try:
+        seq = fmt.importFBXSequence(file, fbxManager=workerManager, animationOnly=animationOnly)
+        _applySteps(seq, steps, name, result)
+
+        result.outputFile = _formatArgument(outputFile, name)
+        _makeFolder(result.outputFile)
+
+        writeStartTime = time.perf_counter()
+        seq.export(result.outputFile, ascii, embedMedia)
+        result.writeTime = time.perf_counter() - writeStartTime
+        result.fileSize = os.path.getsize(result.outputFile)
+        result.outputs.append(result.outputFile)
+
+    except Exception:
+        result.error = traceback.format_exc()
+
+    finally:
+        if seq is not None:
+            seq.destroy()
+
+    result.duration = time.perf_counter() - startTime
+    return result
+
+# applies each step to a sequence, adding the joint data and files they output to the outputs of the result
+def _applySteps(seq, steps, name, result, outputFolder=None, outputFormat="npz"):
+
+    for step in steps:
+        functionName = step[0]
+        args = [_formatArgument(arg, name) for arg in step[1:]]
+
+        if functionName in exportFunctions:
+            _makeFolder(args[0])
+
+        output = getattr(seq, functionName)(*args)
+
+        if isinstance(output, jc.JointData):
+            if outputFolder is not None:
+                output = _writeJointData(output, outputFolder, name + "_" + functionName, outputFormat)
+            result.outputs.append(output)
+
+        # joint data extracted from several animation layers is keyed by (stackIndex, layerIndex)
+        elif isinstance(output, dict):
+            for stackIndex, layerIndex in sorted(output.keys()):
+                layerOutput = output[(stackIndex, layerIndex)]
+                if outputFolder is not None:
+                    layerName = "%s_%s_%d_%d" % (name, args[0], stackIndex, layerIndex)
+                    layerOutput = _writeJointData(layerOutput, outputFolder, layerName, outputFormat)
+                result.outputs.append(layerOutput)
+        elif functionName in exportFunctions:
+            result.outputs.append(args[0])
+
+# creates the FBX manager used by the current worker process.  If the SDK can't be loaded the manager is left
+# as None, so the error is reported against each file rather than stopping the pool from starting.
+def initialiseWorker():
+    global workerManager
+    try:
+        import fbx
+        workerManager = fbx.FbxManager.Create()
+    except ImportError:
+        workerManager = None
+
+# destroys the FBX manager used by the current worker process
+def releaseWorker():
+    global workerManager
+    if workerManager is not None:
+        workerManager.Destroy()
+        workerManager = None
+
+def _formatArgument(arg, name):
+    if type(arg) == type("string"):
+        return arg.replace("{name}", name)
+    return arg
+
+def _makeFolder(file):
+    folder = os.path.dirname(file)
+    if folder != "":
+        os.makedirs(folder, exist_ok=True)
+
+def _writeJointData(jointData, outputFolder, fileName, outputFormat):
+
+    if outputFormat == "csv":
+        outputFile = os.path.join(outputFolder, fileName + ".csv")
+        jointData.exportJointDataCSV(outputFile)
+    else:
+        outputFile = os.path.join(outputFolder, fileName + ".npz")
+        jointData.exportJointDataNPZ(outputFile)
+
+    return outputFile
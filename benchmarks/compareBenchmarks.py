@@ -0,0 +1,58 @@
+# Compares two benchmark result files written by runBenchmarks.py, e.g. from before and after a change, showing how
+# the median time and peak memory of each benchmark changed.  Exits with status 1 if any benchmark became slower than
+# the threshold allows, so it can be used to catch regressions.
+# Usage: python benchmarks/compareBenchmarks.py before.json after.json [--threshold 1.1]
+import sys
+import json
+import argparse
+
+def loadResults(file):
+    with open(file) as f:
+        report = json.load(f)
+    return report, {(result["name"], str(result["size"])): result for result in report["results"]}
+
+def compare(beforeFile, afterFile, threshold):
+
+    beforeReport, beforeResults = loadResults(beforeFile)
+    afterReport, afterResults = loadResults(afterFile)
+
+    print("before: %s (%s)   after: %s (%s)" % (beforeReport.get("commit"), beforeReport.get("date"),
+                                                afterReport.get("commit"), afterReport.get("date")))
+    print("%-50s %10s %11s %11s %9s %9s" % ("benchmark", "size", "before", "after", "time", "memory"))
+
+    regressions = []
+    for key in afterResults:
+        if key not in beforeResults:
+            continue
+
+        before = beforeResults[key]
+        after = afterResults[key]
+        timeRatio = after["median"] / before["median"] if before["median"] > 0 else float("inf")
+        memoryRatio = after["peakMemory"] / before["peakMemory"] if before["peakMemory"] > 0 else float("inf")
+
+        flag = ""
+        if timeRatio > threshold:
+            flag = "  slower"
+            regressions.append(key)
+
+        print("%-50s %10s %10.4fs %10.4fs %8.2fx %8.2fx%s" % (key[0], key[1], before["median"], after["median"],
+                                                             timeRatio, memoryRatio, flag))
+
+    missing = [key for key in beforeResults if key not in afterResults]
+    if len(missing) > 0:
+        print("%d benchmarks only in %s" % (len(missing), beforeFile))
+
+    return regressions
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compares two benchmark result files.")
+    parser.add_argument("before", help="results of the baseline run")
+    parser.add_argument("after", help="results of the run being checked")
+    parser.add_argument("--threshold", type=float, default=1.1, help="time ratio above which a benchmark counts as slower, default 1.1")
+    args = parser.parse_args()
+
+    regressions = compare(args.before, args.after, args.threshold)
+    if len(regressions) > 0:
+        print("%d benchmarks slower than the threshold" % len(regressions))
+        sys.exit(1)
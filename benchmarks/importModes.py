@@ -0,0 +1,80 @@
+# Compares the time and memory taken to import the test FBX files with a full import and in animation only mode.
+# Each import runs in a fresh process, so the memory measured belongs to that import alone.
+# Usage: python benchmarks/importModes.py [repeats]
+import os
+import sys
+import glob
+import time
+import statistics
+import multiprocessing
+
+packageFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, packageFolder)
+
+# returns the peak resident memory of the current process in bytes, or None if it can't be measured
+def getPeakMemory():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # linux reports kilobytes, macOS reports bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        return None
+
+def importFile(motionFile, animationOnly, results):
+
+    import FBXMotionToolkit as fmt
+
+    memoryBefore = getPeakMemory()
+    seq = fmt.importFBXSequence(motionFile, animationOnly=animationOnly)
+    memoryAfter = getPeakMemory()
+    seq.destroy()
+
+    memoryUsed = None
+    if memoryBefore is not None:
+        memoryUsed = memoryAfter - memoryBefore
+
+    results.put((seq.importTime, memoryUsed))
+
+def measureImport(motionFile, animationOnly, repeats):
+
+    context = multiprocessing.get_context("spawn")
+    times = []
+    memory = []
+
+    for r in range(repeats):
+        results = context.Queue()
+        process = context.Process(target=importFile, args=(motionFile, animationOnly, results))
+        process.start()
+        importTime, memoryUsed = results.get()
+        process.join()
+        times.append(importTime)
+        if memoryUsed is not None:
+            memory.append(memoryUsed)
+
+    medianMemory = statistics.median(memory) if len(memory) > 0 else None
+    return statistics.median(times), medianMemory
+
+def formatMemory(memoryUsed):
+    if memoryUsed is None:
+        return "n/a"
+    return "%.1f MB" % (memoryUsed / 1024 ** 2)
+
+if __name__ == "__main__":
+
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    motionFiles = sorted(glob.glob(os.path.join(packageFolder, "test", "*.fbx")))
+
+    print("%-16s %12s %12s %12s %12s %8s" % ("file", "full time", "anim time", "full memory", "anim memory", "speedup"))
+
+    for motionFile in motionFiles:
+        fullTime, fullMemory = measureImport(motionFile, False, repeats)
+        animTime, animMemory = measureImport(motionFile, True, repeats)
+        print("%-16s %11.3fs %11.3fs %12s %12s %7.2fx" % (os.path.basename(motionFile), fullTime, animTime,
+                                                          formatMemory(fullMemory), formatMemory(animMemory),
+                                                          fullTime / animTime))
@@ -0,0 +1,317 @@
+# Times the toolkit's core functions on synthetic joint data of increasing size, recording the run time and peak
+# memory of each, and writes the results to a JSON file that can be compared with compareBenchmarks.py.
+# When the FBX SDK is installed, the test FBX files are also imported and extracted.
+# Usage: python benchmarks/runBenchmarks.py [--output results.json] [--repeats 3] [--quick] [--filter name]
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+import contextlib
+import subprocess
+
+packageFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, packageFolder)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import FBXMotionToolkit as fmt
+import similarityTools as st
+import timewarp as tw
+import curveTools as ct
+import poseIndex as pi
+import segmentationTools as sg
+import plottingTools as pt
+import syntheticMotion as sm
+
+# number of joints in the synthetic motions
+jointCount = 4
+
+# Each benchmark takes a size and returns a function to time, so setup isn't included in the measurement.  Benchmarks
+# that change their input, such as FBX operations, instead return (setup, function, cleanup): setup runs before each
+# timed run, untimed, and its result is passed to function and then to cleanup.
+# Sizes are numbers of frames unless stated otherwise, pose index sizes are numbers of 1000 frame clips.
+
+def similarityMatrixQuaternions(frames):
+    motion1 = sm.makeQuaternions(jointCount, frames, seed=1)
+    motion2 = sm.makeQuaternions(jointCount, frames, seed=2)
+    return lambda: st.getSimilarityMatrix(motion1, motion2)
+
+def similarityMatrixVectors(frames):
+    motion1 = sm.makeGlobalTranslations(jointCount, frames, seed=1)
+    motion2 = sm.makeGlobalTranslations(jointCount, frames, seed=2)
+    return lambda: st.getSimilarityMatrix(motion1, motion2)
+
+def distanceSimilarity(frames):
+    motion1 = sm.makeQuaternions(jointCount, frames, seed=1)
+    motion2 = sm.makeQuaternions(jointCount, frames, seed=2)
+    return lambda: st.measureDistanceSimilarity(motion1, motion2)
+
+def selfSimilarityMatrix(frames):
+    motion = sm.makeQuaternions(jointCount, frames, seed=1)
+    return lambda: st.getSelfSimilarityMatrix(motion)
+
+def segmentMotion(frames):
+    motion = sm.makeQuaternions(jointCount, frames, seed=1)
+    return lambda: sg.segmentMotion(motion, kernelSize=32)
+
+def estimatePeriod(frames):
+    motion = sm.makeQuaternions(jointCount, frames, seed=1)
+    return lambda: sg.estimatePeriod(motion)
+
+def accumulatedCostMatrix(frames):
+    costMatrix = np.random.default_rng(0).random((frames, frames))
+    return lambda: tw.accumulatedCostMatrix(costMatrix)
+
+def plotDTW(frames):
+    totalCostMatrix = tw.accumulatedCostMatrix(np.random.default_rng(0).random((frames, frames)))
+    return lambda: tw.plotDTW(totalCostMatrix)
+
+def subsequenceMatchCosts(frames):
+    costMatrix = np.random.default_rng(0).random((60, frames))
+    return lambda: tw.findSubsequenceMatches(costMatrix, 5)
+
+def jointFrameAccess(frames):
+    motion = sm.makeQuaternions(jointCount, frames)
+    def readFrames():
+        for f in range(motion.getFrameCount()):
+            for joint in motion.joints:
+                motion.getJointFrameData(joint, f)
+    return readFrames
+
+def flatJointData(frames):
+    motion = sm.makeQuaternions(jointCount, frames)
+    return lambda: motion.getFlatJointData()
+
+def rotationalSpeed(frames):
+    motion = sm.makeQuaternions(jointCount, frames)
+    return lambda: motion.getJointsAsRotationalSpeed()
+
+def eulersToQuaternions(frames):
+    motion = sm.makeEulers(jointCount, frames)
+    return lambda: motion.getJointsAsQuaternions(["xyz"] * jointCount)
+
+def unrollAngles(frames):
+    angles = (sm.makeEulerArray(jointCount, frames, stepSize=20.) + 180.) % 360. - 180.
+    return lambda: ct.unrollAngles(angles)
+
+def interpolateQuaternions(frames):
+    motion = sm.makeQuaternions(jointCount, frames, seed=1)
+    # every joint is missing the same gaps of 1 to 7 frames, the size of a typical occlusion
+    keyFrames = np.cumsum(np.random.default_rng(0).integers(1, 8, frames))
+    keyFrames = keyFrames[keyFrames < frames]
+    keyQuaternions = motion.data[:, :, keyFrames].transpose(0, 2, 1)
+    return lambda: ct.interpolateQuaternions(keyFrames / 120., keyQuaternions, np.arange(frames) / 120., method="squad")
+
+def reduceKeys(frames):
+    motion = sm.makeEulers(jointCount, frames, seed=1, stepSize=1.)
+    keyFrames = np.arange(frames)
+    return lambda: ct.reduceKeys(keyFrames, motion.data, 0.5)
+
+def exportCSV(frames):
+    motion = sm.makeQuaternions(jointCount, frames)
+    outputFile = os.path.join(tempfile.gettempdir(), "fmtBenchmark.csv")
+    return lambda: motion.exportJointDataCSV(outputFile)
+
+def renderDTW(frames):
+    costMatrix = np.random.default_rng(0).random((frames, frames))
+    outputFile = os.path.join(tempfile.gettempdir(), "fmtBenchmark.png")
+    return lambda: pt.renderDTW(costMatrix, outputFile)
+
+def exportNPZ(frames):
+    motion = sm.makeQuaternions(jointCount, frames)
+    outputFile = os.path.join(tempfile.gettempdir(), "fmtBenchmark.npz")
+    return lambda: motion.exportJointDataNPZ(outputFile)
+
+def poseIndexBuild(clipCount):
+    clips = [sm.makeQuaternions(jointCount, 1000, seed=c) for c in range(clipCount)]
+    def build():
+        index = pi.PoseIndex(10, dimensions=16)
+        for c in range(clipCount):
+            index.addClip(c, clips[c])
+    return build
+
+def poseIndexQuery(clipCount):
+    index = pi.PoseIndex(10, dimensions=16)
+    for c in range(clipCount):
+        index.addClip(c, sm.makeQuaternions(jointCount, 1000, seed=c))
+    index.rebuild()
+    query = sm.makeQuaternions(jointCount, 10, seed=clipCount)
+    return lambda: index.query(query, 5)
+
+# benchmarks that use the test FBX files, sized by file name, which only run if the FBX SDK is installed
+
+def importFBX(motionFile):
+    return lambda: fmt.importFBXSequence(motionFile).destroy()
+
+def extractQuaternions(motionFile):
+    return _withSequence(motionFile, lambda seq: seq.getJointRotationAsQuaternions(list(seq.jointNameMap.keys())))
+
+def extractGlobalTranslations(motionFile):
+    return _withSequence(motionFile, lambda seq: seq.getJointAsGlobalTranslations(list(seq.jointNameMap.keys())))
+
+def resample(motionFile):
+    return _withSequence(motionFile, lambda seq: seq.resample(120))
+
+def fillGaps(motionFile):
+    return _withSequence(motionFile, lambda seq: seq.fillGaps(120))
+
+def reduceFBXKeys(motionFile):
+    return _withSequence(motionFile, lambda seq: seq.reduceKeys())
+
+# imports and maps a fresh sequence for each run outside the timed region, so only the operation itself is measured
+def _withSequence(motionFile, function):
+    def setup():
+        seq = fmt.importFBXSequence(motionFile)
+        try:
+            seq.mapJoints(os.path.join(packageFolder, "test", "jointMap.csv"))
+        except Exception:
+            seq.destroy()
+            raise
+        return seq
+    return setup, function, lambda seq: seq.destroy()
+
+# benchmark functions and the sizes they are run at, as (quick sizes, full sizes)
+benchmarks = {"getSimilarityMatrix.quaternions": (similarityMatrixQuaternions, [50, 100], [100, 200, 400]),
+              "getSimilarityMatrix.vectors": (similarityMatrixVectors, [50, 100], [100, 200, 400]),
+              "measureDistanceSimilarity": (distanceSimilarity, [500, 1000], [1000, 4000, 16000]),
+              "getSelfSimilarityMatrix": (selfSimilarityMatrix, [500, 1000], [1000, 2000, 4000]),
+              "segmentationTools.segmentMotion": (segmentMotion, [10000, 40000], [40000, 160000, 640000]),
+              "segmentationTools.estimatePeriod": (estimatePeriod, [10000, 40000], [40000, 160000, 640000]),
+              "accumulatedCostMatrix": (accumulatedCostMatrix, [50, 100], [100, 200, 400]),
+              "plotDTW": (plotDTW, [100, 200], [200, 800, 3200]),
+              "findSubsequenceMatches": (subsequenceMatchCosts, [10000, 40000], [40000, 160000, 640000]),
+              "JointData.getJointFrameData": (jointFrameAccess, [500, 1000], [1000, 4000, 16000]),
+              "JointData.getFlatJointData": (flatJointData, [500, 1000], [1000, 4000, 16000]),
+              "JointDataQuaternions.getJointsAsRotationalSpeed": (rotationalSpeed, [200, 400], [400, 1600, 6400]),
+              "JointDataEulers.getJointsAsQuaternions": (eulersToQuaternions, [1000, 4000], [4000, 16000, 64000]),
+              "curveTools.unrollAngles": (unrollAngles, [1000, 4000], [4000, 16000, 64000]),
+              "curveTools.interpolateQuaternions": (interpolateQuaternions, [1000, 4000], [4000, 16000, 64000]),
+              "curveTools.reduceKeys": (reduceKeys, [4000, 16000], [16000, 64000, 256000]),
+              "JointData.exportJointDataCSV": (exportCSV, [500, 1000], [1000, 4000, 16000]),
+              "plottingTools.renderDTW": (renderDTW, [500, 2000], [2000, 4000, 8000]),
+              "JointData.exportJointDataNPZ": (exportNPZ, [500, 1000], [1000, 4000, 16000]),
+              "PoseIndex.build": (poseIndexBuild, [5, 10], [10, 40, 160]),
+              "PoseIndex.query": (poseIndexQuery, [5, 10], [10, 40, 160]),
+              }
+
+sdkBenchmarks = {"FBXSequence.import": importFBX,
+                 "FBXSequence.getJointRotationAsQuaternions": extractQuaternions,
+                 "FBXSequence.getJointAsGlobalTranslations": extractGlobalTranslations,
+                 "FBXSequence.resample": resample,
+                 "FBXSequence.fillGaps": fillGaps,
+                 "FBXSequence.reduceKeys": reduceFBXKeys,
+                 }
+
+# times a benchmark, returning the time of each repeat in seconds, then runs it once more to measure its peak memory
+def measure(makeFunction, size, repeats):
+
+    benchmark = makeFunction(size)
+    if type(benchmark) == tuple:
+        setup, function, cleanup = benchmark
+    else:
+        setup, function, cleanup = None, lambda argument: benchmark(), None
+    times = []
+
+    # some functions print progress, which would slow them down and fill the output
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for r in range(repeats):
+            argument = setup() if setup is not None else None
+            try:
+                startTime = time.perf_counter()
+                function(argument)
+                times.append(time.perf_counter() - startTime)
+            finally:
+                if cleanup is not None:
+                    cleanup(argument)
+
+        argument = setup() if setup is not None else None
+        tracemalloc.start()
+        try:
+            startMemory = tracemalloc.get_traced_memory()[0]
+            function(argument)
+            peakMemory = tracemalloc.get_traced_memory()[1] - startMemory
+        finally:
+            tracemalloc.stop()
+            if cleanup is not None:
+                cleanup(argument)
+
+    return times, peakMemory
+
+def isSDKInstalled():
+    try:
+        import fbx
+        return True
+    except ImportError:
+        return False
+
+def getCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=packageFolder, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def runBenchmarks(repeats, quick, nameFilter):
+
+    cases = []
+    for name, (makeFunction, quickSizes, fullSizes) in benchmarks.items():
+        for size in (quickSizes if quick else fullSizes):
+            cases.append((name, makeFunction, size))
+
+    if isSDKInstalled():
+        motionFiles = sorted(glob.glob(os.path.join(packageFolder, "test", "*.fbx")))
+        for name, makeFunction in sdkBenchmarks.items():
+            for motionFile in motionFiles:
+                cases.append((name, makeFunction, motionFile))
+    else:
+        print("FBX SDK not installed, skipping FBX file benchmarks")
+
+    results = []
+    for name, makeFunction, size in cases:
+        if nameFilter is not None and nameFilter not in name:
+            continue
+
+        times, peakMemory = measure(makeFunction, size, repeats)
+        sizeLabel = os.path.basename(size) if type(size) == type("string") else size
+        results.append({"name": name,
+                        "size": sizeLabel,
+                        "median": statistics.median(times),
+                        "min": min(times),
+                        "times": times,
+                        "peakMemory": peakMemory,
+                        })
+        print("%-50s %10s %10.4fs %10.1f KB" % (name, sizeLabel, statistics.median(times), peakMemory / 1024.))
+
+    return results
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmarks the FBXMotionToolkit using synthetic joint data.")
+    parser.add_argument("--output", default="benchmarkResults.json", help="JSON file results are written to")
+    parser.add_argument("--repeats", type=int, default=3, help="number of timed runs of each benchmark")
+    parser.add_argument("--quick", action="store_true", help="only run the smaller sizes")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this text")
+    args = parser.parse_args()
+
+    print("%-50s %10s %11s %13s" % ("benchmark", "size", "median", "peak memory"))
+    results = runBenchmarks(args.repeats, args.quick, args.filter)
+
+    report = {"commit": getCommit(),
+              "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(),
+              "numpy": np.__version__,
+              "platform": platform.platform(),
+              "sdkInstalled": isSDKInstalled(),
+              "repeats": args.repeats,
+              "quick": args.quick,
+              "results": results,
+              }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("results written to " + args.output)
@@ -0,0 +1,40 @@
+# Generates synthetic joint data for benchmarks, without needing the FBX SDK or any motion files.
+# Motions are smooth random walks, so they behave like captured motion when compared or time warped.
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+import FBXMotionToolkit as fmt
+import JointDataClasses as jc
+
+# returns a list of joint names, using the toolkit's standard joint names first
+def makeJointNames(jointCount):
+    standardJoints = [name for name in vars(fmt.joint) if not name.startswith("_")]
+    jointNames = standardJoints[:jointCount]
+    for j in range(len(jointNames), jointCount):
+        jointNames.append("joint" + str(j))
+    return jointNames
+
+# returns Euler angles in degrees of shape (joints, 3, frames), as smooth random walks.
+# Optional keyword arguments: seed (default 0) and stepSize, the standard deviation of each frame's change in degrees (default 2).
+def makeEulerArray(jointCount, frameCount, **kwargs):
+    generator = np.random.default_rng(kwargs.get("seed", 0))
+    steps = generator.normal(0., kwargs.get("stepSize", 2.), (jointCount, 3, frameCount))
+    startAngles = generator.uniform(-180., 180., (jointCount, 3, 1))
+    return startAngles + np.cumsum(steps, axis=2)
+
+def makeEulers(jointCount, frameCount, **kwargs):
+    data = makeEulerArray(jointCount, frameCount, **kwargs)
+    return jc.JointDataEulers(makeJointNames(jointCount), ["x", "y", "z"], data)
+
+def makeQuaternions(jointCount, frameCount, **kwargs):
+    return makeEulers(jointCount, frameCount, **kwargs).getJointsAsQuaternions(["xyz"] * jointCount)
+
+def makeMatrices(jointCount, frameCount, **kwargs):
+    return makeEulers(jointCount, frameCount, **kwargs).getJointsAsMatrices(["xyz"] * jointCount)
+
+# returns global translations that move as smooth random walks.  The stepSize keyword argument is in scene units (default 1).
+def makeGlobalTranslations(jointCount, frameCount, **kwargs):
+    generator = np.random.default_rng(kwargs.get("seed", 0))
+    steps = generator.normal(0., kwargs.get("stepSize", 1.), (jointCount, 3, frameCount))
+    startPositions = generator.uniform(-100., 100., (jointCount, 3, 1))
+    data = startPositions + np.cumsum(steps, axis=2)
+    return jc.JointDataGlobalTranslations(makeJointNames(jointCount), ["x", "y", "z"], data)
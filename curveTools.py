@@ -0,0 +1,329 @@
+import numpy as np
+from scipy.interpolate import CubicSpline
+from scipy.spatial.transform import Rotation as R
+
+# Unrolls angles (degrees by default) along the last axis of an array, removing jumps between adjacent frames
+# that are larger than the threshold by adding or subtracting whole periods.  Works on a single curve or on
+# a stack of curves, such as joint data of shape (joints, axes, frames).
+def unrollAngles(angles, **kwargs):
+
+    threshold = kwargs.get("threshold", 340.)
+    period = kwargs.get("period", 360.)
+
+    angles = np.array(angles, dtype=float)
+    if angles.shape[-1] < 2:
+        return angles
+
+    # each jump past the threshold shifts every following frame by one period in the opposite direction
+    dif = np.diff(angles, axis=-1)
+    steps = (dif < -threshold).astype(float) - (dif > threshold).astype(float)
+    angles[..., 1:] += np.cumsum(steps, axis=-1) * period
+
+    return angles
+
+# Converts Euler angles in degrees of shape (3, frames), held as x, y, z rotations like the curves of an FBX joint,
+# to a scipy Rotation given the joint's rotation order (e.g. "zyx").  scipy reads angles in the order of the rotation
+# sequence rather than x, y, z, so the angles are put in sequence order first.
+def eulersToRotations(eulers, rotationOrder):
+    sequenceAxes = ["xyz".index(axis) for axis in rotationOrder.lower()]
+    return R.from_euler(rotationOrder, np.asarray(eulers, dtype=float)[sequenceAxes].transpose(), degrees=True)
+
+# Converts a scipy Rotation of several frames to Euler angles in degrees of shape (3, frames), held as x, y, z
+# rotations for a joint with the given rotation order, as eulersToRotations() reads them.
+def rotationsToEulers(rotations, rotationOrder):
+    sequenceAxes = ["xyz".index(axis) for axis in rotationOrder.lower()]
+    eulers = np.empty((3, len(rotations)))
+    eulers[sequenceAxes] = rotations.as_euler(rotationOrder, degrees=True).transpose()
+    return eulers
+
+# Spherical linear interpolation between two arrays of quaternions of shape (..., 4), where t is the
+# interpolation weight of the second quaternion (0 to 1) for each quaternion pair.  Quaternions are
+# interpolated along the shortest path.
+def slerp(q0, q1, t):
+
+    q0 = np.asarray(q0, dtype=float)
+    q1 = np.array(q1, dtype=float)
+    t = np.asarray(t, dtype=float)[..., np.newaxis]
+
+    # flip the second quaternion where needed so interpolation takes the shortest path
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    q1 = np.where(dot < 0., -q1, q1)
+    dot = np.clip(np.abs(dot), 0., 1.)
+
+    # fall back to linear interpolation where the quaternions are almost identical
+    theta = np.arccos(dot)
+    sinTheta = np.sin(theta)
+    isSmall = sinTheta < 1e-6
+    safeSinTheta = np.where(isSmall, 1., sinTheta)
+    w0 = np.where(isSmall, 1. - t, np.sin((1. - t) * theta) / safeSinTheta)
+    w1 = np.where(isSmall, t, np.sin(t * theta) / safeSinTheta)
+
+    q = w0 * q0 + w1 * q1
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+# Returns the times in seconds of every frame at a frame rate, from startTime up to and including endTime
+def getFrameTimes(endTime, fps, startTime=0.):
+    frameCount = int(round((endTime - startTime) * fps)) + 1
+    return startTime + np.arange(max(frameCount, 0)) / float(fps)
+
+# Matches each time to its nearest key, where keyTimes is a sorted array of key times.  Returns the index of the
+# nearest key to each time, and a boolean array that is True for each time without a key within tolerance of it.
+# Every time is missing if there are no keys.
+def matchKeys(keyTimes, times, tolerance):
+
+    keyTimes = np.asarray(keyTimes, dtype=float)
+    times = np.asarray(times, dtype=float)
+    if len(keyTimes) == 0:
+        return np.zeros(len(times), dtype=int), np.ones(len(times), dtype=bool)
+
+    upperKeys = np.clip(np.searchsorted(keyTimes, times), 0, len(keyTimes) - 1)
+    lowerKeys = np.maximum(upperKeys - 1, 0)
+    isLowerNearer = np.fabs(times - keyTimes[lowerKeys]) <= np.fabs(keyTimes[upperKeys] - times)
+    nearestKeys = np.where(isLowerNearer, lowerKeys, upperKeys)
+
+    return nearestKeys, np.fabs(keyTimes[nearestKeys] - times) > tolerance
+
+# Returns the gaps in a boolean array of missing frames, such as one returned by matchKeys(), as an array of the
+# first frame of each gap and an array of the number of frames in each gap
+def findGaps(isMissing):
+    changes = np.diff(np.concatenate([[0], np.asarray(isMissing, dtype=np.int8), [0]]))
+    gapStarts = np.flatnonzero(changes == 1)
+    return gapStarts, np.flatnonzero(changes == -1) - gapStarts
+
+# Returns a dictionary of statistics describing the gaps in a boolean array of missing frames:
+#   keys - number of keys, given by keyCount
+#   frames - number of frames
+#   missingFrames - number of frames without a key
+#   gaps - number of runs of missing frames
+#   longestGap - number of frames in the longest gap
+#   gapFrames - list of (first frame, frame count) of each gap
+def getGapStatistics(isMissing, keyCount):
+
+    gapStarts, gapLengths = findGaps(isMissing)
+
+    return {"keys": int(keyCount),
+            "frames": len(isMissing),
+            "missingFrames": int(np.sum(isMissing)),
+            "gaps": len(gapStarts),
+            "longestGap": int(np.max(gapLengths)) if len(gapLengths) > 0 else 0,
+            "gapFrames": [(int(start), int(length)) for start, length in zip(gapStarts, gapLengths)]}
+
+# returns the key before each time, the key after it and the interpolation weight of the key after it.  Times
+# outside the keys are clamped to the first or last key.
+def _getKeyIntervals(keyTimes, times):
+
+    times = np.clip(times, keyTimes[0], keyTimes[-1])
+    upperKeys = np.clip(np.searchsorted(keyTimes, times, side="right"), 1, len(keyTimes) - 1)
+    lowerKeys = upperKeys - 1
+    weights = np.clip((times - keyTimes[lowerKeys]) / (keyTimes[upperKeys] - keyTimes[lowerKeys]), 0., 1.)
+
+    return lowerKeys, upperKeys, weights
+
+# Interpolates curves that share the same key times at a new set of times, e.g. to fill gaps between keys.
+# keyValues is an array of shape (..., keys), such as (joints, axes, keys), and every curve is interpolated at
+# once.  Returns an array of shape (..., times).  Times before the first key or after the last key hold the value
+# of that key.
+# Optional keyword arguments:
+#   method - "cubic" (default) for a cubic spline through the keys, or "linear"
+def interpolateCurves(keyTimes, keyValues, times, **kwargs):
+
+    method = kwargs.get("method", "cubic")
+    if method not in ["cubic", "linear"]:
+        raise ValueError("Curve interpolation must be \"cubic\" or \"linear\": " + str(method))
+
+    keyTimes = np.asarray(keyTimes, dtype=float)
+    keyValues = np.asarray(keyValues, dtype=float)
+    times = np.asarray(times, dtype=float)
+
+    if len(keyTimes) == 1:
+        return np.repeat(keyValues, len(times), axis=-1)
+
+    if method == "cubic" and len(keyTimes) > 2:
+        return CubicSpline(keyTimes, keyValues, axis=-1)(np.clip(times, keyTimes[0], keyTimes[-1]))
+
+    lowerKeys, upperKeys, weights = _getKeyIntervals(keyTimes, times)
+    return keyValues[..., lowerKeys] * (1. - weights) + keyValues[..., upperKeys] * weights
+
+# Flips the sign of quaternions of shape (..., keys, 4) where needed, so each quaternion is in the same hemisphere as
+# the one before it and interpolating between neighbours takes the shortest path.  Returns a new array.
+def alignQuaternions(quaternions):
+
+    quaternions = np.array(quaternions, dtype=float)
+    dot = np.sum(quaternions[..., 1:, :] * quaternions[..., :-1, :], axis=-1)
+    signs = np.cumprod(np.where(dot < 0., -1., 1.), axis=-1)
+    quaternions[..., 1:, :] *= signs[..., np.newaxis]
+
+    return quaternions
+
+# multiplies two arrays of quaternions (x, y, z, w) of shape (..., 4)
+def _multiplyQuaternions(q0, q1):
+
+    x0, y0, z0, w0 = np.moveaxis(q0, -1, 0)
+    x1, y1, z1, w1 = np.moveaxis(q1, -1, 0)
+
+    return np.stack([w0 * x1 + x0 * w1 + y0 * z1 - z0 * y1,
+                     w0 * y1 - x0 * z1 + y0 * w1 + z0 * x1,
+                     w0 * z1 + x0 * y1 - y0 * x1 + z0 * w1,
+                     w0 * w1 - x0 * x1 - y0 * y1 - z0 * z1], axis=-1)
+
+# returns the logarithm of unit quaternions of shape (..., 4) as vectors of shape (..., 3)
+def _quaternionLog(q):
+
+    vectorLength = np.linalg.norm(q[..., :3], axis=-1, keepdims=True)
+    angle = np.arctan2(vectorLength, q[..., 3:])
+    return q[..., :3] * np.where(vectorLength < 1e-12, 1., angle / np.maximum(vectorLength, 1e-12))
+
+# returns the exponential of vectors of shape (..., 3) as unit quaternions of shape (..., 4)
+def _quaternionExp(v):
+
+    angle = np.linalg.norm(v, axis=-1, keepdims=True)
+    scale = np.where(angle < 1e-12, 1., np.sin(angle) / np.maximum(angle, 1e-12))
+    return np.concatenate([v * scale, np.cos(angle)], axis=-1)
+
+# Returns the inner control quaternions used by squad interpolation for quaternions (x, y, z, w) of shape
+# (..., keys, 4), which should be aligned using alignQuaternions().  The first and last keys are their own control
+# quaternions.
+def getSquadControlPoints(quaternions):
+
+    controlPoints = np.array(quaternions, dtype=float)
+    if quaternions.shape[-2] < 3:
+        return controlPoints
+
+    current = quaternions[..., 1:-1, :]
+    inverse = current * np.array([-1., -1., -1., 1.])
+    tangent = (_quaternionLog(_multiplyQuaternions(inverse, quaternions[..., 2:, :])) +
+               _quaternionLog(_multiplyQuaternions(inverse, quaternions[..., :-2, :])))
+    controlPoints[..., 1:-1, :] = _multiplyQuaternions(current, _quaternionExp(-0.25 * tangent))
+
+    return controlPoints
+
+# Interpolates quaternions (x, y, z, w) that share the same key times at a new set of times, e.g. to fill gaps in
+# joint rotations.  keyQuaternions is an array of shape (..., keys, 4), such as (joints, keys, 4), and every joint
+# is interpolated at once.  Returns unit quaternions of shape (..., times, 4).  Times before the first key or after
+# the last key hold the rotation of that key.
+# Optional keyword arguments:
+#   method - "slerp" (default) for spherical linear interpolation between neighbouring keys, or "squad" for
+#            spherical cubic interpolation, which is smooth through the keys
+def interpolateQuaternions(keyTimes, keyQuaternions, times, **kwargs):
+
+    method = kwargs.get("method", "slerp")
+    if method not in ["slerp", "squad"]:
+        raise ValueError("Quaternion interpolation must be \"slerp\" or \"squad\": " + str(method))
+
+    keyTimes = np.asarray(keyTimes, dtype=float)
+    keyQuaternions = alignQuaternions(keyQuaternions)
+    times = np.asarray(times, dtype=float)
+
+    if len(keyTimes) == 1:
+        return np.repeat(keyQuaternions, len(times), axis=-2)
+
+    lowerKeys, upperKeys, weights = _getKeyIntervals(keyTimes, times)
+    quaternions = slerp(keyQuaternions[..., lowerKeys, :], keyQuaternions[..., upperKeys, :], weights)
+
+    if method == "squad":
+        controlPoints = getSquadControlPoints(keyQuaternions)
+        controlQuaternions = slerp(controlPoints[..., lowerKeys, :], controlPoints[..., upperKeys, :], weights)
+        quaternions = slerp(quaternions, controlQuaternions, 2. * weights * (1. - weights))
+
+    return quaternions
+
+# returns the absolute difference between every key of curves of shape (..., keys) and the straight lines joining
+# the kept keys either side of it, where isKept is a boolean array of shape (..., keys) broadcast against keyValues
+def _getLinearErrors(keyTimes, keyValues, isKept):
+
+    keyCount = len(keyTimes)
+    keyIndices = np.arange(keyCount)
+    previousKeys = np.maximum.accumulate(np.where(isKept, keyIndices, 0), axis=-1)
+    nextKeys = np.flip(np.minimum.accumulate(np.flip(np.where(isKept, keyIndices, keyCount - 1), axis=-1), axis=-1), axis=-1)
+
+    spans = keyTimes[nextKeys] - keyTimes[previousKeys]
+    weights = np.where(spans > 0., (keyTimes - keyTimes[previousKeys]) / np.where(spans > 0., spans, 1.), 0.)
+
+    keyValues, previousKeys, nextKeys, weights = np.broadcast_arrays(keyValues, previousKeys, nextKeys, weights)
+    interpolated = np.take_along_axis(keyValues, previousKeys, -1) * (1. - weights) + np.take_along_axis(keyValues, nextKeys, -1) * weights
+
+    return np.fabs(keyValues - interpolated)
+
+# Reduces the keys of curves while keeping the error of linear interpolation between the remaining keys within a
+# tolerance, using the Douglas-Peucker algorithm.  keyValues is an array of shape (..., channels, keys), such as joint
+# data of shape (joints, axes, frames), and the channels of each curve keep the same keys, so a key is kept if any
+# channel needs it.  Every segment of every curve is split at its worst key in the same pass, so all the curves are
+# reduced at once, and only the keys of segments that were split are measured again.  The first and last keys are
+# always kept.  A single curve of shape (keys) has one channel.
+# Returns a boolean array of shape (..., keys) that is True for each key kept.
+# tolerance - largest error allowed, a single value or an array of tolerances broadcast to shape (..., channels)
+def reduceKeys(keyTimes, keyValues, tolerance):
+
+    keyTimes = np.asarray(keyTimes, dtype=float)
+    keyValues = np.asarray(keyValues, dtype=float)
+    if keyValues.ndim == 1:
+        keyValues = keyValues[np.newaxis]
+    tolerance = np.broadcast_to(np.asarray(tolerance, dtype=float), keyValues.shape[:-1])
+    if np.any(tolerance <= 0.):
+        raise ValueError("Key reduction tolerance must be greater than 0")
+
+    keyCount = keyValues.shape[-1]
+    curveShape = keyValues.shape[:-2]
+    channelCount = keyValues.shape[-2]
+
+    # the curves are joined end to end with the channels of each key together, so every key has a flat index
+    flatValues = np.moveaxis(keyValues, -1, -2).reshape(-1, channelCount)
+    flatTolerance = tolerance.reshape(-1, channelCount)
+    isKept = np.zeros(flatValues.shape[0], dtype=bool)
+    isKept[0::keyCount] = True
+    isKept[keyCount - 1::keyCount] = True
+
+    # keys in segments that may still need splitting, which is every key at first
+    activeKeys = np.flatnonzero(~isKept)
+
+    while len(activeKeys) > 0:
+
+        # the kept keys either side of each active key
+        keptKeys = np.flatnonzero(isKept)
+        segments = np.searchsorted(keptKeys, activeKeys)
+        previousKeys = keptKeys[segments - 1]
+        nextKeys = keptKeys[segments]
+
+        previousTimes = keyTimes[previousKeys % keyCount]
+        spans = keyTimes[nextKeys % keyCount] - previousTimes
+        weights = ((keyTimes[activeKeys % keyCount] - previousTimes) / np.where(spans > 0., spans, 1.))[:, np.newaxis]
+        interpolated = flatValues[previousKeys] * (1. - weights) + flatValues[nextKeys] * weights
+
+        # the error of each key as a fraction of its tolerance, in the channel with the largest error
+        errors = np.max(np.fabs(flatValues[activeKeys] - interpolated) / flatTolerance[activeKeys // keyCount], axis=1)
+
+        # active keys are in order, so each segment is a run of them
+        isSegmentStart = np.concatenate([[True], segments[1:] != segments[:-1]])
+        segmentIndices = np.cumsum(isSegmentStart) - 1
+        segmentErrors = np.maximum.reduceat(errors, np.flatnonzero(isSegmentStart))
+
+        isSplit = segmentErrors[segmentIndices] > 1.
+        worstKeys = np.flatnonzero(isSplit & (errors == segmentErrors[segmentIndices]))
+        # only the first of keys with equal errors splits a segment
+        worstKeys = worstKeys[np.unique(segmentIndices[worstKeys], return_index=True)[1]]
+        isKept[activeKeys[worstKeys]] = True
+
+        activeKeys = activeKeys[isSplit & ~isKept[activeKeys]]
+
+    return isKept.reshape(curveShape + (keyCount,))
+
+# Returns the largest error of linear interpolation between the kept keys of curves of shape (..., channels, keys),
+# where isKept is a boolean array of shape (..., keys) such as one returned by reduceKeys().  Returns an array of
+# shape (..., channels).
+def getReductionErrors(keyTimes, keyValues, isKept):
+    keyValues = np.asarray(keyValues, dtype=float)
+    return np.max(_getLinearErrors(np.asarray(keyTimes, dtype=float), keyValues, np.asarray(isKept)[..., np.newaxis, :]), axis=-1)
+
+# Returns a dictionary of statistics describing the reduction of the keys of a joint's curves:
+#   keys - number of keys before reduction, across all the curves
+#   reducedKeys - number of keys after reduction, across all the curves
+#   compressionRatio - keys divided by reducedKeys
+#   maxError - largest error of any curve
+#   axisMaxErrors - list of the largest error of each curve
+def getReductionStatistics(keyCount, reducedKeyCount, axisMaxErrors):
+
+    return {"keys": int(keyCount),
+            "reducedKeys": int(reducedKeyCount),
+            "compressionRatio": keyCount / float(reducedKeyCount) if reducedKeyCount > 0 else 1.,
+            "maxError": float(np.max(axisMaxErrors)) if len(axisMaxErrors) > 0 else 0.,
+            "axisMaxErrors": [float(error) for error in axisMaxErrors]}
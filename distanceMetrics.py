@@ -0,0 +1,90 @@
+import math
+import numpy as np
+
+# Distance kernels used by joint data classes to measure the difference between frames of a joint.  Each kernel
+# takes two arrays of frames, whose last axis holds the joint's axes, e.g. (frames, 4) for quaternions, and
+# returns the distance between them with the last axis removed.  The arrays are broadcast against each other, so the
+# same kernel compares two single frames, matching pairs of frames, or every frame of one motion with every frame of
+# another when given arrays of shape (m, 1, axes) and (1, n, axes).
+
+# metric name -> {metric type of a joint data class -> kernel}, see registerMetric()
+metrics = {}
+
+# Adds a distance kernel to the registry, so joint data classes of the given metric type can use it by name with
+# JointData.setDifferenceMetric().  Metric types are "quaternions", "matrices", "eulers" and "vectors".
+def registerMetric(name, metricType, kernel):
+    metrics.setdefault(name, {})[metricType] = kernel
+
+# returns the kernel of a metric for a metric type, raising a ValueError listing the available metrics if there isn't one
+def getMetric(name, metricType):
+
+    if metricType not in metrics.get(name, {}):
+        raise ValueError("Metric \"" + str(name) + "\" isn't available for " + str(metricType) + ", use one of " + str(getMetricNames(metricType)))
+
+    return metrics[name][metricType]
+
+# returns the names of the metrics available for a metric type, or of every metric if metricType is None
+def getMetricNames(metricType=None):
+    return [name for name in metrics if metricType is None or metricType in metrics[name]]
+
+# returns the dot products of two broadcast arrays of frames, using a matrix multiplication when every frame of one
+# array is compared with every frame of the other
+def _dot(frames1, frames2):
+    if frames1.ndim == 3 and frames2.ndim == 3 and frames1.shape[1] == 1 and frames2.shape[0] == 1:
+        return frames1[:, 0] @ frames2[0].transpose()
+    return np.einsum("...i,...i->...", frames1, frames2)
+
+# The rotation angle between two quaternions divided by pi, from 0 for the same rotation to 1 for opposite rotations.
+# q and -q are the same rotation.
+def quaternionGeodesic(frames1, frames2):
+    dot = np.minimum(np.fabs(_dot(frames1, frames2)), 1.)
+    return (2 / math.pi) * np.arccos(dot)
+
+# The euclidean distance between the rotation matrices of two quaternions, 2√2 sin(angle / 2), from 0 to 2√2.
+# Cheaper than the geodesic distance, and close to proportional to it for small angles.
+def quaternionChordal(frames1, frames2):
+    dot = np.minimum(np.fabs(_dot(frames1, frames2)), 1.)
+    return 2 * math.sqrt(2) * np.sqrt(1 - dot ** 2)
+
+# The rotation angle between two rotation matrices stored row by row divided by pi, as quaternionGeodesic()
+def matrixGeodesic(frames1, frames2):
+    # the trace of R1ᵀR2 is the sum of the products of matching elements
+    cosine = np.clip(0.5 * (_dot(frames1, frames2) - 1), -1., 1.)
+    return np.arccos(cosine) / math.pi
+
+# The euclidean distance between vectors, or between rotation matrices stored row by row
+def euclidean(frames1, frames2):
+    difference = frames1 - frames2
+    return np.sqrt(_dot(difference, difference))
+
+# The sum of the absolute differences of each axis
+def L1(frames1, frames2):
+    return np.sum(np.fabs(frames1 - frames2), axis=-1)
+
+# The square root of the sum of the absolute differences of each axis.  Used by JointDataVectors before metrics
+# could be chosen, kept so earlier results can be reproduced.
+def sqrtL1(frames1, frames2):
+    return np.sqrt(L1(frames1, frames2))
+
+# The euclidean distance between Euler angles in degrees, with the difference of each axis wrapped to within -180 to
+# 180 degrees, so angles either side of ±180 are close together.  Unlike the geodesic distance this depends on the
+# rotation order, but no conversion is needed.
+def wrappedAngle(frames1, frames2):
+    difference = np.mod(frames1 - frames2 + 180., 360.) - 180.
+    return np.sqrt(_dot(difference, difference))
+
+registerMetric("geodesic", "quaternions", quaternionGeodesic)
+registerMetric("chordal", "quaternions", quaternionChordal)
+
+registerMetric("geodesic", "matrices", matrixGeodesic)
+registerMetric("chordal", "matrices", euclidean)
+registerMetric("euclidean", "matrices", euclidean)
+registerMetric("L1", "matrices", L1)
+
+registerMetric("wrappedAngle", "eulers", wrappedAngle)
+registerMetric("euclidean", "eulers", euclidean)
+registerMetric("L1", "eulers", L1)
+
+registerMetric("euclidean", "vectors", euclidean)
+registerMetric("L1", "vectors", L1)
+registerMetric("sqrtL1", "vectors", sqrtL1)
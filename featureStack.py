@@ -0,0 +1,170 @@
+import numpy as np
+from scipy.spatial.distance import cdist
+import poseIndex as pi
+
+# distances that can be used between the frames of feature stacks
+featureStackMetrics = ["euclidean", "sqeuclidean"]
+
+# Combines several joint data objects of the same motion into one weighted feature matrix, so motions can be compared
+# or time warped using several representations at once, e.g. joint rotations together with the root translation.
+# Rotations are represented by their rotation matrices, and vectors by their values, see poseIndex.getFrameFeatures().
+# Each frame's features are stored once in a contiguous array, scaled by the square root of their weight, so the
+# difference between frames is the weighted euclidean distance between their features.  Feature stacks can be used
+# in place of joint data with SimilarityTools.getSimilarityMatrix() and the Timewarp class.
+# Optional keyword arguments:
+#   metric - "euclidean" (default) or "sqeuclidean", the squared euclidean distance
+class FeatureStack():
+
+    def __init__(self, **kwargs):
+
+        self.metric = kwargs.get("metric", "euclidean")
+        if self.metric not in featureStackMetrics:
+            raise ValueError("Feature stack metric must be one of " + str(featureStackMetrics) + ": " + str(self.metric))
+
+        # initialise public properties
+        self.joints = []
+        self.dataType = "Feature Stack"
+        self.features = None
+
+        # initialise private properties
+        self.__representations = []
+        self.__jointColumns = {}
+
+    # Adds a joint data object to the stack.  Every joint data object must have the same number of frames.
+    # Optional keyword arguments:
+    #   weight - weight of the whole representation, default 1
+    #   jointWeights - dictionary of weights of individual joints, joints not listed have a weight of 1
+    #   normalization - "none" (default), "variance" to scale the representation so the total variance of its features
+    #                   is 1, making representations with different units comparable, or a number to scale its features by
+    def addJointData(self, jointData, **kwargs):
+
+        normalization = kwargs.get("normalization", "none")
+        frameFeatures = pi.getFrameFeatures(jointData)
+
+        if normalization == "none":
+            scale = 1.
+        elif normalization == "variance":
+            totalVariance = np.sum(np.var(frameFeatures, axis=0))
+            scale = 1. / np.sqrt(totalVariance) if totalVariance > 0 else 1.
+        elif type(normalization) in [int, float]:
+            scale = float(normalization)
+        else:
+            raise ValueError("Feature stack normalization must be \"none\", \"variance\" or a number: " + str(normalization))
+
+        self.__addRepresentation(jointData, frameFeatures, kwargs.get("weight", 1.), kwargs.get("jointWeights", {}), scale)
+
+    # Returns a new feature stack of a different motion using the same representations, weights and normalization
+    # scales as this stack, so the two can be compared.  jointDataList holds the joint data of the other motion, in
+    # the order it was added to this stack.
+    def getMatchingFeatureStack(self, jointDataList):
+
+        if len(jointDataList) != len(self.__representations):
+            raise ValueError("A matching feature stack needs " + str(len(self.__representations)) + " joint data objects")
+
+        matchingStack = FeatureStack(metric=self.metric)
+        for jointData, representation in zip(jointDataList, self.__representations):
+            if jointData.__class__.__name__ != representation["className"] or list(jointData.joints) != representation["joints"]:
+                raise ValueError("Joint data doesn't match the feature stack representation: " + representation["className"])
+            matchingStack.__addRepresentation(jointData, pi.getFrameFeatures(jointData), representation["weight"],
+                                              representation["jointWeights"], representation["scale"])
+
+        return matchingStack
+
+    def __addRepresentation(self, jointData, frameFeatures, weight, jointWeights, scale):
+
+        if self.features is not None and frameFeatures.shape[0] != self.getFrameCount():
+            raise ValueError("Joint data has " + str(frameFeatures.shape[0]) + " frames, the feature stack has " + str(self.getFrameCount()))
+
+        # the features of each joint are next to each other, see poseIndex.getFrameFeatures()
+        jointCount = jointData.getJointCount()
+        featuresPerJoint = frameFeatures.shape[1] // jointCount
+        columnScales = np.empty(frameFeatures.shape[1])
+        columnStart = 0 if self.features is None else self.features.shape[1]
+
+        for j, joint in enumerate(jointData.joints):
+            columns = slice(j * featuresPerJoint, (j + 1) * featuresPerJoint)
+            columnScales[columns] = np.sqrt(weight * jointWeights.get(joint, 1.)) * scale
+
+            label = jointData.dataType + ":" + joint
+            self.joints.append(label)
+            self.__jointColumns[label] = np.arange(columnStart + columns.start, columnStart + columns.stop)
+
+        scaledFeatures = frameFeatures * columnScales
+        if self.features is None:
+            self.features = np.ascontiguousarray(scaledFeatures)
+        else:
+            self.features = np.ascontiguousarray(np.concatenate([self.features, scaledFeatures], axis=1))
+
+        self.__representations.append({"className": jointData.__class__.__name__,
+                                       "joints": list(jointData.joints),
+                                       "weight": weight,
+                                       "jointWeights": dict(jointWeights),
+                                       "scale": scale,
+                                       })
+
+    def getJointCount(self):
+        return len(self.joints)
+
+    def getFrameCount(self):
+        return 0 if self.features is None else self.features.shape[0]
+
+    def getFeatureCount(self):
+        return 0 if self.features is None else self.features.shape[1]
+
+    # returns the columns of the feature matrix holding a list of joint labels, or None for every joint
+    def __getColumns(self, jointList):
+        if list(jointList) == self.joints:
+            return None
+        return np.concatenate([self.__jointColumns[joint] for joint in jointList])
+
+    # Returns the weighted distance between a frame of this stack and a frame of another stack.  jointList holds
+    # labels from the joints property, e.g. "Quaternions:rhip", and is normally every joint.
+    def getDifferenceBetweenFrames(self, jointList, inputMotionFrame, targetMotionJointData, targetMotionFrame):
+        return float(self.getDifferenceMatrix(jointList, targetMotionJointData, slice(inputMotionFrame, inputMotionFrame + 1))[0, targetMotionFrame])
+
+    # Returns the weighted distance between every frame of this stack and every frame of another stack, as an array
+    # of shape (frames, second motion frames).  firstMotionFrames and secondMotionFrames optionally select the frames
+    # of each stack.
+    def getDifferenceMatrix(self, jointList, secondMotionJointData, firstMotionFrames=slice(None), secondMotionFrames=slice(None)):
+
+        if self.getFeatureCount() != secondMotionJointData.getFeatureCount():
+            raise ValueError("Feature stacks don't have the same features, use getMatchingFeatureStack() to create matching stacks")
+
+        columns = self.__getColumns(jointList)
+        features1 = self.features[firstMotionFrames]
+        features2 = secondMotionJointData.features[secondMotionFrames]
+        if columns is not None:
+            features1 = features1[:, columns]
+            features2 = features2[:, columns]
+
+        return cdist(features1, features2, self.metric)
+
+    # the error checks used by the similarity and time warping functions, as provided by joint data classes
+
+    def checkHasDifferenceFunction(self):
+        return True
+
+    def errorCheckHasDifferenceFunction(self):
+        pass
+
+    def checkMatchingFrameCount(self, targetMotionJointData):
+        return self.getFrameCount() == targetMotionJointData.getFrameCount()
+
+    def errorCheckMatchingFrameCount(self, targetMotionJointData):
+        if self.checkMatchingFrameCount(targetMotionJointData) == False:
+            raise ValueError("The motion sequences do not have matching frame counts")
+
+    def checkMatchingJointCount(self, targetMotionJointData):
+        return self.getJointCount() == targetMotionJointData.getJointCount()
+
+    def errorCheckMatchingJointCount(self, targetMotionJointData):
+        if self.checkMatchingJointCount(targetMotionJointData) == False:
+            raise ValueError("The two sets of joint data do not have matching numbers of joints")
+
+    def checkMatchingClass(self, targetMotionJointData):
+        return self.__class__.__name__ == targetMotionJointData.__class__.__name__
+
+    def errorCheckMatchingClass(self, targetMotionJointData):
+        if self.checkMatchingClass(targetMotionJointData) == False:
+            raise ValueError("The motion sequences do not have matching joint data types")
+        return True
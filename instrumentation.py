@@ -0,0 +1,152 @@
+import sys
+import time
+import pstats
+import cProfile
+import functools
+import threading
+import contextlib
+
+# Progress reporting and timing counters shared by the toolkit.
+#
+# Long running functions report progress through a callback taking (operation, completed, total), which is called at
+# most once per progress interval, plus once on completion.  The default callback prints a percentage to stdout, use
+# setProgressCallback(None) to turn progress off, or pass your own function to send it elsewhere.
+#
+# Timing counters are off by default, when off timed functions only pay for a single flag check.  Once turned on with
+# enableTimings(), the number of calls and total time of each timed operation (import, mapJoints, resample,
+# extraction of each representation, cost matrices, accumulation, backtracking, export ...) are collected and can be
+# read with getTimings().  A timing callback taking (operation, seconds) can also be set to feed your own metrics.
+# Counters belong to the process they were collected in, so worker processes each keep their own.
+
+# prints progress as a percentage on a single line of stdout
+def printProgress(operation, completed, total):
+    percent = int((completed / total) * 100) if total > 0 else 100
+    sys.stdout.write("\rprogress: " + str(percent) + "%")
+    if completed >= total:
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+
+_progressCallback = printProgress
+_progressInterval = 0.5
+
+_timingsEnabled = False
+_timingCallback = None
+_timings = {}
+_timingsLock = threading.Lock()
+
+# sets the function called with (operation, completed, total) as long running operations progress, or None to turn
+# progress reporting off.  Optional keyword argument interval sets the minimum seconds between calls (default 0.5).
+def setProgressCallback(callback, **kwargs):
+    global _progressCallback, _progressInterval
+    _progressCallback = callback
+    _progressInterval = kwargs.get("interval", _progressInterval)
+
+# Reports the progress of a single operation to the progress callback, throttled to the progress interval
+class Progress():
+
+    def __init__(self, operation, total):
+        self.operation = operation
+        self.total = total
+        self.__lastReportTime = None
+
+    def update(self, completed):
+
+        if _progressCallback is None:
+            return
+
+        currentTime = time.perf_counter()
+        if self.__lastReportTime is None or completed >= self.total or currentTime - self.__lastReportTime >= _progressInterval:
+            self.__lastReportTime = currentTime
+            _progressCallback(self.operation, completed, self.total)
+
+# turns timing counters on or off
+def enableTimings(enabled=True):
+    global _timingsEnabled
+    _timingsEnabled = enabled
+
+def isTimingEnabled():
+    return _timingsEnabled
+
+# sets a function called with (operation, seconds) each time a timed operation completes while timings are enabled,
+# or None to remove it
+def setTimingCallback(callback):
+    global _timingCallback
+    _timingCallback = callback
+
+# returns the timing counters as a dictionary keyed by operation name, each holding count, total, mean and max seconds
+def getTimings():
+    with _timingsLock:
+        timings = {}
+        for operation, (count, total, maximum) in _timings.items():
+            timings[operation] = {"count": count, "total": total, "mean": total / count, "max": maximum}
+        return timings
+
+def resetTimings():
+    with _timingsLock:
+        _timings.clear()
+
+# adds the duration of an operation to its timing counter
+def recordTiming(operation, seconds):
+
+    with _timingsLock:
+        count, total, maximum = _timings.get(operation, (0, 0., 0.))
+        _timings[operation] = (count + 1, total + seconds, max(maximum, seconds))
+
+    if _timingCallback is not None:
+        _timingCallback(operation, seconds)
+
+# Times a block of code or a function under an operation name, when timings are enabled.  Use as a context manager:
+#   with ins.timed("myOperation"):
+# or as a decorator:
+#   @ins.timed("myOperation")
+class timed():
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.__startTimes = threading.local()
+
+    def __enter__(self):
+        if _timingsEnabled:
+            if not hasattr(self.__startTimes, "stack"):
+                self.__startTimes.stack = []
+            self.__startTimes.stack.append(time.perf_counter())
+        return self
+
+    def __exit__(self, exceptionType, exceptionValue, traceback):
+        if _timingsEnabled and len(getattr(self.__startTimes, "stack", [])) > 0:
+            recordTiming(self.operation, time.perf_counter() - self.__startTimes.stack.pop())
+
+    def __call__(self, function):
+
+        operation = self.operation
+
+        @functools.wraps(function)
+        def timedFunction(*args, **kwargs):
+            if _timingsEnabled == False:
+                return function(*args, **kwargs)
+            startTime = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                recordTiming(operation, time.perf_counter() - startTime)
+
+        return timedFunction
+
+# Profiles a block of code with cProfile.  The statistics are written to outputFile if given, which can be opened with
+# pstats or tools such as snakeviz, otherwise the slowest functions are printed.  Optional keyword arguments:
+#   sortBy - pstats sort order of printed statistics, default "cumulative"
+#   limit - number of functions printed, default 30
+@contextlib.contextmanager
+def profile(outputFile=None, **kwargs):
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if outputFile is not None:
+            profiler.dump_stats(outputFile)
+        else:
+            stats = pstats.Stats(profiler, stream=sys.stdout)
+            stats.sort_stats(kwargs.get("sortBy", "cumulative")).print_stats(kwargs.get("limit", 30))
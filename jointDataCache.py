@@ -0,0 +1,192 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+import JointDataClasses as jc
+
+# bump when the stored format or the extraction functions change, so old entries are no longer matched
+CACHE_VERSION = "2"
+
+# FBXSequence extraction functions that can be cached, and the arguments each takes after the joint list
+cacheableMethods = {"getJointRotationAsEulers": [],
+                    "getJointRotationAsQuaternions": [],
+                    "getJointRotationAsMatrices": [],
+                    "getJointRotationAsDisplacementVectors": [],
+                    "getJointAsLocalTranslations": [],
+                    "getJointAsGlobalTranslations": ["sampleTimes"],
+                    "getJointAsRelativeTranslations": ["baseJoint", "sampleTimes"],
+                    }
+
+# Caches joint data extracted from FBX files on disk.  Entries are keyed by the content of the FBX file and
+# joint map, the extraction function and its arguments, so a hit never needs the FBX file to be imported.
+# The folder is size bounded, the least recently used entries are removed first, and entries are written
+# atomically so several processes can share the same cache folder.
+class JointDataCache():
+
+    def __init__(self, cacheFolder, **kwargs):
+
+        self.cacheFolder = cacheFolder
+        self.maxSize = kwargs.get("maxSize", 1024 ** 3)
+        self.hits = 0
+        self.misses = 0
+
+        # content hashes of files already seen by this object, keyed by path, size and modification time
+        self.__fileHashes = {}
+
+        os.makedirs(self.cacheFolder, exist_ok=True)
+
+    # Returns joint data extracted from a motion file using a FBXSequence extraction function, importing the file
+    # only if the data isn't already cached.  Optional keyword arguments:
+    #   resampleFPS - resample the motion at this frame rate, up to the last root key, before extraction
+    #   sampleTimes - sample times for translation functions, defaults to the key times of the root x rotation
+    #   baseJoint - base joint for getJointAsRelativeTranslations
+    def getJointData(self, motionFile, jointMapFile, method, jointList, **kwargs):
+
+        if method not in cacheableMethods:
+            raise ValueError("Joint data extraction function can't be cached: " + method)
+
+        if type(jointList) == type("string"):
+            jointList = [jointList]
+
+        cacheFile = self.__getCacheFile(motionFile, jointMapFile, method, jointList, kwargs)
+
+        jointData = self.__readEntry(cacheFile)
+        if jointData is not None:
+            self.hits += 1
+            return jointData
+
+        self.misses += 1
+        jointData = self.__extractJointData(motionFile, jointMapFile, method, jointList, kwargs)
+        self.__writeEntry(cacheFile, jointData)
+        self.__evict()
+
+        return jointData
+
+    # Returns the total size in bytes of the entries in the cache folder
+    def getCacheSize(self):
+        return sum([entry[2] for entry in self.__listEntries()])
+
+    # Removes every entry from the cache folder
+    def clear(self):
+        for entry in self.__listEntries():
+            self.__removeFile(entry[0])
+
+    def __getCacheFile(self, motionFile, jointMapFile, method, jointList, kwargs):
+
+        keyItems = {"version": CACHE_VERSION,
+                    "motion": self.__getFileHash(motionFile),
+                    "jointMap": self.__getFileHash(jointMapFile),
+                    "method": method,
+                    "joints": list(jointList),
+                    "resampleFPS": kwargs.get("resampleFPS"),
+                    "baseJoint": kwargs.get("baseJoint"),
+                    }
+
+        sampleTimes = kwargs.get("sampleTimes")
+        if sampleTimes is not None:
+            keyItems["sampleTimes"] = hashlib.sha256(np.asarray(sampleTimes, dtype=float).tobytes()).hexdigest()
+
+        key = hashlib.sha256(json.dumps(keyItems, sort_keys=True).encode("utf-8")).hexdigest()
+        return os.path.join(self.cacheFolder, key + ".npz")
+
+    def __getFileHash(self, file):
+
+        fileStats = os.stat(file)
+        statKey = (os.path.abspath(file), fileStats.st_size, fileStats.st_mtime_ns)
+
+        if statKey not in self.__fileHashes:
+            fileHash = hashlib.sha256()
+            with open(file, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    fileHash.update(block)
+            self.__fileHashes[statKey] = fileHash.hexdigest()
+
+        return self.__fileHashes[statKey]
+
+    def __extractJointData(self, motionFile, jointMapFile, method, jointList, kwargs):
+
+        # imported here as the toolkit imports this module
+        import FBXMotionToolkit as fmt
+
+        seq = fmt.importFBXSequence(motionFile)
+        try:
+            seq.mapJoints(jointMapFile)
+
+            resampleFPS = kwargs.get("resampleFPS")
+            if resampleFPS is not None:
+                endTime = seq.getTimeOfLastKey(fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x)
+                seq.resample(resampleFPS, endTime)
+
+            args = [jointList]
+            for argName in cacheableMethods[method]:
+                if argName == "sampleTimes" and kwargs.get("sampleTimes") is None:
+                    args.append(seq.getJointKeyTimes(fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x))
+                else:
+                    args.append(kwargs.get(argName))
+
+            jointData = getattr(seq, method)(*args)
+        finally:
+            seq.destroy()
+
+        return jointData
+
+    def __readEntry(self, cacheFile):
+
+        try:
+            jointData = jc.loadJointDataNPZ(cacheFile)
+
+            # touch the entry so it counts as recently used
+            os.utime(cacheFile)
+
+        # entries can be removed by another process at any time, which is treated as a miss
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return jointData
+
+    def __writeEntry(self, cacheFile, jointData):
+
+        # write to a temporary file then rename it, so other processes never read a partly written entry
+        fileHandle, tempFile = tempfile.mkstemp(dir=self.cacheFolder, suffix=".tmp")
+        try:
+            with os.fdopen(fileHandle, "wb") as f:
+                jointData.exportJointDataNPZ(f)
+            os.replace(tempFile, cacheFile)
+        except OSError:
+            # another process may be writing the same entry, in which case its copy is kept
+            self.__removeFile(tempFile)
+
+    # removes the least recently used entries until the cache folder is within its maximum size
+    def __evict(self):
+
+        entries = self.__listEntries()
+        totalSize = sum([entry[2] for entry in entries])
+
+        entries.sort(key=lambda entry: entry[1])
+        for entryFile, lastUsed, size in entries:
+            if totalSize <= self.maxSize:
+                break
+            self.__removeFile(entryFile)
+            totalSize -= size
+
+    # returns a list of (file, last used time, size) for every entry in the cache folder
+    def __listEntries(self):
+
+        entries = []
+        for fileName in os.listdir(self.cacheFolder):
+            if fileName.endswith(".npz"):
+                entryFile = os.path.join(self.cacheFolder, fileName)
+                try:
+                    fileStats = os.stat(entryFile)
+                except OSError:
+                    continue
+                entries.append((entryFile, fileStats.st_mtime, fileStats.st_size))
+
+        return entries
+
+    def __removeFile(self, file):
+        try:
+            os.remove(file)
+        except OSError:
+            pass
@@ -0,0 +1,173 @@
+import os
+import copy
+import multiprocessing
+import numpy as np
+from scipy.spatial.distance import cdist
+import JointDataClasses as jc
+import timewarp as tw
+import instrumentation as ins
+
+# Averages groups of quaternions, returning the rotation closest to every quaternion in its group.  quaternions has
+# shape (count, 4) and groups gives the group of each quaternion, from 0 to groupCount - 1.  The average of a group
+# is the eigenvector with the largest eigenvalue of the sum of the outer products of its quaternions, which treats
+# q and -q as the same rotation.  referenceQuaternions optionally gives a quaternion for each group, whose sign
+# the averages are matched to so consecutive frames don't flip sign.
+def averageQuaternions(quaternions, groups, groupCount, referenceQuaternions=None):
+
+    outerProducts = quaternions[:, :, np.newaxis] * quaternions[:, np.newaxis, :]
+    sums = np.zeros((groupCount, 4, 4))
+    np.add.at(sums, groups, outerProducts)
+
+    averages = np.linalg.eigh(sums)[1][:, :, -1]
+
+    if referenceQuaternions is not None:
+        flip = np.sum(averages * referenceQuaternions, axis=1) < 0
+        averages[flip] *= -1
+
+    return averages
+
+# Averages groups of vectors of shape (count, axes), returning the mean of each group
+def averageVectors(vectors, groups, groupCount):
+
+    sums = np.zeros((groupCount, vectors.shape[1]))
+    np.add.at(sums, groups, vectors)
+    counts = np.bincount(groups, minlength=groupCount)
+
+    return sums / counts[:, np.newaxis]
+
+# Returns the cost matrix of a template and a take used by DTW barycenter averaging, the sum over every joint of the
+# squared chordal distance between quaternions, or the squared euclidean distance between vectors.  These are the
+# distances averageQuaternions() and averageVectors() minimise, so averaging the frames aligned to each template frame
+# can't raise the total cost, which isn't true of the unsquared difference metrics of the joint data.
+# The squared distances are calculated directly: the squared chordal distance is 8(1 - d²), where d is the dot product
+# of the quaternions, and the squared euclidean distances of every joint are summed by comparing all joints at once.
+def getAveragingCostMatrix(template, take):
+
+    if isinstance(template, jc.JointDataQuaternions) == False:
+        return cdist(template.data.reshape(-1, template.getFrameCount()).transpose(),
+                     take.data.reshape(-1, take.getFrameCount()).transpose(), "sqeuclidean")
+
+    squaredDots = np.zeros((template.getFrameCount(), take.getFrameCount()))
+    for j in range(template.getJointCount()):
+        dots = template.data[j].transpose() @ take.data[j]
+        np.square(dots, out=dots)
+        np.minimum(dots, 1., out=dots)
+        squaredDots += dots
+
+    return 8. * (template.getJointCount() - squaredDots)
+
+# aligns a take to a template, returning the alignment path, the cost of the alignment and the DTW map warping the
+# take to the template.  Used by DTWBarycenterAverage in each worker.
+def _alignTake(template, take):
+
+    totalCostMatrix = tw.accumulatedCostMatrix(getAveragingCostMatrix(template, take))
+    path = tw.getDTWPath(totalCostMatrix)
+
+    # the accumulated cost matrix of the take against the template is the transpose of this one
+    DTWremap = tw.plotDTW(totalCostMatrix.transpose())
+
+    return path, totalCostMatrix[-1, -1], DTWremap
+
+# DTW Barycenter Averaging, which builds a template motion that is the average of several takes of the same movement.
+# Every take is aligned to the template using DTW, then each template frame is replaced by the average of the take
+# frames aligned to it, repeating until the total alignment cost stops improving.  As every take is averaged into
+# the template, the result isn't biased towards a single reference take.
+# Takes must be JointDataQuaternions or joint data classes inheriting JointDataVectors, with the same class and joints.
+# Quaternions are averaged as rotations, see averageQuaternions().  Takes are aligned using getAveragingCostMatrix(),
+# whatever the difference metric of the takes, as averaging frames minimises squared distances.  Optional keyword arguments:
+#   initialTemplate - index of the take used as the starting template, defaults to the take with the median frame count.
+#                     The template keeps the frame count of this take.
+#   maxIterations - maximum number of times the template is averaged, default 10
+#   tolerance - averaging stops once the total cost improves by less than this fraction, default 0.001
+#   workers - number of worker processes aligning takes, defaults to the number of CPUs.  1 aligns takes in the calling process.
+class DTWBarycenterAverage():
+
+    def __init__(self, jointDataList, **kwargs):
+
+        takes = list(jointDataList)
+        if len(takes) == 0:
+            raise ValueError("DTW barycenter averaging needs at least one take")
+
+        for take in takes:
+            if take.__class__.__name__ != takes[0].__class__.__name__ or list(take.joints) != list(takes[0].joints):
+                raise ValueError("Every take must have the same joint data class and joints")
+        if isinstance(takes[0], (jc.JointDataQuaternions, jc.JointDataVectors)) == False:
+            raise ValueError("Joint data of type " + takes[0].dataType + " can't be averaged")
+
+        initialTemplate = kwargs.get("initialTemplate", int(np.argsort([take.getFrameCount() for take in takes])[len(takes) // 2]))
+        maxIterations = kwargs.get("maxIterations", 10)
+        tolerance = kwargs.get("tolerance", 0.001)
+        workers = min(kwargs.get("workers", os.cpu_count()), len(takes))
+
+        self.template = copy.copy(takes[initialTemplate])
+        self.template.data = np.array(takes[initialTemplate].data, dtype=float)
+        self.costHistory = []
+        self.iterations = 0
+        self.converged = False
+
+        pool = multiprocessing.Pool(workers) if workers > 1 else None
+        try:
+            alignments = self.__alignTakes(takes, pool)
+
+            for iteration in range(maxIterations):
+                previousTemplate = self.template
+                previousAlignments = alignments
+                previousCost = self.costHistory[-1]
+
+                self.template = self.__averageTakes(takes, alignments)
+                alignments = self.__alignTakes(takes, pool)
+                self.iterations += 1
+
+                # the cost can't rise beyond rounding errors, but the better template is kept if it does
+                if self.costHistory[-1] > previousCost:
+                    self.costHistory.pop()
+                    self.template = previousTemplate
+                    alignments = previousAlignments
+                    self.converged = True
+                    break
+
+                if previousCost - self.costHistory[-1] <= tolerance * previousCost:
+                    self.converged = True
+                    break
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        # alignments of each take against the final template
+        self.paths = [alignment[0] for alignment in alignments]
+        self.costs = [alignment[1] for alignment in alignments]
+        self.DTWremaps = [alignment[2] for alignment in alignments]
+
+    # aligns every take to the current template, in parallel if a pool is given
+    @ins.timed("DTWBarycenterAverage.align")
+    def __alignTakes(self, takes, pool):
+
+        arguments = [(self.template, take) for take in takes]
+        if pool is None:
+            alignments = [_alignTake(*argument) for argument in arguments]
+        else:
+            alignments = pool.starmap(_alignTake, arguments)
+
+        self.costHistory.append(float(sum([alignment[1] for alignment in alignments])))
+        return alignments
+
+    # returns a new template, each frame of which is the average of the take frames aligned to it
+    @ins.timed("DTWBarycenterAverage.average")
+    def __averageTakes(self, takes, alignments):
+
+        frameCount = self.template.getFrameCount()
+        templateFrames = np.concatenate([alignment[0][:, 0] for alignment in alignments])
+        averagedData = np.empty(self.template.data.shape)
+
+        for j in range(self.template.getJointCount()):
+            takeFrames = np.concatenate([take.data[j][:, alignment[0][:, 1]].transpose() for take, alignment in zip(takes, alignments)])
+            if isinstance(self.template, jc.JointDataQuaternions):
+                averages = averageQuaternions(takeFrames, templateFrames, frameCount, self.template.data[j].transpose())
+            else:
+                averages = averageVectors(takeFrames, templateFrames, frameCount)
+            averagedData[j] = averages.transpose()
+
+        template = copy.copy(self.template)
+        template.data = averagedData
+        return template
@@ -0,0 +1,358 @@
+import os
+import csv
+import json
+import struct
+import zipfile
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+import JointDataClasses as jc
+import curveTools as ct
+import FBXMotionToolkit as fmt
+
+# bump when the arrays stored in a container change, so old containers are rejected rather than misread
+CONTAINER_VERSION = "1"
+
+# static FBX node properties stored for every node, and the name of the array each is stored in
+nodeProperties = {"PreRotation": "preRotations",
+                  "PostRotation": "postRotations",
+                  "RotationOffset": "rotationOffsets",
+                  "RotationPivot": "rotationPivots",
+                  "ScalingOffset": "scalingOffsets",
+                  "ScalingPivot": "scalingPivots",
+                  "LclScaling": "scalings",
+                  }
+
+# Writes a motion container to an uncompressed .npz file.  Containers are normally written using
+# FBXSequence.exportMotionContainer, which gathers the arrays from an imported scene.
+# curves has shape (nodes, 6, frames) holding the translation x,y,z and rotation x,y,z of every node on every frame.
+# The remaining arrays describing the skeleton and joint map are passed as keyword arguments.
+def writeMotionContainer(outputFile, fps, curves, **kwargs):
+
+    metadata = {"version": CONTAINER_VERSION,
+                "fps": fps,
+                "sourceFile": kwargs.get("sourceFile", ""),
+                }
+
+    arrays = {"metadata": np.array(json.dumps(metadata)),
+              "curves": np.asarray(curves, dtype=float),
+              "nodeNames": np.array(kwargs["nodeNames"], dtype=str),
+              "parentIndexes": np.array(kwargs["parentIndexes"], dtype=int),
+              "rotationOrders": np.array(kwargs["rotationOrders"], dtype=str),
+              "rotationActive": np.array(kwargs["rotationActive"], dtype=bool),
+              "animatedChannels": np.array(kwargs["animatedChannels"], dtype=bool),
+              "rootParentMatrix": np.array(kwargs.get("rootParentMatrix", np.identity(4)), dtype=float),
+              "jointNames": np.array(kwargs.get("jointNames", []), dtype=str),
+              "fbxJointNames": np.array(kwargs.get("fbxJointNames", []), dtype=str),
+              "jointNodeIndexes": np.array(kwargs.get("jointNodeIndexes", []), dtype=int),
+              }
+
+    nodeCount = len(arrays["nodeNames"])
+    for arrayName in nodeProperties.values():
+        arrays[arrayName] = np.array(kwargs.get(arrayName, np.zeros((nodeCount, 3))), dtype=float).reshape(nodeCount, 3)
+
+    # scaling defaults to one rather than zero when it isn't given
+    if "scalings" not in kwargs:
+        arrays["scalings"] = np.ones((nodeCount, 3))
+
+    # savez stores every array uncompressed, which lets the curves be memory mapped when the container is read
+    np.savez(outputFile, **arrays)
+
+# Reads a motion container written by FBXSequence.exportMotionContainer, without needing the FBX SDK.
+# The curves are memory mapped, so only the frames of the joints that are used are read from disk.
+# Joint data is extracted using the same functions as FBXSequence, so the results can be used for any
+# similarity or timewarping workflow.  The joint map saved in the container is used unless mapJoints is called.
+class MotionContainer():
+
+    def __init__(self, containerFile):
+
+        if os.path.exists(containerFile) == False:
+            raise fmt.FBXSequenceError("Motion container file doesn't exist: " + str(containerFile))
+
+        # initialise public properties
+        self.file = containerFile
+        self.jointNameMap = {}
+
+        # initialise private properties
+        self.__jointMap = {}
+
+        with np.load(containerFile, allow_pickle=False) as container:
+
+            metadata = json.loads(str(container["metadata"]))
+            if metadata["version"] != CONTAINER_VERSION:
+                raise fmt.FBXSequenceError("Motion container version " + str(metadata["version"]) + " can't be read: " + str(containerFile))
+
+            self.sourceFile = metadata["sourceFile"]
+            self.__fps = metadata["fps"]
+            self.__nodeNames = [str(name) for name in container["nodeNames"]]
+            self.__parentIndexes = container["parentIndexes"]
+            self.__rotationOrders = [str(order) for order in container["rotationOrders"]]
+            self.__rotationActive = container["rotationActive"]
+            self.__animatedChannels = container["animatedChannels"]
+            self.__rootParentMatrix = container["rootParentMatrix"]
+            self.__nodeProperties = {arrayName: container[arrayName] for arrayName in nodeProperties.values()}
+            jointNames = [str(name) for name in container["jointNames"]]
+            fbxJointNames = [str(name) for name in container["fbxJointNames"]]
+            jointNodeIndexes = container["jointNodeIndexes"]
+
+        self.__curves = _memoryMapArray(containerFile, "curves")
+        self.__frameTimes = np.arange(self.__curves.shape[2]) / float(self.__fps)
+
+        # use the joint map saved in the container
+        for joint, fbxJointName, nodeIndex in zip(jointNames, fbxJointNames, jointNodeIndexes):
+            self.jointNameMap[joint] = fbxJointName
+            self.__jointMap[joint] = int(nodeIndex) if nodeIndex >= 0 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, exceptionValue, traceback):
+        self.destroy()
+
+    # releases the memory mapped curves.  Joint data already extracted remains valid.
+    def destroy(self):
+        self.__curves = None
+
+    # function maps nodes to standard names using a joint map, replacing the joint map saved in the container
+    def mapJoints(self, map):
+
+        # check file exists
+        if os.path.exists(map) == False:
+            raise fmt.FBXSequenceError("Joint map file specified doesn't exist: " + str(map))
+
+        self.jointNameMap.clear()
+        self.__jointMap.clear()
+
+        # reading mapping of joint names from CSV file
+        with open(map) as mapfile:
+            mapReader = csv.reader(mapfile, csv.excel)
+            for row in mapReader:
+                self.jointNameMap[row[0]] = row[1]
+
+        # find the first node, in depth first order, with a name ending with the mapped name
+        for joint in self.jointNameMap:
+            searchName = self.jointNameMap[joint]
+            self.__jointMap[joint] = None
+            for nodeIndex, nodeName in enumerate(self.__nodeNames):
+                if len(searchName) <= len(nodeName) and nodeName[-len(searchName):] == searchName:
+                    self.__jointMap[joint] = nodeIndex
+                    break
+
+    def __checkJointMapExists(self):
+        if len(self.__jointMap) == 0:
+            raise fmt.FBXSequenceError("joints haven't been mapped, use mapJoints to create a jointMap")
+
+    def __getNodeIndex(self, joint):
+        self.__checkJointMapExists()
+        nodeIndex = self.__jointMap[joint]
+        if nodeIndex is None:
+            raise fmt.FBXSequenceError("Joint isn't part of the skeleton saved in the motion container: " + str(joint))
+        return nodeIndex
+
+    def __checkIfAnimated(self, joint, animationType, axis):
+        channel = axis if animationType == fmt.animationCurveType.TRANSLATION else axis + 3
+        if self.__animatedChannels[self.__getNodeIndex(joint), channel] == False:
+            raise fmt.FBXSequenceError("Joint is not animated. Joint must have animation curve to get its key times")
+
+    # every curve in a container is sampled once per frame, so all curves share the same key times
+    def getTimeOfLastKey(self, joint, animationType, axis):
+        self.__checkIfAnimated(joint, animationType, axis)
+        return float(self.__frameTimes[-1])
+
+    def getJointKeyTimes(self, joint, animationType, axis):
+        self.__checkIfAnimated(joint, animationType, axis)
+        return list(self.__frameTimes)
+
+    def getNumberKeyframes(self, joint, animationType, axis):
+        self.__checkIfAnimated(joint, animationType, axis)
+        return len(self.__frameTimes)
+
+    def getFramesPerSecond(self, joint, animationType, axis):
+        return self.__fps
+
+    #returns the order in which joint rotaitons are being applied in a form that can be used with SciPy
+    def getRotationOrder(self, joint):
+        return self.__rotationOrders[self.__getNodeIndex(joint)]
+
+    # this function extracts the rotation curves for a set of joints into a eular joint data class
+    def getJointRotationAsEulers(self, jointList):
+
+        if type(jointList) == type("string"):
+            jointList = [jointList]
+
+        nodeIndexes = [self.__getNodeIndex(joint) for joint in jointList]
+        curves = np.array(self.__curves[nodeIndexes, 3:6])
+
+        return jc.JointDataEulers(jointList, ["x", "y", "z"], curves)
+
+    def getJointRotationAsQuaternions(self, jointList):
+
+        if type(jointList) == type("string"):
+            jointList = [jointList]
+
+        eulerData = self.getJointRotationAsEulers(jointList)
+        return eulerData.getJointsAsQuaternions([self.getRotationOrder(joint) for joint in jointList])
+
+    def getJointRotationAsMatrices(self, jointList):
+
+        if type(jointList) == type("string"):
+            jointList = [jointList]
+
+        eulerData = self.getJointRotationAsEulers(jointList)
+        return eulerData.getJointsAsMatrices([self.getRotationOrder(joint) for joint in jointList])
+
+    # the y axis of each joint's local rotation, including its pre and post rotations, on every frame
+    def getJointRotationAsDisplacementVectors(self, jointList):
+
+        if type(jointList) == type("string"):
+            jointList = [jointList]
+
+        curves = np.empty((len(jointList), 3, len(self.__frameTimes)))
+
+        for j in range(len(jointList)):
+            nodeIndex = self.__getNodeIndex(jointList[j])
+            rotationMatrices = self.__getRotationMatrices(nodeIndex, np.array(self.__curves[nodeIndex, 3:6]))
+            curves[j] = rotationMatrices[:, :, 1].transpose()
+
+        return jc.JointDataDisplacementVectors(jointList, ["x", "y", "z"], curves)
+
+    # this function extracts the translation curves for a set of joints, which are relative to each joint's parent
+    def getJointAsLocalTranslations(self, jointList):
+
+        if type(jointList) == type("string"):
+            jointList = [jointList]
+
+        nodeIndexes = [self.__getNodeIndex(joint) for joint in jointList]
+        curves = np.array(self.__curves[nodeIndexes, 0:3])
+
+        return jc.JointDataLocalTranslations(jointList, ["x", "y", "z"], curves)
+
+    # this function extracts global translations of a list of joints at the given sample times in seconds, which default to every frame
+    def getJointAsGlobalTranslations(self, jointList, sampleTimes=None):
+
+        if type(jointList) == type("string"):
+            jointList = [jointList]
+
+        if sampleTimes is None:
+            sampleTimes = self.__frameTimes
+        sampleTimes = np.asarray(sampleTimes, dtype=float)
+        globalMatrices = {}
+        curves = np.empty((len(jointList), 3, len(sampleTimes)))
+
+        for j in range(len(jointList)):
+            jointMatrices = self.__getGlobalMatrices(self.__getNodeIndex(jointList[j]), sampleTimes, globalMatrices)
+            curves[j] = jointMatrices[:, :3, 3].transpose()
+
+        return jc.JointDataGlobalTranslations(jointList, ["x", "y", "z"], curves)
+
+    def getJointAsRelativeTranslations(self, jointList, baseJoint, sampleTimes=None):
+
+        if type(jointList) == type("string"):
+            jointList = [jointList]
+
+        if sampleTimes is None:
+            sampleTimes = self.__frameTimes
+        sampleTimes = np.asarray(sampleTimes, dtype=float)
+        globalMatrices = {}
+        curves = np.empty((len(jointList), 3, len(sampleTimes)))
+
+        inverseBaseMatrices = np.linalg.inv(self.__getGlobalMatrices(self.__getNodeIndex(baseJoint), sampleTimes, globalMatrices))
+
+        for j in range(len(jointList)):
+            jointMatrices = self.__getGlobalMatrices(self.__getNodeIndex(jointList[j]), sampleTimes, globalMatrices)
+            curves[j] = np.matmul(inverseBaseMatrices, jointMatrices)[:, :3, 3].transpose()
+
+        return jc.JointDataRelativeTranslations(jointList, ["x", "y", "z"], curves, baseJoint)
+
+    # print a hierarchical display of the nodes saved in the container
+    def printSceneHierarchy(self):
+
+        depths = []
+        for nodeIndex, nodeName in enumerate(self.__nodeNames):
+            parentIndex = self.__parentIndexes[nodeIndex]
+            depth = 0 if parentIndex < 0 else depths[parentIndex] + 1
+            depths.append(depth)
+            print("   " * depth + nodeName)
+
+    # returns the global transforms of a node at each sample time, shape (samples, 4, 4).
+    # transforms of parent nodes are stored in globalMatrices, so joints sharing parents only compute them once.
+    def __getGlobalMatrices(self, nodeIndex, sampleTimes, globalMatrices):
+
+        if nodeIndex not in globalMatrices:
+            parentIndex = self.__parentIndexes[nodeIndex]
+            if parentIndex < 0:
+                parentMatrices = self.__rootParentMatrix
+            else:
+                parentMatrices = self.__getGlobalMatrices(parentIndex, sampleTimes, globalMatrices)
+            globalMatrices[nodeIndex] = np.matmul(parentMatrices, self.__getLocalMatrices(nodeIndex, sampleTimes))
+
+        return globalMatrices[nodeIndex]
+
+    # returns the local transforms of a node at each sample time, built in the same order as FBX:
+    # translation * rotation offset * rotation pivot * pre rotation * rotation * inverse post rotation * inverse rotation pivot
+    # * scaling offset * scaling pivot * scaling * inverse scaling pivot
+    def __getLocalMatrices(self, nodeIndex, sampleTimes):
+
+        # curves are linearly interpolated between frames
+        nodeCurves = self.__curves[nodeIndex]
+        channels = np.array([np.interp(sampleTimes, self.__frameTimes, nodeCurves[c]) for c in range(6)])
+
+        rotationOffset = _getTranslationMatrix(self.__nodeProperties["rotationOffsets"][nodeIndex])
+        rotationPivot = _getTranslationMatrix(self.__nodeProperties["rotationPivots"][nodeIndex])
+        scalingOffset = _getTranslationMatrix(self.__nodeProperties["scalingOffsets"][nodeIndex])
+        scalingPivot = _getTranslationMatrix(self.__nodeProperties["scalingPivots"][nodeIndex])
+        scaling = np.diag(np.append(self.__nodeProperties["scalings"][nodeIndex], 1.))
+
+        localMatrices = np.zeros((len(sampleTimes), 4, 4))
+        localMatrices[:, :3, :3] = self.__getRotationMatrices(nodeIndex, channels[3:6])
+        localMatrices[:, 3, 3] = 1.
+
+        localMatrices = rotationOffset @ rotationPivot @ localMatrices @ np.linalg.inv(rotationPivot) @ scalingOffset @ scalingPivot @ scaling @ np.linalg.inv(scalingPivot)
+        localMatrices[:, :3, 3] += channels[0:3].transpose()
+
+        return localMatrices
+
+    # returns the local rotation matrices of a node from its euler curves, shape (frames, 3, 3), including the
+    # node's pre and post rotations when they are active.  Pre and post rotations are always applied in xyz order.
+    def __getRotationMatrices(self, nodeIndex, eulers):
+
+        rotationMatrices = ct.eulersToRotations(eulers, self.__rotationOrders[nodeIndex]).as_matrix()
+
+        if self.__rotationActive[nodeIndex]:
+            preRotation = R.from_euler("xyz", self.__nodeProperties["preRotations"][nodeIndex], degrees=True).as_matrix()
+            postRotation = R.from_euler("xyz", self.__nodeProperties["postRotations"][nodeIndex], degrees=True).as_matrix()
+            rotationMatrices = preRotation @ rotationMatrices @ postRotation.transpose()
+
+        return rotationMatrices
+
+def _getTranslationMatrix(translation):
+    matrix = np.identity(4)
+    matrix[:3, 3] = translation
+    return matrix
+
+# memory maps an array stored in a .npz file.  np.load can only memory map .npy files, so the array's offset is
+# found from the zip headers and its .npy header.  Arrays stored compressed are loaded into memory instead.
+def _memoryMapArray(file, arrayName):
+
+    with zipfile.ZipFile(file) as archive:
+        memberInfo = archive.getinfo(arrayName + ".npy")
+
+    if memberInfo.compress_type != zipfile.ZIP_STORED:
+        with np.load(file, allow_pickle=False) as container:
+            return container[arrayName]
+
+    with open(file, "rb") as f:
+
+        # the local file header is 30 bytes, followed by the member name and an extra field
+        f.seek(memberInfo.header_offset)
+        localHeader = f.read(30)
+        nameLength, extraLength = struct.unpack("<HH", localHeader[26:30])
+        f.seek(memberInfo.header_offset + 30 + nameLength + extraLength)
+
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    return np.memmap(file, dtype=dtype, mode="r", offset=offset, shape=shape, order="F" if fortranOrder else "C")
@@ -0,0 +1,222 @@
+import os
+import time
+import traceback
+import multiprocessing
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Figures rendered to files are drawn on a matplotlib Figure with the non-interactive Agg canvas rather than through
+# pyplot, so they don't need a display, never block and can be drawn in worker processes on headless batch nodes.
+# Large matrices and long curves are reduced to the resolution of the output before they are drawn, which keeps
+# rendering time and memory independent of the number of frames.
+
+defaultColors = ["r", "g", "b", "c", "m", "y", "tab:orange", "tab:brown", "k"]
+
+# functions used to pool the blocks of a matrix
+poolingReductions = {"max": np.maximum, "min": np.minimum, "mean": np.add}
+
+# returns the first index of each block when an axis of the given size is split into at most maxBlocks equal blocks
+def _getBlockStarts(size, maxBlocks):
+    blockSize = max(1, -(-size // max(1, maxBlocks)))
+    return np.arange(0, size, blockSize)
+
+# Reduces a matrix to at most maxShape (rows, columns) by pooling blocks of cells, keeping the largest ("max"),
+# smallest ("min") or mean ("mean") value of each block.  A matrix that already fits is returned unchanged.
+# Blocks are pooled one axis at a time, so no copy of the whole matrix is made.
+def poolMatrix(matrix, maxShape, reduction="max"):
+
+    if reduction not in poolingReductions:
+        raise ValueError("Pooling reduction must be one of " + str(list(poolingReductions)) + ": " + str(reduction))
+
+    matrix = np.asarray(matrix)
+    if matrix.shape[0] <= maxShape[0] and matrix.shape[1] <= maxShape[1]:
+        return matrix
+
+    rowStarts = _getBlockStarts(matrix.shape[0], maxShape[0])
+    columnStarts = _getBlockStarts(matrix.shape[1], maxShape[1])
+    ufunc = poolingReductions[reduction]
+
+    # blocks of whole rows are pooled by splitting the first axis, which reads the matrix in order and is much faster
+    # than reduceat down the columns, then the smaller result is pooled across the columns
+    rowBlockSize = rowStarts[1] if len(rowStarts) > 1 else matrix.shape[0]
+    fullRows = (matrix.shape[0] // rowBlockSize) * rowBlockSize
+    pooledRows = [ufunc.reduce(matrix[:fullRows].reshape(-1, rowBlockSize, matrix.shape[1]), axis=1)]
+    if fullRows < matrix.shape[0]:
+        pooledRows.append(ufunc.reduce(matrix[fullRows:], axis=0, keepdims=True))
+
+    pooled = ufunc.reduceat(np.concatenate(pooledRows), columnStarts, axis=1)
+    if reduction == "mean":
+        rowCounts = np.diff(np.append(rowStarts, matrix.shape[0]))
+        columnCounts = np.diff(np.append(columnStarts, matrix.shape[1]))
+        pooled = pooled / np.outer(rowCounts, columnCounts)
+
+    return pooled
+
+# Reduces curves of shape (frames,) or (curves, frames) to at most maxPoints buckets of frames, returning the middle
+# frame of each bucket and the smallest and largest values of the curves in each bucket.  Drawing the band between
+# them looks the same as drawing every frame once each bucket is narrower than a pixel, and peaks aren't lost as
+# they would be by skipping frames.
+def getCurveEnvelope(curves, maxPoints):
+
+    curves = np.asarray(curves, dtype=float)
+    frameCount = curves.shape[-1]
+    bucketStarts = _getBlockStarts(frameCount, maxPoints)
+    bucketEnds = np.append(bucketStarts[1:], frameCount)
+
+    minimums = np.minimum.reduceat(curves, bucketStarts, axis=-1)
+    maximums = np.maximum.reduceat(curves, bucketStarts, axis=-1)
+
+    return 0.5 * (bucketStarts + bucketEnds - 1), minimums, maximums
+
+# Draws a heatmap of a cost matrix or accumulated cost matrix on a matplotlib axes, with the input motion along the
+# x axis and the target motion along the y axis, and optionally an alignment path on top.
+# Optional keyword arguments:
+#   DTWmap - DTW map drawn on top of the heatmap
+#   resolution - largest number of cells drawn along each axis, default 1000.  Larger matrices are pooled.
+#   reduction - how blocks of cells are pooled, "max" (default), "min" or "mean", see poolMatrix()
+#   frameCounts - (input frames, target frames) of a matrix that has already been pooled
+def drawDTW(ax, costMatrix, **kwargs):
+
+    DTWmap = np.asarray(kwargs.get("DTWmap", []))
+    resolution = kwargs.get("resolution", 1000)
+    inputFrames, targetFrames = kwargs.get("frameCounts", np.shape(costMatrix))
+
+    pooledMatrix = poolMatrix(costMatrix, (resolution, resolution), kwargs.get("reduction", "max"))
+
+    ax.set_aspect("equal")
+    ax.imshow(pooledMatrix.transpose(), origin="lower", extent=(0, inputFrames, 0, targetFrames), aspect="equal",
+              interpolation="nearest")
+
+    if DTWmap.shape[0] > 0:
+        # the map is monotonic, so a few points per pixel draw the same line
+        targetFrame = np.unique(np.linspace(0, DTWmap.shape[0] - 1, min(DTWmap.shape[0], 4 * resolution)).astype(int))
+        ax.plot(DTWmap[targetFrame] + 0.5, targetFrame + 0.5, color="r")
+
+    ax.set_xlim(0, inputFrames)
+    ax.set_ylim(0, targetFrames)
+    ax.set_xlabel("Input motion (frames)")
+    ax.set_ylabel("Target motion (frames)")
+
+# Draws curves of shape (frames,) or (curves, frames) against frames on a matplotlib axes.  Curves with more frames
+# than the resolution are drawn as the band between their smallest and largest values, see getCurveEnvelope().
+# Optional keyword arguments:
+#   labels - label of each curve, shown in a legend
+#   colors - color of each curve, defaults to defaultColors
+#   resolution - largest number of points drawn for each curve, default 4000
+def drawCurves(ax, curves, **kwargs):
+
+    curves = np.atleast_2d(np.asarray(curves, dtype=float))
+    colors = kwargs.get("colors", defaultColors)
+    resolution = kwargs.get("resolution", 4000)
+    frameCount = curves.shape[1]
+
+    if frameCount > resolution:
+        frames, minimums, maximums = getCurveEnvelope(curves, resolution)
+        for c in range(curves.shape[0]):
+            ax.fill_between(frames, minimums[c], maximums[c], color=colors[c % len(colors)], linewidth=1)
+    else:
+        frames = np.arange(frameCount)
+        for c in range(curves.shape[0]):
+            ax.plot(frames, curves[c], c=colors[c % len(colors)])
+
+    if kwargs.get("labels") is not None:
+        ax.legend(kwargs["labels"], bbox_to_anchor=(1, 1))
+
+# creates a figure with the Agg canvas and a single axes
+def _createFigure(figureSize):
+    figure = Figure(figsize=figureSize)
+    FigureCanvasAgg(figure)
+    return figure, figure.add_subplot()
+
+# saves a figure, creating its folder if needed.  The file format is taken from the file extension, e.g. png, svg or pdf.
+def _saveFigure(figure, outputFile, dpi):
+    folder = os.path.dirname(outputFile)
+    if folder != "":
+        os.makedirs(folder, exist_ok=True)
+    figure.savefig(outputFile, dpi=dpi)
+
+# Renders a heatmap of a cost matrix, as drawDTW(), to a file without opening a window.  Returns the output file.
+# Optional keyword arguments, as well as those of drawDTW():
+#   title - title of the figure
+#   figureSize - size of the figure in inches, default (7, 7)
+#   dpi - dots per inch of raster images, default 100
+def renderDTW(costMatrix, outputFile, **kwargs):
+
+    figure, ax = _createFigure(kwargs.get("figureSize", (7, 7)))
+    drawDTW(ax, costMatrix, **kwargs)
+    if "title" in kwargs:
+        ax.set_title(kwargs["title"])
+
+    figure.tight_layout()
+    _saveFigure(figure, outputFile, kwargs.get("dpi", 100))
+    return outputFile
+
+# Renders curves of shape (frames,) or (curves, frames), as drawCurves(), to a file without opening a window.
+# Returns the output file.  Optional keyword arguments, as well as those of drawCurves():
+#   title - title of the figure
+#   xlabel, ylabel - axis labels, default "Frames" and "Value"
+#   figureSize - size of the figure in inches, default (7, 3)
+#   dpi - dots per inch of raster images, default 100
+def renderCurves(curves, outputFile, **kwargs):
+
+    figure, ax = _createFigure(kwargs.get("figureSize", (7, 3)))
+    drawCurves(ax, curves, **kwargs)
+    ax.set(xlabel=kwargs.get("xlabel", "Frames"), ylabel=kwargs.get("ylabel", "Value"), title=kwargs.get("title", ""))
+
+    figure.tight_layout()
+    _saveFigure(figure, outputFile, kwargs.get("dpi", 100))
+    return outputFile
+
+# functions that can be used in the jobs of renderFigures
+renderFunctions = {"renderDTW": renderDTW, "renderCurves": renderCurves}
+
+# Renders a figure for a job of renderFigures, returning a BatchResult.  Used by renderFigures in each worker.
+def renderJob(functionName, arguments, keywordArguments):
+
+    import batchTools as bt
+
+    result = bt.BatchResult(arguments[1])
+    startTime = time.perf_counter()
+
+    try:
+        result.outputs.append(renderFunctions[functionName](*arguments, **keywordArguments))
+    except Exception:
+        result.error = traceback.format_exc()
+
+    result.duration = time.perf_counter() - startTime
+    return result
+
+# Renders many figures to files across a pool of worker processes, e.g. the cost matrices of a batch of alignments.
+# Each job is a tuple of "renderDTW" or "renderCurves", followed by the function's arguments, with an optional
+# dictionary of its keyword arguments last, for example:
+#   ("renderDTW", warp.accumulatedCostMatrix, "plots/take1.png", {"DTWmap": warp.DTWremap, "title": "Take 1"})
+# Cost matrices are pooled to the resolution of their figure before they are sent to a worker, so large matrices
+# aren't copied between processes.  Returns a batchTools.BatchResult for each job, in the order of the jobs, whose
+# file is the output file.  A job that fails is reported through the error of its result.
+# Optional keyword arguments:
+#   workers - number of worker processes, defaults to the number of CPUs.  1 renders in the calling process.
+def renderFigures(jobs, **kwargs):
+
+    workers = kwargs.get("workers", os.cpu_count())
+    preparedJobs = []
+
+    for job in jobs:
+        if job[0] not in renderFunctions:
+            raise ValueError("Render jobs must use one of " + str(list(renderFunctions)) + ": " + str(job[0]))
+
+        keywordArguments = dict(job[-1]) if isinstance(job[-1], dict) else {}
+        arguments = list(job[1:-1]) if isinstance(job[-1], dict) else list(job[1:])
+
+        if job[0] == "renderDTW":
+            resolution = keywordArguments.get("resolution", 1000)
+            keywordArguments["frameCounts"] = keywordArguments.get("frameCounts", np.shape(arguments[0]))
+            arguments[0] = poolMatrix(arguments[0], (resolution, resolution), keywordArguments.get("reduction", "max"))
+
+        preparedJobs.append((job[0], arguments, keywordArguments))
+
+    if workers <= 1:
+        return [renderJob(*job) for job in preparedJobs]
+
+    with multiprocessing.Pool(min(workers, max(1, len(preparedJobs)))) as pool:
+        return pool.starmap(renderJob, preparedJobs, chunksize=1)
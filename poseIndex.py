@@ -0,0 +1,281 @@
+import os
+import json
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.spatial.transform import Rotation as R
+import JointDataClasses as jc
+import instrumentation as ins
+
+# bump when the arrays stored in a saved index change, so old index files are rejected rather than misread
+INDEX_VERSION = "1"
+
+# Returns the features of every frame of joint data as an array of shape (frames, features), so that the
+# euclidean distance between two frames' features measures how different the poses are.
+# Quaternions are converted to rotation matrices, as q and -q are the same rotation but far apart as vectors.
+def getFrameFeatures(jointData):
+
+    if isinstance(jointData, jc.JointDataQuaternions):
+        features = [R.from_quat(jointData.data[j].transpose()).as_matrix().reshape(-1, 9) for j in range(jointData.getJointCount())]
+        return np.concatenate(features, axis=1)
+
+    if isinstance(jointData, (jc.JointDataMatrices, jc.JointDataVectors)):
+        return jointData.data.transpose(2, 0, 1).reshape(jointData.getFrameCount(), -1)
+
+    raise ValueError("Pose features can't be made from joint data of type: " + jointData.dataType)
+
+# Returns the descriptors of every window of windowLength frames, starting every stride frames, as an array of shape
+# (windows, windowLength * features), along with the start frame of each window.
+def getWindowDescriptors(jointData, windowLength, stride=1):
+
+    features = getFrameFeatures(jointData)
+    if features.shape[0] < windowLength:
+        return np.empty((0, windowLength * features.shape[1])), np.empty(0, dtype=int)
+
+    windows = np.lib.stride_tricks.sliding_window_view(features, windowLength, axis=0)[::stride]
+    descriptors = windows.transpose(0, 2, 1).reshape(windows.shape[0], -1)
+    startFrames = np.arange(0, features.shape[0] - windowLength + 1, stride)
+
+    return descriptors, startFrames
+
+# appends rows to an array that has spare capacity at its end, growing it geometrically so that adding many
+# small clips doesn't copy the whole library each time.  Returns the array, which may be a new one.
+def _appendRows(array, usedRows, rows):
+
+    if usedRows + len(rows) > array.shape[0]:
+        grownArray = np.empty((max(2 * array.shape[0], usedRows + len(rows), 1024),) + array.shape[1:], dtype=array.dtype)
+        grownArray[:usedRows] = array[:usedRows]
+        array = grownArray
+
+    array[usedRows:usedRows + len(rows)] = rows
+    return array
+
+# Indexes fixed length windows of poses from a library of clips, to find where a pose or short move occurs without
+# comparing it with every clip.  Every clip must hold the same joints in the same joint data class.
+# The features of each frame are stored once and windows are built from them as needed, so long windows don't
+# multiply the memory used.  Windows are kept in a KD-tree.  Clips added after the tree was built are searched by
+# brute force until enough are waiting to make rebuilding the tree worthwhile, so clips can be added as new takes
+# are ingested.  Optional keyword arguments:
+#   stride - frames between the start of each indexed window, default 1
+#   dimensions - if given, the tree holds descriptors reduced to this many dimensions by PCA, and the candidates it
+#                finds are re-ranked by their exact distance.  Much faster and smaller for long windows or many joints.
+#   candidates - number of candidates found for each requested match when dimensions is used, default 10
+#   rebuildFraction - the tree is rebuilt once the waiting windows reach this fraction of the tree size, default 0.25
+class PoseIndex():
+
+    # number of windows whose descriptors are built at once, which bounds the memory used by searches and rebuilds
+    __chunkSize = 8192
+
+    def __init__(self, windowLength=1, **kwargs):
+
+        # initialise public properties
+        self.windowLength = windowLength
+        self.stride = kwargs.get("stride", 1)
+        self.dimensions = kwargs.get("dimensions")
+        self.candidates = kwargs.get("candidates", 10)
+        self.rebuildFraction = kwargs.get("rebuildFraction", 0.25)
+        self.className = None
+        self.joints = None
+        self.clipNames = []
+
+        # initialise private properties.  features are stored as float32 to halve the memory used by large libraries
+        self.__frameFeatures = np.empty((0, 0), dtype=np.float32)
+        self.__frameCount = 0
+        self.__windowOffsets = np.empty(0, dtype=np.int64)
+        self.__clipIndexes = np.empty(0, dtype=np.int32)
+        self.__startFrames = np.empty(0, dtype=np.int32)
+        self.__windowCount = 0
+        self.__treeSize = 0
+        self.__tree = None
+        self.__projection = None
+        self.__mean = None
+
+    # number of indexed windows
+    def getWindowCount(self):
+        return self.__windowCount
+
+    # adds every window of a clip's joint data to the index under the clip's name
+    @ins.timed("PoseIndex.addClip")
+    def addClip(self, clipName, jointData):
+
+        if clipName in self.clipNames:
+            raise ValueError("Clip is already in the pose index: " + str(clipName))
+
+        if self.className is None:
+            self.className = jointData.__class__.__name__
+            self.joints = list(jointData.joints)
+        elif jointData.__class__.__name__ != self.className or list(jointData.joints) != self.joints:
+            raise ValueError("Clip " + str(clipName) + " doesn't have the same joint data class and joints as the pose index")
+
+        features = getFrameFeatures(jointData).astype(np.float32)
+        startFrames = np.arange(0, features.shape[0] - self.windowLength + 1, self.stride)
+
+        if self.__frameCount == 0:
+            self.__frameFeatures = np.empty((0, features.shape[1]), dtype=np.float32)
+
+        self.__frameFeatures = _appendRows(self.__frameFeatures, self.__frameCount, features)
+        self.__windowOffsets = _appendRows(self.__windowOffsets, self.__windowCount, startFrames + self.__frameCount)
+        self.__clipIndexes = _appendRows(self.__clipIndexes, self.__windowCount, np.full(len(startFrames), len(self.clipNames)))
+        self.__startFrames = _appendRows(self.__startFrames, self.__windowCount, startFrames)
+        self.__frameCount += features.shape[0]
+        self.__windowCount += len(startFrames)
+        self.clipNames.append(clipName)
+
+        if self.__windowCount - self.__treeSize > self.rebuildFraction * self.__treeSize:
+            self.rebuild()
+
+    # rebuilds the tree so it holds every window, which happens automatically as clips are added
+    @ins.timed("PoseIndex.rebuild")
+    def rebuild(self):
+
+        self.__treeSize = self.__windowCount
+        if self.__treeSize == 0:
+            self.__tree = None
+            return
+
+        descriptorSize = self.windowLength * self.__frameFeatures.shape[1]
+        if self.dimensions is not None and self.dimensions < descriptorSize:
+            self.__fitProjection()
+            treeDescriptors = np.empty((self.__treeSize, self.dimensions))
+            for chunkStart in range(0, self.__treeSize, self.__chunkSize):
+                windowIndexes = np.arange(chunkStart, min(chunkStart + self.__chunkSize, self.__treeSize))
+                treeDescriptors[windowIndexes] = self.__project(self.__getDescriptors(windowIndexes))
+        else:
+            self.__projection = None
+            treeDescriptors = self.__getDescriptors(np.arange(self.__treeSize))
+
+        self.__tree = cKDTree(treeDescriptors)
+
+    # returns the descriptors of a set of windows, of shape (windows, windowLength * features)
+    def __getDescriptors(self, windowIndexes):
+        frameIndexes = self.__windowOffsets[windowIndexes][:, np.newaxis] + np.arange(self.windowLength)
+        return self.__frameFeatures[frameIndexes].reshape(len(windowIndexes), -1).astype(float)
+
+    # returns the distance between a descriptor and each of a set of windows
+    def __getDistances(self, windowIndexes, descriptor):
+        distances = np.empty(len(windowIndexes))
+        for chunkStart in range(0, len(windowIndexes), self.__chunkSize):
+            chunk = slice(chunkStart, chunkStart + self.__chunkSize)
+            distances[chunk] = np.linalg.norm(self.__getDescriptors(windowIndexes[chunk]) - descriptor, axis=1)
+        return distances
+
+    # fits the PCA projection used to reduce descriptors, using a sample of the windows for large indexes
+    def __fitProjection(self):
+
+        windowIndexes = np.arange(self.__treeSize)
+        if self.__treeSize > 4096:
+            windowIndexes = np.sort(np.random.default_rng(0).choice(self.__treeSize, 4096, replace=False))
+
+        # the principal components are the eigenvectors of the covariance with the largest eigenvalues
+        sample = self.__getDescriptors(windowIndexes)
+        self.__mean = sample.mean(axis=0)
+        sample -= self.__mean
+        eigenvalues, eigenvectors = np.linalg.eigh(sample.transpose() @ sample)
+        self.__projection = eigenvectors[:, ::-1][:, :self.dimensions]
+
+    def __project(self, descriptors):
+        return (descriptors - self.__mean) @ self.__projection
+
+    # Finds the k indexed windows closest to the window of joint data starting at startFrame (default 0).
+    # Returns a list of (clip name, start frame, distance) tuples, closest first.
+    def query(self, jointData, k=1, **kwargs):
+
+        if jointData.__class__.__name__ != self.className or list(jointData.joints) != self.joints:
+            raise ValueError("Query doesn't have the same joint data class and joints as the pose index")
+
+        startFrame = kwargs.get("startFrame", 0)
+        features = getFrameFeatures(jointData)[startFrame:startFrame + self.windowLength]
+        if features.shape[0] < self.windowLength:
+            raise ValueError("Query needs " + str(self.windowLength) + " frames from frame " + str(startFrame))
+
+        return self.queryDescriptor(features.reshape(-1), k)
+
+    # finds the k indexed windows closest to a descriptor, as returned by getWindowDescriptors
+    @ins.timed("PoseIndex.query")
+    def queryDescriptor(self, descriptor, k=1):
+
+        descriptor = np.asarray(descriptor, dtype=float)
+        windowIndexes = []
+        distances = []
+
+        # windows in the tree
+        if self.__tree is not None and k > 0:
+            if self.__projection is None:
+                treeDistances, treeIndexes = self.__tree.query(descriptor, min(k, self.__treeSize))
+                treeIndexes = np.atleast_1d(treeIndexes)
+                treeDistances = np.atleast_1d(treeDistances)
+            else:
+                treeIndexes = self.__tree.query(self.__project(descriptor), min(k * self.candidates, self.__treeSize))[1]
+                treeIndexes = np.atleast_1d(treeIndexes)
+                treeDistances = self.__getDistances(treeIndexes, descriptor)
+            windowIndexes.append(treeIndexes)
+            distances.append(treeDistances)
+
+        # windows added since the tree was built
+        if self.__windowCount > self.__treeSize and k > 0:
+            bufferIndexes = np.arange(self.__treeSize, self.__windowCount)
+            bufferDistances = self.__getDistances(bufferIndexes, descriptor)
+            closest = np.argsort(bufferDistances)[:k]
+            windowIndexes.append(bufferIndexes[closest])
+            distances.append(bufferDistances[closest])
+
+        if len(windowIndexes) == 0:
+            return []
+
+        windowIndexes = np.concatenate(windowIndexes)
+        distances = np.concatenate(distances)
+        order = np.argsort(distances, kind="stable")[:k]
+
+        return [(self.clipNames[self.__clipIndexes[windowIndexes[i]]], int(self.__startFrames[windowIndexes[i]]), float(distances[i]))
+                for i in order]
+
+    # saves the index to a .npz file, which can be loaded using loadPoseIndex()
+    def save(self, outputFile):
+
+        metadata = {"version": INDEX_VERSION,
+                    "windowLength": self.windowLength,
+                    "stride": self.stride,
+                    "dimensions": self.dimensions,
+                    "candidates": self.candidates,
+                    "rebuildFraction": self.rebuildFraction,
+                    "className": self.className,
+                    "joints": self.joints,
+                    }
+
+        np.savez(outputFile,
+                 metadata=np.array(json.dumps(metadata)),
+                 clipNames=np.array([str(name) for name in self.clipNames], dtype=str),
+                 frameFeatures=self.__frameFeatures[:self.__frameCount],
+                 windowOffsets=self.__windowOffsets[:self.__windowCount],
+                 clipIndexes=self.__clipIndexes[:self.__windowCount],
+                 startFrames=self.__startFrames[:self.__windowCount])
+
+    # restores the arrays of a saved index, used by loadPoseIndex()
+    def _restore(self, metadata, clipNames, frameFeatures, windowOffsets, clipIndexes, startFrames):
+        self.className = metadata["className"]
+        self.joints = metadata["joints"]
+        self.clipNames = clipNames
+        self.__frameFeatures = frameFeatures
+        self.__frameCount = frameFeatures.shape[0]
+        self.__windowOffsets = windowOffsets
+        self.__clipIndexes = clipIndexes
+        self.__startFrames = startFrames
+        self.__windowCount = len(windowOffsets)
+        self.rebuild()
+
+# loads a pose index saved using PoseIndex.save().  The tree is rebuilt when the index is loaded.
+def loadPoseIndex(file):
+
+    if os.path.exists(file) == False:
+        raise ValueError("Pose index file doesn't exist: " + str(file))
+
+    with np.load(file, allow_pickle=False) as indexFile:
+        metadata = json.loads(str(indexFile["metadata"]))
+        if metadata["version"] != INDEX_VERSION:
+            raise ValueError("Pose index file version " + str(metadata["version"]) + " can't be read: " + str(file))
+
+        poseIndex = PoseIndex(metadata["windowLength"], stride=metadata["stride"], dimensions=metadata["dimensions"],
+                              candidates=metadata["candidates"], rebuildFraction=metadata["rebuildFraction"])
+        poseIndex._restore(metadata, [str(name) for name in indexFile["clipNames"]], indexFile["frameFeatures"],
+                           indexFile["windowOffsets"], indexFile["clipIndexes"], indexFile["startFrames"])
+
+    return poseIndex
@@ -0,0 +1,181 @@
+import numpy as np
+from scipy.signal import find_peaks
+import poseIndex as pi
+import instrumentation as ins
+
+# returns the features of every frame of joint data or a feature stack, as an array of shape (frames, features)
+def _getFeatures(jointData):
+    if hasattr(jointData, "features"):
+        return jointData.features
+    return pi.getFrameFeatures(jointData)
+
+# Returns the autocorrelation of a signal of shape (frames,) or (frames, features) for every lag from 0 to frames - 1,
+# calculated with FFTs.  The mean of each feature is removed, the autocorrelations of the features are summed and
+# the result is scaled so that lag 0 is 1.
+def getAutocorrelation(signal):
+
+    signal = np.asarray(signal, dtype=float)
+    if signal.ndim == 1:
+        signal = signal[:, np.newaxis]
+    frameCount = signal.shape[0]
+
+    centred = signal - np.mean(signal, axis=0)
+    # padding to twice the length stops the FFT wrapping the end of the signal onto its start
+    fftLength = 1 << int(2 * frameCount - 1).bit_length()
+    spectrum = np.fft.rfft(centred, fftLength, axis=0)
+    autocorrelation = np.fft.irfft(np.sum(np.abs(spectrum) ** 2, axis=1), fftLength)[:frameCount]
+
+    if autocorrelation[0] <= 0:
+        return np.zeros(frameCount)
+    return autocorrelation / autocorrelation[0]
+
+# Estimates the period of a repetitive motion in frames, e.g. the length of a stride, from the highest peak of the
+# autocorrelation of its frame features.  jointData is a joint data object or feature stack.  The period is refined
+# between frames by fitting a parabola to the peak.  Returns None if the motion has no repeating pattern.
+# Optional keyword arguments:
+#   minPeriod - shortest period considered in frames, default 2
+#   maxPeriod - longest period considered in frames, default half the frame count
+@ins.timed("segmentationTools.estimatePeriod")
+def estimatePeriod(jointData, **kwargs):
+
+    autocorrelation = getAutocorrelation(_getFeatures(jointData))
+    minPeriod = max(1, int(kwargs.get("minPeriod", 2)))
+    maxPeriod = min(len(autocorrelation) - 2, int(kwargs.get("maxPeriod", len(autocorrelation) // 2)))
+
+    peaks = find_peaks(autocorrelation[:maxPeriod + 2])[0]
+    peaks = peaks[(peaks >= minPeriod) & (peaks <= maxPeriod)]
+    peaks = peaks[autocorrelation[peaks] > 0]
+    if len(peaks) == 0:
+        return None
+
+    peak = peaks[np.argmax(autocorrelation[peaks])]
+    before, centre, after = autocorrelation[peak - 1:peak + 2]
+    curvature = before - 2 * centre + after
+    offset = 0.5 * (before - after) / curvature if curvature < 0 else 0.
+
+    return peak + offset
+
+# Splits a repetitive motion into cycles, returning the first frame of each cycle.  Cycles start where the pose
+# returns closest to the pose of referenceFrame, at least minCycleFraction of a period apart.  jointData is a joint
+# data object or feature stack.  Optional keyword arguments:
+#   period - period of the motion in frames, estimated using estimatePeriod() if not given
+#   referenceFrame - frame with the pose each cycle starts on, default 0
+#   minCycleFraction - shortest cycle as a fraction of the period, default 0.6
+@ins.timed("segmentationTools.findCycles")
+def findCycles(jointData, **kwargs):
+
+    features = _getFeatures(jointData)
+    period = kwargs.get("period", None)
+    if period is None:
+        period = estimatePeriod(jointData)
+    if period is None:
+        return []
+
+    referenceFrame = kwargs.get("referenceFrame", 0)
+    minCycleLength = max(1, int(kwargs.get("minCycleFraction", 0.6) * period))
+
+    distances = np.sqrt(np.sum((features - features[referenceFrame]) ** 2, axis=1))
+    # the frames closest to the reference pose are the peaks of the negated distance
+    minima = find_peaks(-distances, distance=minCycleLength)[0]
+
+    cycleStarts = [referenceFrame]
+    for frame in minima:
+        if frame - cycleStarts[-1] >= minCycleLength:
+            cycleStarts.append(int(frame))
+    earlierStarts = [int(frame) for frame in minima if referenceFrame - frame >= minCycleLength]
+
+    return sorted(earlierStarts + cycleStarts)
+
+# Returns a checkerboard kernel of shape (2 * kernelSize, 2 * kernelSize) tapered by a gaussian.  Cells comparing
+# frames either side of the centre are positive and cells comparing frames on the same side are negative.
+def getCheckerboardKernel(kernelSize):
+
+    offsets = np.arange(-kernelSize, kernelSize) + 0.5
+    taper = np.exp(-0.5 * (offsets / (0.5 * kernelSize)) ** 2)
+    kernel = -np.outer(np.sign(offsets) * taper, np.sign(offsets) * taper)
+
+    return kernel / np.sum(np.abs(kernel))
+
+# returns the novelty of every frame given a function returning diagonal d of a self similarity matrix, where
+# diagonal d holds the difference between frames f and f + d.  The kernel is applied one diagonal at a time, so only
+# diagonals within twice the kernel size of the main diagonal are needed.
+def _getNoveltyFromDiagonals(getDiagonal, frameCount, kernelSize):
+
+    kernel = getCheckerboardKernel(kernelSize)
+    novelty = np.zeros(frameCount)
+
+    for d in range(-2 * kernelSize + 1, 2 * kernelSize):
+        if abs(d) >= frameCount:
+            continue
+        # kernel diagonal d holds cells (a, a + d), and diagonal d of the matrix holds the difference between frames
+        # f and f + d at index min(f, f + d), so kernel cell t is applied to index f - kernelSize + t of the diagonal
+        diagonal = np.concatenate([np.zeros(2 * kernelSize), getDiagonal(d), np.zeros(2 * kernelSize)])
+        correlation = np.correlate(diagonal, np.diagonal(kernel, d), mode="valid")
+        novelty += correlation[kernelSize:kernelSize + frameCount]
+
+    return novelty
+
+# Returns the novelty curve of a self similarity matrix, such as one returned by similarityTools.getSelfSimilarityMatrix(),
+# by sliding a gaussian tapered checkerboard kernel along its diagonal.  Novelty is high on frames where the poses
+# before the frame are similar to each other but different to the poses after it, i.e. where the motion changes.
+# Optional keyword arguments:
+#   kernelSize - frames either side of each frame compared, default 16
+def getNoveltyCurve(selfSimilarityMatrix, **kwargs):
+
+    kernelSize = kwargs.get("kernelSize", 16)
+    return _getNoveltyFromDiagonals(lambda d: np.diagonal(selfSimilarityMatrix, d), selfSimilarityMatrix.shape[0], kernelSize)
+
+# Returns the novelty curve of joint data or a feature stack, as getNoveltyCurve(), without calculating the whole self
+# similarity matrix.  The difference between frames is the euclidean distance between their frame features, and
+# only differences between frames within twice the kernel size of each other are calculated, so long takes can be
+# processed quickly.  Optional keyword arguments:
+#   kernelSize - frames either side of each frame compared, default 16
+@ins.timed("segmentationTools.getMotionNoveltyCurve")
+def getMotionNoveltyCurve(jointData, **kwargs):
+
+    features = _getFeatures(jointData)
+    kernelSize = kwargs.get("kernelSize", 16)
+
+    # |a - b|² = |a|² + |b|² - 2a.b avoids making a copy of the features for every diagonal, and the difference is
+    # symmetric so diagonals d and -d are the same
+    squaredNorms = np.einsum("ij,ij->i", features, features)
+    diagonals = {}
+
+    def getDiagonal(d):
+        d = abs(d)
+        if d not in diagonals:
+            dotProducts = np.einsum("ij,ij->i", features[d:], features[:features.shape[0] - d])
+            diagonals[d] = np.sqrt(np.maximum(squaredNorms[d:] + squaredNorms[:features.shape[0] - d] - 2 * dotProducts, 0.))
+        return diagonals[d]
+
+    return _getNoveltyFromDiagonals(getDiagonal, features.shape[0], kernelSize)
+
+# Returns the frames where a novelty curve peaks, which are the boundaries between segments of a motion.
+# Optional keyword arguments:
+#   minSegmentLength - fewest frames between boundaries, default 16
+#   threshold - minimum prominence of a peak as a fraction of the highest novelty, default 0.1
+def findSegmentBoundaries(noveltyCurve, **kwargs):
+
+    minSegmentLength = max(1, int(kwargs.get("minSegmentLength", 16)))
+    threshold = kwargs.get("threshold", 0.1)
+
+    prominence = threshold * np.max(noveltyCurve) if np.max(noveltyCurve) > 0 else None
+    peaks = find_peaks(noveltyCurve, distance=minSegmentLength, prominence=prominence)[0]
+
+    return [int(frame) for frame in peaks]
+
+# Splits a motion into segments where it changes, using the novelty curve of its frame features.  Returns the first
+# frame of each segment, starting with frame 0.  jointData is a joint data object or feature stack.
+# Optional keyword arguments:
+#   kernelSize - frames either side of each frame compared, default 16
+#   minSegmentLength - fewest frames in a segment, defaults to kernelSize
+#   threshold - minimum prominence of a boundary's novelty as a fraction of the highest novelty, default 0.1
+@ins.timed("segmentationTools.segmentMotion")
+def segmentMotion(jointData, **kwargs):
+
+    kernelSize = kwargs.get("kernelSize", 16)
+    noveltyCurve = getMotionNoveltyCurve(jointData, kernelSize=kernelSize)
+    boundaries = findSegmentBoundaries(noveltyCurve, minSegmentLength=kwargs.get("minSegmentLength", kernelSize),
+                                       threshold=kwargs.get("threshold", 0.1))
+
+    return [0] + [frame for frame in boundaries if frame > 0]
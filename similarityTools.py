@@ -1,6 +1,8 @@
+import copy
 import numpy as np
 import sys
 import scipy.stats as stats
+import instrumentation as ins
 
 def measureDistanceSimilarity(inputMotionJointData, targetMotionJointData):
     motion1 = inputMotionJointData
@@ -12,11 +14,15 @@ def measureDistanceSimilarity(inputMotionJointData, targetMotionJointData):
     motion1.errorCheckMatchingClass(motion2)
     motion1.errorCheckHasDifferenceFunction()
 
-    sum = 0
+    # joint data classes compare every frame with its matching frame at once
+    if hasattr(motion1, "getFrameDifferences"):
+        sum = float(np.sum(motion1.getFrameDifferences(motion1.joints, motion2)))
+    else:
+        sum = 0
 
-    for f in range(motion1.getFrameCount()):
-        d = motion1.getDifferenceBetweenFrames(motion1.joints, f, motion2, f)
-        sum += d
+        for f in range(motion1.getFrameCount()):
+            d = motion1.getDifferenceBetweenFrames(motion1.joints, f, motion2, f)
+            sum += d
 
     avgDist = sum / (motion1.getJointCount() * motion2.getFrameCount())
 
@@ -61,6 +67,7 @@ def measureCorrelationSimilarity(inputFlatJointData, targetFlatJointData, method
     avgTotal = testTotal / inputFlatJointData.shape[0]
     return avgTotal
 
+@ins.timed("similarityTools.getSimilarityMatrix")
 def getSimilarityMatrix(inputMotionJointData, targetMotionJointData):
     motion1 = inputMotionJointData
     motion2 = targetMotionJointData
@@ -72,20 +79,69 @@ def getSimilarityMatrix(inputMotionJointData, targetMotionJointData):
 
     costMatrix = np.empty((motion1.getFrameCount(), motion2.getFrameCount()))
 
-    cellCount = 0
-    totalCells = motion1.getFrameCount() * motion2.getFrameCount()
+    # progress is reported once per block of rows, the progress callback throttles it further
+    progress = ins.Progress("getSimilarityMatrix", costMatrix.size)
+
+    # joint data classes with a difference matrix function compare a block of rows at a time, which limits the
+    # memory used for long motions
+    if hasattr(motion1, "getDifferenceMatrix"):
+        blockSize = max(1, 2 ** 18 // max(1, motion2.getFrameCount()))
+        for blockStart in range(0, motion1.getFrameCount(), blockSize):
+            rows = slice(blockStart, blockStart + blockSize)
+            costMatrix[rows] = motion1.getDifferenceMatrix(motion1.joints, motion2, rows)
+            progress.update(min(blockStart + blockSize, motion1.getFrameCount()) * motion2.getFrameCount())
+        return costMatrix
 
     for f1 in range(motion1.getFrameCount()):
         for f2 in range(motion2.getFrameCount()):
             costMatrix[f1, f2] = motion1.getDifferenceBetweenFrames(motion1.joints, f1, motion2, f2)
-            cellCount += 1
-            progress = int((cellCount / totalCells) * 100)
-            sys.stdout.write("\rprogress: " + str(progress) + "%")
-            sys.stdout.flush()
+        progress.update((f1 + 1) * motion2.getFrameCount())
+
+    return costMatrix
+
+# Returns the difference between every pair of frames of a single motion, as an array of shape (frames, frames).
+# The difference between frames is symmetric, so only the upper triangle is calculated and mirrored into the lower
+# triangle, taking about half the time of getSimilarityMatrix(jointData, jointData).
+@ins.timed("similarityTools.getSelfSimilarityMatrix")
+def getSelfSimilarityMatrix(jointData):
+
+    jointData.errorCheckHasDifferenceFunction()
+
+    frameCount = jointData.getFrameCount()
+    costMatrix = np.empty((frameCount, frameCount))
+    progress = ins.Progress("getSelfSimilarityMatrix", frameCount * (frameCount + 1) // 2)
+
+    if hasattr(jointData, "getDifferenceMatrix"):
+        blockSize = max(1, 2 ** 18 // max(1, frameCount))
+        for blockStart in range(0, frameCount, blockSize):
+            blockEnd = min(blockStart + blockSize, frameCount)
+            # each block of rows is compared with the frames from its first row onwards
+            laterFrames = _getFrameRange(jointData, slice(blockStart, None))
+            costMatrix[blockStart:blockEnd, blockStart:] = jointData.getDifferenceMatrix(jointData.joints, laterFrames, slice(blockStart, blockEnd))
+            progress.update(blockEnd * frameCount - blockEnd * (blockEnd - 1) // 2)
+    else:
+        for f1 in range(frameCount):
+            for f2 in range(f1, frameCount):
+                costMatrix[f1, f2] = jointData.getDifferenceBetweenFrames(jointData.joints, f1, jointData, f2)
+            progress.update((f1 + 1) * frameCount - (f1 + 1) * f1 // 2)
+
+    # mirror the upper triangle, which includes the diagonal
+    lowerTriangle = np.tril_indices(frameCount, -1)
+    costMatrix[lowerTriangle] = costMatrix.transpose()[lowerTriangle]
 
-    print("\n")
     return costMatrix
 
+# returns a shallow copy of joint data or a feature stack holding a range of its frames
+def _getFrameRange(jointData, frames):
+
+    frameRange = copy.copy(jointData)
+    if hasattr(jointData, "features"):
+        frameRange.features = jointData.features[frames]
+    else:
+        frameRange.data = jointData.data[:, :, frames]
+
+    return frameRange
+
 class CorrelationMethod():
     Pearson = "Pearson"
     Spearmans = "Spearman"
@@ -8,8 +8,9 @@ motion.mapJoints("jointMap.csv")
 # Fill in missing keyframes
 motionDuration = motion.getTimeOfLastKey(fmt.joint.root, fmt.animationCurveType.ROTATION, fmt.axis.x)
 motion.makeJointsAnimatable(joints, fmt.animationCurveType.ROTATION)
-motion.unrollAllJoints()
-motion.resample(120, motionDuration)
+gapStatistics = motion.fillGaps(120, endTime=motionDuration)
+for joint in joints:
+    print(joint, gapStatistics[joint][fmt.animationCurveType.ROTATION]["missingFrames"], "missing frames")
 
 # Convert and extract joint data
 jointQ = motion.getJointRotationAsQuaternions(joints)
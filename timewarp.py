@@ -1,32 +1,22 @@
 import numpy as np
 import matplotlib.pyplot as plt
+import plottingTools as pt
+import instrumentation as ins
 
+@ins.timed("timewarp.accumulatedCostMatrix")
 def accumulatedCostMatrix(costMatrix):
 
+    # accumulated a row at a time, see accumulateCostRow(), as IncrementalTimewarp does
+    costMatrix = np.asarray(costMatrix, dtype=float)
     totalCostMatrix = np.empty(costMatrix.shape)
 
-    for targetFrame in range(totalCostMatrix.shape[1]):
-        for inputFrame in range(totalCostMatrix.shape[0]):
-            if(targetFrame == 0 and inputFrame == 0):
-                totalCostMatrix[0, 0] = costMatrix[0, 0]
-            else:
-                stepChoices = []
-                if inputFrame - 1 >= 0:
-                    stepChoices.append(
-                        costMatrix[inputFrame, targetFrame] + totalCostMatrix[inputFrame - 1, targetFrame])
-                if targetFrame - 1 >= 0:
-                    stepChoices.append(
-                        costMatrix[inputFrame, targetFrame] + totalCostMatrix[inputFrame, targetFrame - 1])
-                if inputFrame - 1 >= 0 and targetFrame - 1 >= 0:
-                    stepChoices.append(
-                        costMatrix[inputFrame, targetFrame] + totalCostMatrix[inputFrame - 1, targetFrame - 1])
-
-                stepChoices.sort()
-
-                totalCostMatrix[inputFrame, targetFrame] = stepChoices[0]
+    for inputFrame in range(costMatrix.shape[0]):
+        previousRow = totalCostMatrix[inputFrame - 1] if inputFrame > 0 else None
+        totalCostMatrix[inputFrame] = accumulateCostRow(costMatrix[inputFrame], previousRow)
 
     return totalCostMatrix
 
+@ins.timed("timewarp.plotDTW")
 def plotDTW(totalCostMatrix):
 
     # set initial search position to top right of cost matrix
@@ -71,22 +61,169 @@ def plotDTW(totalCostMatrix):
 
     return np.array(DTWmap)
 
-def graphDTW(costMatrix, **kwargs):
+# Returns the full alignment path through an accumulated cost matrix, as an array of (input frame, target frame)
+# pairs from (0, 0) to the last frame of both motions.  The path takes the same steps as plotDTW, but every frame of
+# both motions is included, so the path can be used to find every frame of one motion matched to each frame of the other.
+@ins.timed("timewarp.getDTWPath")
+def getDTWPath(totalCostMatrix):
+
+    inputFrame = totalCostMatrix.shape[0] - 1
+    targetFrame = totalCostMatrix.shape[1] - 1
+    path = [(inputFrame, targetFrame)]
+
+    while inputFrame > 0 or targetFrame > 0:
+        inputFrame, targetFrame = getPreviousDTWCell(totalCostMatrix, inputFrame, targetFrame)
+        path.append((inputFrame, targetFrame))
+
+    return np.array(path[::-1])
+
+# returns the cell before a cell of an alignment path, preferring a match, then whichever of the other steps is cheaper
+def getPreviousDTWCell(totalCostMatrix, inputFrame, targetFrame):
+
+    if inputFrame == 0:
+        return inputFrame, targetFrame - 1
+    if targetFrame == 0:
+        return inputFrame - 1, targetFrame
+
+    matchCost = totalCostMatrix[inputFrame - 1, targetFrame - 1]
+    deleteCost = totalCostMatrix[inputFrame - 1, targetFrame]
+    insertCost = totalCostMatrix[inputFrame, targetFrame - 1]
+    if matchCost <= deleteCost and matchCost <= insertCost:
+        return inputFrame - 1, targetFrame - 1
+    if deleteCost <= insertCost:
+        return inputFrame - 1, targetFrame
+    return inputFrame, targetFrame - 1
+
+# Converts an alignment path from getDTWPath into the DTW map returned by plotDTW for the same accumulated cost matrix.
+# Each target frame is mapped to the last input frame the path reaches on it, apart from the first target frame,
+# which is mapped to the first input frame the path reaches on it when the path is followed back from the end.
+def getDTWMapFromPath(path):
 
-    DTWmap = kwargs.get('DTWmap', np.array([]))
+    path = np.asarray(path)
+    DTWmap = np.full(path[-1, 1] + 1, path[-1, 0])
+    np.minimum.at(DTWmap, path[:, 1], path[:, 0])
+    DTWmap[0] = np.max(path[path[:, 1] == 0, 0])
+
+    return DTWmap
+
+# Accumulates one row of a cost matrix, given the accumulated row before it, or None for the first row.
+# The same as accumulatedCostMatrix, but as a whole row at once: the cost of arriving from the row before is found for
+# every cell, then steps along the row are found with a running minimum, as the lowest cost of reaching cell j along
+# the row is P[j] + min over k <= j of (S[k] - P[k]), where P is the cumulative sum of the costs of the row and S is the
+# cost of arriving at each cell from the row before.  As the steps of DTW are symmetric, a column can be accumulated
+# in the same way given the accumulated column before it.
+def accumulateCostRow(costRow, previousAccumulatedRow=None):
+
+    if previousAccumulatedRow is None:
+        return np.cumsum(costRow)
+
+    arrivalCosts = previousAccumulatedRow.copy()
+    arrivalCosts[1:] = np.minimum(previousAccumulatedRow[1:], previousAccumulatedRow[:-1])
+    arrivalCosts += costRow
+
+    rowCosts = np.cumsum(costRow)
+    relativeCosts = arrivalCosts - rowCosts
+    lowestCosts = np.minimum.accumulate(relativeCosts)
+    accumulatedRow = rowCosts + lowestCosts
+
+    # cells reached without a step along the row keep their exact arrival cost
+    arrived = relativeCosts <= lowestCosts
+    accumulatedRow[arrived] = arrivalCosts[arrived]
+
+    return accumulatedRow
+
+# Subsequence DTW, for finding where a short input motion occurs within a longer target motion.  The input motion must
+# be matched from its first to its last frame, but the match may start and end on any frame of the target motion.
+# Returns the cost of the best match ending on each target frame, and the target frame that match starts on.
+# Each input frame is accumulated as a whole row, as the horizontal steps within a row can be found with a running
+# minimum: D[i, j] = P[j] + min over k <= j of (S[k] - P[k]), where P is the cumulative sum of the costs of row i
+# and S is the cost of arriving at each cell of the row from the row before.
+@ins.timed("timewarp.subsequenceMatchCosts")
+def subsequenceMatchCosts(costMatrix):
+
+    costMatrix = np.asarray(costMatrix, dtype=float)
+    targetFrames = np.arange(costMatrix.shape[1])
+
+    # the first input frame can match any target frame, so every target frame is a possible start
+    accumulatedRow = costMatrix[0].copy()
+    startFrames = targetFrames.copy()
+
+    for inputFrame in range(1, costMatrix.shape[0]):
+
+        # arrive from the row before, by a vertical or diagonal step
+        arrivalCosts = accumulatedRow.copy()
+        arrivalStarts = startFrames.copy()
+        diagonal = accumulatedRow[:-1] < accumulatedRow[1:]
+        arrivalCosts[1:][diagonal] = accumulatedRow[:-1][diagonal]
+        arrivalStarts[1:][diagonal] = startFrames[:-1][diagonal]
+        arrivalCosts += costMatrix[inputFrame]
+
+        # then take any number of horizontal steps along the row
+        rowCosts = np.cumsum(costMatrix[inputFrame])
+        relativeCosts = arrivalCosts - rowCosts
+        lowestCosts = np.minimum.accumulate(relativeCosts)
+        lowestFrames = np.maximum.accumulate(np.where(relativeCosts <= lowestCosts, targetFrames, 0))
+
+        accumulatedRow = rowCosts + lowestCosts
+        startFrames = arrivalStarts[lowestFrames]
+
+    return accumulatedRow, startFrames
+
+# Finds the k lowest cost matches of a short input motion within a longer target motion, using subsequence DTW on
+# a cost matrix with input frames as rows and target frames as columns.  Matches don't overlap in the target motion.
+# Returns a list of (start frame, end frame, cost) tuples of target frames, lowest cost first.
+def findSubsequenceMatches(costMatrix, k=1):
+
+    matchCosts, startFrames = subsequenceMatchCosts(costMatrix)
+
+    matches = []
+    for endFrame in np.argsort(matchCosts, kind="stable"):
+        if len(matches) >= k:
+            break
+
+        startFrame = startFrames[endFrame]
+        if any([startFrame <= matchEnd and endFrame >= matchStart for matchStart, matchEnd, cost in matches]):
+            continue
+
+        matches.append((int(startFrame), int(endFrame), float(matchCosts[endFrame])))
+
+    return matches
+
+# smooths a DTW map with a moving average, returning a fractional frame map that can be applied with
+# FBXSequence.applyTimewarp().  The first and last frames are kept fixed so the warp still spans the whole motion.
+def smoothDTWmap(DTWmap, **kwargs):
+
+    windowSize = kwargs.get("windowSize", 5)
+
+    DTWmap = np.asarray(DTWmap, dtype=float)
+    if windowSize < 2 or DTWmap.shape[0] < 3:
+        return DTWmap
 
-    np_totalCostMatrix = np.array(costMatrix)
-    np_totalCostMatrix = np.transpose(costMatrix)
+    # pad the ends with the end values so the average isn't pulled towards zero
+    padBefore = windowSize // 2
+    padAfter = windowSize - 1 - padBefore
+    paddedMap = np.pad(DTWmap, (padBefore, padAfter), mode="edge")
+    smoothedMap = np.convolve(paddedMap, np.ones(windowSize) / windowSize, mode="valid")
+
+    smoothedMap[0] = DTWmap[0]
+    smoothedMap[-1] = DTWmap[-1]
+
+    return smoothedMap
 
-    ax = plt.gca()
-    ax.set_aspect("equal")
-    plt.pcolormesh(np_totalCostMatrix, rasterized=True)
+# Plots a heatmap of a cost matrix, optionally with a DTW map on top.  Matrices larger than the resolution are pooled
+# before they are drawn, see plottingTools.drawDTW().  Optional keyword arguments:
+#   DTWmap - DTW map drawn on top of the heatmap
+#   outputFile - if given, the plot is rendered to this file without opening a window, see plottingTools.renderDTW()
+#   resolution - largest number of cells drawn along each axis, default 1000
+#   reduction - how blocks of cells are pooled, "max" (default), "min" or "mean"
+def graphDTW(costMatrix, **kwargs):
 
-    if DTWmap.shape[0] > 0:
-        y = np.arange(0, np_totalCostMatrix.shape[0])
-        plt.plot(DTWmap, y, color='r')
+    outputFile = kwargs.get("outputFile")
+    plotArguments = {name: kwargs[name] for name in ["DTWmap", "resolution", "reduction"] if name in kwargs}
 
-    ax.set_xlabel("Input motion (frames)")
-    ax.set_ylabel("Target motion (frames)")
+    if outputFile is not None:
+        pt.renderDTW(costMatrix, outputFile, **plotArguments)
+        return
 
+    pt.drawDTW(plt.gca(), costMatrix, **plotArguments)
     plt.show()
\ No newline at end of file